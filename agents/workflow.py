@@ -4,7 +4,8 @@ from langgraph.graph import StateGraph, END
 from pydantic import BaseModel
 
 from core.engine import LLMEngine
-from core.vision import VisionClient
+from core.vision import VisionClient, PLACEHOLDER_IMAGE
+from core.imaging import get_image_processor
 from database.vector_store import VectorDB
 from agents.prompts import (
     CLEAN_PROMPT, 
@@ -27,9 +28,11 @@ class AgentState(TypedDict):
     vision_strategy: Optional[str]  # "ai_gen", "hybrid", "original", "text_only"
     custom_prompt: Optional[str]  # User's additional instructions
     output_options: Optional[list]  # List of enabled output options
+    structured_source: Optional[bool]  # raw_content is already clean markdown (layout-aware PDF extraction)
     critique_feedback: Optional[str]
     iteration_count: int
     glossary_terms: Optional[list]
+    degraded: Optional[list]  # Steps that fell back to a lesser result (see _degraded)
 
 class CriticResponse(BaseModel):
     approved: bool
@@ -38,15 +41,35 @@ class CriticResponse(BaseModel):
 class GlossaryResponse(BaseModel):
     terms: list[dict]
 
+def _degraded(state: AgentState, step: str) -> list:
+    """Record that `step` fell back, so the result isn't cached as a good conversion."""
+    return sorted(set(state.get("degraded") or []) | {step})
+
 # Nodes
+def _is_well_structured(content: str) -> bool:
+    """Markdown with headings and paragraphs, as emitted by layout-aware extraction."""
+    headings = re.findall(r'^#{1,4}\s+\S', content, flags=re.MULTILINE)
+    paragraphs = [p for p in content.split("\n\n") if p.strip()]
+    return len(headings) >= 2 and len(paragraphs) >= len(headings)
+
 def node_clean(state: AgentState):
     print("--- Node: Cleaning Content ---")
+    raw = state['raw_content']
+    # Layout-aware extraction already emits headings/lists/code and drops
+    # page headers and footers, so skip the LLM pass for such documents
+    if state.get("structured_source") and _is_well_structured(raw):
+        print("Source is already structured markdown; skipping LLM clean")
+        return {"cleaned_content": re.sub(r'\n{3,}', '\n\n', raw).strip(), "iteration_count": 0}
+    
     engine = LLMEngine()
     result = engine.generate_text(
         prompt=f"Clean this content:\n\n{state['raw_content']}",
         system_prompt=CLEAN_PROMPT,
         task_type="clean"  # Uses local LLM to save costs
     )
+    if engine.fallback_tasks:
+        # Local LLM unavailable: ran on the remote model instead
+        return {"cleaned_content": result, "iteration_count": 0, "degraded": _degraded(state, "routing")}
     return {"cleaned_content": result, "iteration_count": 0}
 
 def node_glossary(state: AgentState):
@@ -69,11 +92,13 @@ def node_glossary(state: AgentState):
         
         if terms:
             db.add_documents(documents=terms, metadatas=metadatas, ids=ids)
-            
+        
+        if engine.fallback_tasks:
+            return {"glossary_terms": response.terms, "degraded": _degraded(state, "routing")}
         return {"glossary_terms": response.terms}
     except Exception as e:
         print(f"Glossary Error: {e}")
-        return {"glossary_terms": []}
+        return {"glossary_terms": [], "degraded": _degraded(state, "glossary")}
 
 def node_rewrite(state: AgentState):
     print(f"--- Node: Rewriting ({state['style']}) ---")
@@ -86,22 +111,42 @@ def node_rewrite(state: AgentState):
     
     # Query RAG Knowledge Base for additional context
     rag_context = ""
+    degraded = state.get("degraded") or []
     try:
         from core.indexer import get_indexer
         indexer = get_indexer()
         
-        # Use first 500 chars of content as query
-        query_text = state['cleaned_content'][:500] if state.get('cleaned_content') else ""
-        if query_text:
-            rag_results = indexer.query_knowledge(query_text, n_results=3)
+        # Query with the opening of the content plus the opening of each
+        # major section, all in one batched round-trip
+        cleaned = state.get('cleaned_content') or ""
+        query_texts = []
+        if cleaned.strip():
+            query_texts.append(cleaned[:500])
+            for section in re.split(r'\n(?=#{1,2}\s)', cleaned)[1:4]:
+                if section.strip():
+                    query_texts.append(section.strip()[:500])
+        
+        if query_texts:
+            batched = indexer.query_knowledge_batch(query_texts, n_results=3)
+            
+            # Merge hits across queries, keeping the best score per chunk
+            best = {}
+            for hits in batched:
+                for hit in hits:
+                    key = hit.get('content', '')
+                    if key not in best or (hit.get('score') or 0) > (best[key].get('score') or 0):
+                        best[key] = hit
+            rag_results = sorted(best.values(), key=lambda h: h.get('score') or 0, reverse=True)[:3]
+            
             if rag_results:
                 rag_context = "\n\nRelevant Background Knowledge:\n"
                 for i, result in enumerate(rag_results):
                     content = result.get('content', '')[:500]  # Limit each result
-                    rag_context += f"[{i+1}] {content}...\n\n"
-                print(f"--- RAG Context: {len(rag_results)} relevant chunks found ---")
+                    rag_context += f"[{i+1}] (source: {result.get('source')}) {content}...\n\n"
+                print(f"--- RAG Context: {len(rag_results)} relevant chunks found ({len(query_texts)} queries) ---")
     except Exception as e:
         print(f"RAG query failed (non-critical): {e}")
+        degraded = _degraded(state, "rag")
     
     # Select appropriate prompt based on style
     style_prompts = {
@@ -246,7 +291,7 @@ def node_rewrite(state: AgentState):
             task_type="rewrite"  # Quality-critical: uses remote if available
         )
 
-    return {"rewritten_content": result, "iteration_count": state["iteration_count"] + 1}
+    return {"rewritten_content": result, "iteration_count": state["iteration_count"] + 1, "degraded": degraded}
 
 def node_critic(state: AgentState):
     print("--- Node: Critic ---")
@@ -279,25 +324,54 @@ def node_generate_images(state: AgentState):
     # Regex to find [[IMG_SUGGESTION: ...]]
     # Pattern: \[\[IMG_SUGGESTION:(.*?)\]\]
     matches = re.findall(r"\[\[IMG_SUGGESTION:(.*?)\]\]", content)
+    if not matches:
+        return {"rewritten_content": content}
+    
+    # Queue every suggestion at once so the image backend is never idle
+    prompts = [match.strip() for match in matches]
+    try:
+        images = vision.generate_images(prompts)
+    except Exception as e:
+        print(f"Image Gen failed: {e}")
+        return {"rewritten_content": content, "degraded": _degraded(state, "images")}
     
-    for i, match in enumerate(matches):
-        prompt = match.strip()
-        print(f"Generating image for: {prompt}")
+    # Downscale/recompress for embedding. Names are content-addressed (source
+    # bytes + settings): concurrent jobs can't overwrite each other's images,
+    # and images already processed are reused as-is
+    processor = get_image_processor()
+    style = state['style']
+    filenames = [processor.output_name(image_bytes, style) for image_bytes in images]
+    todo = []
+    for i, name in enumerate(filenames):
+        existing = processor.find_output("static", name)
+        if existing:
+            filenames[i] = existing
+        else:
+            todo.append(i)
+    for i, result in zip(todo, processor.process_many([images[i] for i in todo], style)):
+        if result["extension"] != processor.extension:
+            filenames[i] = f"{os.path.splitext(filenames[i])[0]}.{result['extension']}"
+        filepath = os.path.join("static", filenames[i])
         try:
-            image_bytes = vision.generate_image(prompt)
-            # Save to file
-            filename = f"image_{state['style']}_{i}.png"
-            filepath = os.path.join("static", filename)
-            with open(filepath, "wb") as f:
-                f.write(image_bytes)
-            
+            tmp_path = f"{filepath}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(result["data"])
+            os.replace(tmp_path, filepath)
+        except OSError as e:
+            print(f"Could not save image: {e}")
+    
+    degraded = state.get("degraded") or []
+    if any(image == PLACEHOLDER_IMAGE for image in images):
+        degraded = _degraded(state, "images")
+    for match, prompt, filename in zip(matches, prompts, filenames):
+        if os.path.exists(os.path.join("static", filename)):
             # Replace tag with Markdown image link
             # We assume static is accessible relative to where markdown is rendered or app root
             content = content.replace(f"[[IMG_SUGGESTION:{match}]]", f"![{prompt}](static/{filename})")
-        except Exception as e:
-            print(f"Image Gen failed: {e}")
+        else:
+            degraded = _degraded(state, "images")
             
-    return {"rewritten_content": content}
+    return {"rewritten_content": content, "degraded": degraded}
 
 # Conditional Logic
 def should_continue(state: AgentState):
@@ -4,6 +4,7 @@ import shutil
 from agents.workflow import app as workflow_app
 from core.ingestion import IngestionService
 from core.assembly import Assembler
+from core.results import get_result_cache, normalize_inputs
 
 @cl.on_chat_start
 async def start():
@@ -51,15 +52,23 @@ async def process_request(url: str, style: str):
         "glossary_terms": [],
         "cleaned_content": "",
         "rewritten_content": "",
-        "critique_feedback": ""
+        "critique_feedback": "",
+        "degraded": []
     }
     
-    # Run the graph
+    # Run the graph, unless the same inputs were converted before or are converting now
     # Note: app.invoke is synchronous. For async chainlit, ideally we run in executor or use async nodes.
     # We'll run sync for now as per LangGraph basic usage.
-    final_state = workflow_app.invoke(initial_state)
+    results = get_result_cache()
+    result_key = results.make_key(raw_content, normalize_inputs(style, "", "", []))
     
-    rewritten_text = final_state.get("rewritten_content")
+    def run_workflow():
+        final_state = workflow_app.invoke(initial_state)
+        return {"markdown": final_state.get("rewritten_content"), "style": style,
+                "degraded": final_state.get("degraded") or []}
+    
+    outcome, _ = results.run(result_key, run_workflow)
+    rewritten_text = outcome["markdown"]
     
     # 3. Assembly
     await cl.Message(content="Assembling PDF...").send()
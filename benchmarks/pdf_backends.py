@@ -0,0 +1,269 @@
+"""
+PDF backend benchmark.
+Runs every installed extraction backend over a local PDF corpus and
+reports time, peak memory and extracted-text quality per backend.
+With --write-profile the aggregated numbers are saved for
+core.pdf.select_backends, which uses them to pick the backend to try first.
+
+Usage:
+    python -m benchmarks.pdf_backends                      # static/tutorial_*.pdf
+    python -m benchmarks.pdf_backends ./document --repeat 3 --write-profile
+
+Quality is token F1 against a reference text when one sits next to the PDF
+(same name, .txt or .md); otherwise it is the agreement (token F1) with the
+other backends' output, so a backend that drops or garbles text scores low.
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import argparse
+import importlib
+import multiprocessing
+from collections import Counter
+from typing import Dict, List, Optional
+
+from core import pdf
+
+DEFAULT_CORPUS = "static/tutorial_*.pdf"
+
+
+def _measure(filepath: str, backend: str) -> Dict:
+    """
+    Extract one file with one backend. Runs in a fresh worker process so
+    peak RSS reflects this extraction alone.
+    """
+    import resource
+    module = dict(pdf.BACKENDS)[backend]
+    importlib.import_module(module)  # Exclude import cost from time and memory
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    pages = list(pdf.iter_pdf_pages(filepath, backend=backend, workers=1))
+    seconds = time.perf_counter() - started
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "seconds": seconds,
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        "peak_kb": (rss_after - rss_before) // (1024 if sys.platform == "darwin" else 1),
+        "pages": len(pages),
+        "empty_pages": sum(1 for p in pages if not p.strip()),
+        "text": "\n\n".join(pages),
+    }
+
+
+def _tokens(text: str) -> Counter:
+    return Counter(re.findall(r"\w+", text.lower()))
+
+
+def token_f1(candidate: Counter, reference: Counter) -> float:
+    """Bag-of-words F1 between two token multisets."""
+    if not candidate or not reference:
+        return 0.0
+    overlap = sum((candidate & reference).values())
+    if not overlap:
+        return 0.0
+    precision = overlap / sum(candidate.values())
+    recall = overlap / sum(reference.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def _garbage_ratio(text: str) -> float:
+    """Share of replacement/control characters (broken encodings, bad CMaps)."""
+    if not text:
+        return 0.0
+    bad = sum(1 for ch in text if ch == "�" or (ord(ch) < 32 and ch not in "\n\r\t\f"))
+    return bad / len(text)
+
+
+def _reference_text(filepath: str) -> Optional[str]:
+    stem = os.path.splitext(filepath)[0]
+    for ext in (".txt", ".md"):
+        if os.path.exists(stem + ext):
+            with open(stem + ext, "r", encoding="utf-8", errors="replace") as f:
+                return f.read()
+    return None
+
+
+def benchmark_file(filepath: str, backends: List[str], repeat: int = 1) -> Dict:
+    """Measure all backends on one file and score their output."""
+    ctx = multiprocessing.get_context("spawn")
+    runs: Dict[str, Dict] = {}
+    for backend in backends:
+        best = None
+        error = None
+        for _ in range(repeat):
+            with ctx.Pool(1) as worker:
+                try:
+                    result = worker.apply(_measure, (filepath, backend))
+                except Exception as e:
+                    error = str(e)
+                    break
+            if best is None or result["seconds"] < best["seconds"]:
+                best = result
+        runs[backend] = best if best is not None else {"error": error}
+
+    reference = _reference_text(filepath)
+    reference_tokens = _tokens(reference) if reference is not None else None
+    outputs = {name: _tokens(run["text"]) for name, run in runs.items() if "text" in run}
+
+    scored: Dict[str, Dict] = {}
+    for name, run in runs.items():
+        if "text" not in run:
+            scored[name] = {"error": run["error"], "quality": 0.0, "empty": True}
+            continue
+        tokens = outputs[name]
+        if reference_tokens is not None:
+            quality = token_f1(tokens, reference_tokens)
+        else:
+            others = [t for other, t in outputs.items() if other != name and t]
+            quality = (sum(token_f1(tokens, t) for t in others) / len(others)) if others else float(bool(tokens))
+        quality *= 1.0 - _garbage_ratio(run["text"])
+        scored[name] = {
+            "seconds": round(run["seconds"], 4),
+            "peak_kb": run["peak_kb"],
+            "pages": run["pages"],
+            "empty_pages": run["empty_pages"],
+            "chars": len(run["text"]),
+            "quality": round(quality, 4),
+            "empty": not run["text"].strip(),
+        }
+
+    features = pdf.pdf_features(filepath)
+    return {
+        "file": filepath,
+        "features": features,
+        "reference": reference is not None,
+        "backends": scored,
+    }
+
+
+def _aggregate(results: List[Dict]) -> Dict[str, Dict]:
+    """Per-backend totals over a set of file results."""
+    totals: Dict[str, Dict] = {}
+    for result in results:
+        # Only count "empty" against a backend when another one found text
+        someone_found_text = any(not r.get("empty") for r in result["backends"].values())
+        for name, r in result["backends"].items():
+            t = totals.setdefault(name, {"docs": 0, "pages": 0, "seconds": 0.0, "peak_kb": 0,
+                                         "quality": 0.0, "scored": 0, "empty": 0, "errors": 0})
+            t["docs"] += 1
+            if "error" in r:
+                t["errors"] += 1
+                t["empty"] += 1
+                t["scored"] += 1
+                continue
+            t["pages"] += r["pages"]
+            t["seconds"] += r["seconds"]
+            t["peak_kb"] = max(t["peak_kb"], r["peak_kb"])
+            # Documents without any text (scans) say nothing about quality
+            if someone_found_text:
+                t["quality"] += r["quality"]
+                t["scored"] += 1
+                if r["empty"]:
+                    t["empty"] += 1
+
+    summary = {}
+    for name, t in totals.items():
+        summary[name] = {
+            "docs": t["docs"],
+            "sec_per_page": round(t["seconds"] / t["pages"], 5) if t["pages"] else None,
+            "peak_kb": t["peak_kb"],
+            "quality": round(t["quality"] / t["scored"], 4) if t["scored"] else 0.0,
+            "empty_rate": round(t["empty"] / t["scored"], 4) if t["scored"] else 0.0,
+            "errors": t["errors"],
+        }
+    return summary
+
+
+def build_profile(results: List[Dict]) -> Dict:
+    """Profile consumed by core.pdf.select_backends."""
+    by_producer: Dict[str, List[Dict]] = {}
+    for result in results:
+        by_producer.setdefault(result["features"].get("producer", "unknown"), []).append(result)
+    return {
+        "version": 1,
+        "generated_at": time.time(),
+        "documents": len(results),
+        "backends": _aggregate(results),
+        "producers": {producer: _aggregate(group) for producer, group in by_producer.items()},
+    }
+
+
+def _is_pdf(filepath: str) -> bool:
+    try:
+        with open(filepath, "rb") as f:
+            return f.read(1024).lstrip().startswith(b"%PDF-")
+    except OSError:
+        return False
+
+
+def _collect(paths: List[str]) -> List[str]:
+    files: List[str] = []
+    for path in paths or [DEFAULT_CORPUS]:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, n) for n in names if n.lower().endswith(".pdf"))
+        else:
+            files.extend(glob.glob(path))
+
+    corpus = []
+    for filepath in sorted(set(files)):
+        # e.g. the HTML fallback written under a .pdf name when WeasyPrint is missing
+        if _is_pdf(filepath):
+            corpus.append(filepath)
+        else:
+            print(f"Skipping {filepath}: not a PDF")
+    return corpus
+
+
+def _print_table(summary: Dict[str, Dict]):
+    print(f"{'backend':<12}{'docs':>6}{'ms/page':>10}{'peak MB':>10}{'quality':>9}{'empty':>8}{'errors':>8}")
+    for name, s in sorted(summary.items(), key=lambda item: pdf._rank_key(item[1])):
+        ms = f"{s['sec_per_page'] * 1000:.2f}" if s["sec_per_page"] is not None else "-"
+        print(f"{name:<12}{s['docs']:>6}{ms:>10}{s['peak_kb'] / 1024:>10.1f}"
+              f"{s['quality']:>9.3f}{s['empty_rate']:>8.2f}{s['errors']:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark PDF extraction backends.")
+    parser.add_argument("paths", nargs="*", help=f"PDF files, folders or globs (default: {DEFAULT_CORPUS})")
+    parser.add_argument("--backends", help="Comma-separated subset of backends")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per file and backend (fastest kept)")
+    parser.add_argument("--json", help="Write per-file results here")
+    parser.add_argument("--write-profile", nargs="?", const=pdf.PROFILE_PATH, metavar="PATH",
+                        help=f"Save the selection profile (default: {pdf.PROFILE_PATH})")
+    args = parser.parse_args()
+
+    backends = pdf.available_backends()
+    if args.backends:
+        backends = [b for b in args.backends.split(",") if b in backends]
+    files = _collect(args.paths)
+    if not files or not backends:
+        parser.error("no PDFs found or no backends installed")
+
+    print(f"Benchmarking {len(backends)} backends on {len(files)} PDFs: {', '.join(backends)}")
+    results = []
+    for filepath in files:
+        result = benchmark_file(filepath, backends, repeat=args.repeat)
+        results.append(result)
+        line = ", ".join(
+            f"{name} {r['seconds'] * 1000:.0f}ms q={r['quality']:.2f}" if "error" not in r else f"{name} error"
+            for name, r in result["backends"].items()
+        )
+        print(f"  {os.path.basename(filepath)} ({result['features']['pages']}p, "
+              f"{result['features']['producer']}): {line}")
+
+    profile = build_profile(results)
+    print()
+    _print_table(profile["backends"])
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.write_profile:
+        os.makedirs(os.path.dirname(os.path.abspath(args.write_profile)), exist_ok=True)
+        with open(args.write_profile, "w", encoding="utf-8") as f:
+            json.dump(profile, f, indent=2)
+        print(f"\nProfile written to {args.write_profile}")
@@ -4,7 +4,12 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('convert/', views.convert, name='convert'),
+    path('outputs/<str:doc_id>/<str:fmt>/', views.download, name='download'),
     path('logs/', views.logs, name='logs'),
     path('api/settings/', views.save_settings, name='save_settings'),
     path('api/index/', views.index_documents, name='index_documents'),
+    path('api/index/status/', views.index_status, name='index_status'),
+    path('api/outputs/', views.outputs_index, name='outputs_index'),
+    path('api/render/<str:job_id>/', views.render_status, name='render_status'),
+    path('api/metrics/', views.metrics, name='metrics'),
 ]
@@ -12,7 +12,6 @@ logger = logging.getLogger(__name__)
 # Ensure project root is in python path
 from core.ingestion import IngestionService
 from agents.workflow import app as workflow_app
-from core.assembly import Assembler
 
 def index(request):
     return render(request, 'converter/index.html')
@@ -45,9 +44,13 @@ def convert(request):
         output_options = request.POST.getlist('output_options')  # Get list of checked options
         uploaded_file = request.FILES.get('file')
         
-        logger.info(f"Received conversion request - URL: {url}, Style: {style}, Vision: {vision_strategy}, Options: {output_options}, File: {uploaded_file}")
+        import uuid
+        request_id = uuid.uuid4().hex[:12]  # Recorded with the stored outputs
+        
+        logger.info(f"Received conversion request {request_id} - URL: {url}, Style: {style}, Vision: {vision_strategy}, Options: {output_options}, File: {uploaded_file}")
         
         # 1. Ingestion
+        structured = False  # Extraction already produced markdown structure
         try:
             ingestion = IngestionService()
             
@@ -56,9 +59,12 @@ def convert(request):
                 logger.info(f"Processing uploaded file: {uploaded_file.name}")
                 # Save to temp and parse
                 import tempfile
+                import hashlib
+                digest = hashlib.sha256()  # Parse cache key, computed while writing
                 with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp:
                     for chunk in uploaded_file.chunks():
                         tmp.write(chunk)
+                        digest.update(chunk)
                     tmp_path = tmp.name
                 
                 # Read content based on file type
@@ -69,8 +75,9 @@ def convert(request):
                 elif uploaded_file.name.endswith('.pdf'):
                     # Use ingestion service for PDF (has multiple fallback parsers)
                     logger.info(f"Parsing PDF from temp path: {tmp_path}")
-                    raw_content = ingestion.parse_url(tmp_path)
-                    logger.info(f"PDF extracted: {len(raw_content) if raw_content else 0} chars")
+                    parsed = ingestion.parse_document(tmp_path, digest=digest.hexdigest())
+                    raw_content, structured = parsed["content"], parsed["structured"]
+                    logger.info(f"PDF extracted with {parsed['parser']}: {len(raw_content) if raw_content else 0} chars")
                     if not raw_content or not raw_content.strip():
                         logger.error("PDF extraction returned empty content!")
                         return JsonResponse({'success': False, 'error': 'Could not extract text from PDF. The PDF may be image-only or corrupted.'}, status=400)
@@ -108,59 +115,63 @@ def convert(request):
             "vision_strategy": vision_strategy,
             "custom_prompt": custom_prompt,
             "output_options": output_options,  # List of enabled options
+            "structured_source": structured,
             "iteration_count": 0,
             "glossary_terms": [],
             "cleaned_content": "",
             "rewritten_content": "",
-            "critique_feedback": ""
+            "critique_feedback": "",
+            "degraded": []
         }
         
-        # Run Graph (Sync)
-        try:
+        # Run Graph (Sync), unless the same inputs were converted before or are converting now
+        from core.results import get_result_cache, normalize_inputs
+        results = get_result_cache()
+        result_key = results.make_key(raw_content, normalize_inputs(style, vision_strategy, custom_prompt, output_options),
+                                      structured)
+        
+        def run_workflow():
             logger.info("Starting Workflow Execution...")
             final_state = workflow_app.invoke(initial_state)
             logger.info("Workflow execution finished.")
-            rewritten_text = final_state.get("rewritten_content")
+            # Fallbacks taken (glossary, RAG, images) mark the result degraded: served, not cached
+            return {"markdown": final_state.get("rewritten_content"), "style": style,
+                    "degraded": final_state.get("degraded") or []}
+        
+        try:
+            outcome, cache_status = results.run(result_key, run_workflow, refresh=request.POST.get('refresh') == '1')
+            rewritten_text = outcome["markdown"]
+            if cache_status != "computed":
+                logger.info(f"Conversion result {cache_status} ({result_key[:12]}); workflow skipped.")
         except Exception as e:
              logger.error(f"Workflow failed: {e}", exc_info=True)
              if request.headers.get('x-requested-with') == 'XMLHttpRequest':
                  return JsonResponse({'success': False, 'error': f"Workflow failed: {e}"}, status=500)
              return render(request, 'converter/index.html', {'error': f"Workflow failed: {e}"})
 
-        # 3. Assembler
+        # 3. Assembly: store markdown + HTML now, derive PDF/EPUB/HTML files on download
         try:
-            logger.info("Starting PDF Assembly...")
-            assembler = Assembler()
-            html_content = assembler.render_html(rewritten_text, title="Converted Tutorial", style=style)
-            
-            # Save PDF to static or media? 
-            # Ideally Media, but for now we output to static or a temp folder.
-            # Let's use PRE-CONFIGURED 'output.pdf' in root for simplicity of existing code, 
-            # but for multi-user web app, this should be unique file in media.
-            
-            # Generate unique filename
-            import uuid
-            filename = f"tutorial_{uuid.uuid4().hex[:8]}.pdf"
-            output_path = os.path.join(settings.BASE_DIR, 'static', filename)
+            from core.outputs import get_output_store
+            store = get_output_store()
+            doc_id = store.save(rewritten_text, title="Converted Tutorial", style=style, job=request_id)
+            downloads = {fmt: f"/outputs/{doc_id}/{fmt}/" for fmt in store.available_formats()}
+            logger.info(f"Stored document {doc_id} (downloads: {', '.join(downloads)}).")
             
-            logger.info(f"Generating PDF at {output_path}...")
-            assembler.generate_pdf(html_content, output_path)
-            logger.info("PDF Generation successful.")
+            result = {
+                'success': True,
+                'document_id': doc_id,
+                'downloads': downloads,
+                # PDF is rendered when first downloaded; without WeasyPrint offer the HTML file
+                'pdf_url': downloads.get('pdf', downloads['html']),
+                'markdown_content': rewritten_text,
+                'cache': cache_status,  # hit, coalesced or computed
+                'degraded': outcome.get('degraded', [])
+            }
             
             # Check for AJAX
             if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-                return JsonResponse({
-                    'success': True,
-                    'pdf_url': f"/static/{filename}",
-                    'markdown_content': rewritten_text
-                })
-
-            context = {
-                'success': True,
-                'pdf_url': f"/static/{filename}",
-                'markdown_content': rewritten_text
-            }
-            return render(request, 'converter/result.html', context)
+                return JsonResponse(result)
+            return render(request, 'converter/result.html', result)
             
         except Exception as e:
             logger.error(f"Assembly failed: {e}", exc_info=True)
@@ -247,31 +258,207 @@ def save_settings(request):
 def index_documents(request):
     """
     API to trigger document indexing for the RAG knowledge base.
+    Indexing runs in the background; poll /api/index/status/ for progress.
     """
     if request.method == 'POST':
         try:
             import json
             data = json.loads(request.body) if request.body else {}
             rag_folder = data.get('rag_folder', os.getenv('RAG_FOLDER', './document/convertit/database'))
+            force_reindex = bool(data.get('force_reindex', False))
+            
+            from core.indexer import start_background_indexing
+            started, status = start_background_indexing(rag_folder=rag_folder, force_reindex=force_reindex)
+            
+            if status.get('conflict'):
+                return JsonResponse({
+                    'success': False,
+                    'error': f"Indexing of {status['rag_folder']} is already running.",
+                    'status': status
+                }, status=409)
             
             # Update environment variable
             os.environ['RAG_FOLDER'] = rag_folder
             
-            # Import and run indexer
-            from core.indexer import DocumentIndexer
-            indexer = DocumentIndexer(rag_folder=rag_folder)
-            stats = indexer.index_folder()
-            
-            logger.info(f"Document indexing complete: {stats}")
+            logger.info(f"Document indexing {'started' if started else 'already running'}: {rag_folder}")
             return JsonResponse({
                 'success': True,
-                'indexed': stats.get('indexed', 0),
-                'skipped': stats.get('skipped', 0),
-                'failed': stats.get('failed', 0)
-            })
+                'started': started,
+                'status': status
+            }, status=202)
             
         except Exception as e:
             logger.error(f"Indexing failed: {e}", exc_info=True)
             return JsonResponse({'success': False, 'error': str(e)}, status=500)
     
     return JsonResponse({'success': False, 'error': 'POST required'}, status=405)
+
+def index_status(request):
+    """
+    API to report progress of the background indexing job
+    (files done/remaining, errors, ETA) and query cache statistics.
+    """
+    from core.indexer import get_indexing_status, get_indexer
+    
+    status = get_indexing_status()
+    try:
+        status['query_cache'] = get_indexer().get_cache_stats()
+    except Exception as e:
+        logger.warning(f"Could not read query cache stats: {e}")
+    return JsonResponse({'success': True, 'status': status})
+
+def _file_chunks(path, start, length, chunk_size=64 * 1024):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(chunk_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+def _serve_output(request, path, etag, filename, content_type, root):
+    """
+    Serve a stored output with ETag/Last-Modified validation and byte ranges.
+    With OUTPUT_SENDFILE=x-accel-redirect (nginx, internal location
+    OUTPUT_ACCEL_PREFIX mapped to OUTPUT_FOLDER) or x-sendfile (Apache,
+    lighttpd) the web server sends the file and handles ranges itself.
+    """
+    import re
+    from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+    from django.utils.http import http_date, parse_etags, quote_etag
+    
+    size = os.path.getsize(path)
+    mtime = os.path.getmtime(path)
+    etag = quote_etag(etag or f"{int(mtime)}-{size}")
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(mtime),
+        # Outputs are content-addressed: a URL's bytes never change
+        'Cache-Control': 'private, max-age=31536000, immutable',
+        'Accept-Ranges': 'bytes',
+    }
+    
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+        response = HttpResponseNotModified()
+        for name, value in headers.items():
+            response[name] = value
+        return response
+    
+    sendfile = os.getenv('OUTPUT_SENDFILE', '').lower()
+    range_match = None
+    if_range = request.headers.get('If-Range')
+    if not sendfile and request.headers.get('Range') and (not if_range or if_range.strip() == etag):
+        range_match = re.match(r'^bytes=(\d*)-(\d*)$', request.headers['Range'].strip())
+    
+    if sendfile in ('x-accel-redirect', 'x-sendfile'):
+        response = HttpResponse(content_type=content_type)
+        if sendfile == 'x-accel-redirect':
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            response['X-Accel-Redirect'] = os.getenv('OUTPUT_ACCEL_PREFIX', '/protected-outputs').rstrip('/') + '/' + relative
+        else:
+            response['X-Sendfile'] = os.path.abspath(path)
+    elif range_match and (range_match.group(1) or range_match.group(2)):
+        first, last = range_match.groups()
+        if first:
+            start, end = int(first), min(int(last) if last else size - 1, size - 1)
+        else:
+            start, end = max(size - int(last), 0), size - 1
+        if start >= size or start > end:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+            return response
+        response = StreamingHttpResponse(_file_chunks(path, start, end - start + 1), status=206,
+                                         content_type=content_type)
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+def download(request, doc_id, fmt):
+    """
+    Serve a stored document as md, html, epub or pdf, generating the file on
+    first request. ?wait=0 answers 202 with a render job while a PDF renders.
+    """
+    from core.outputs import get_output_store, FormatUnavailable, FORMATS
+    from core.render import RenderQueueFull, RenderTimeout
+    
+    store = get_output_store()
+    wait = request.GET.get('wait', '1') != '0'
+    try:
+        output = store.ensure(doc_id, fmt, wait=wait)
+    except KeyError:
+        return JsonResponse({'success': False, 'error': 'Unknown or expired document, or unknown format.'}, status=404)
+    except FormatUnavailable as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=501)
+    except RenderQueueFull:
+        return JsonResponse({'success': False, 'error': 'Server busy rendering other PDFs, try again shortly.'}, status=503)
+    except RenderTimeout as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=504)
+    except Exception as e:
+        logger.error(f"Generating {fmt} for {doc_id} failed: {e}", exc_info=True)
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+    
+    if 'job_id' in output:
+        return JsonResponse({
+            'success': True,
+            'job_id': output['job_id'],
+            'status_url': f"/api/render/{output['job_id']}/"
+        }, status=202)
+    return _serve_output(request, output['path'], output['etag'], f"tutorial_{doc_id}.{fmt}",
+                         FORMATS[fmt], store.directory)
+
+def outputs_index(request):
+    """
+    API to list stored documents (job, style, size per format, created),
+    most recently used first, with store usage.
+    """
+    from core.outputs import get_output_store
+    
+    store = get_output_store()
+    return JsonResponse({'success': True, 'documents': store.index(), 'stats': store.stats()})
+
+def render_status(request, job_id):
+    """
+    API to poll a PDF render started by a download with ?wait=0.
+    """
+    from core.render import get_render_service
+    
+    job = get_render_service().status(job_id)
+    if job is None:
+        return JsonResponse({'success': False, 'error': 'Unknown render job.'}, status=404)
+    job.pop('path')  # Served through /outputs/, not by file path
+    return JsonResponse({'success': True, 'job': job})
+
+def metrics(request):
+    """
+    API to report outbound HTTP (connection reuse, retries) and cache statistics
+    (including the generated-image cache hit rate), image recompression savings,
+    PDF render times, page counts and queue state, generated download formats
+    and conversions served from the result cache or coalesced.
+    """
+    from core.transport import get_transport
+    from core import ingestion as ingestion_module
+    from core import vision as vision_module
+    
+    data = {'http': get_transport().stats()}
+    for name, cache in (('fetch_cache', ingestion_module._get_fetch_cache()),
+                        ('parse_cache', ingestion_module._get_parse_cache()),
+                        ('image_cache', vision_module._get_image_cache())):
+        if cache is not None:
+            data[name] = cache.stats()
+    from core.imaging import get_image_processor
+    data['image_processing'] = get_image_processor().stats()
+    from core.render import get_render_service
+    data['pdf_render'] = get_render_service().stats()
+    from core.outputs import get_output_store
+    data['outputs'] = get_output_store().stats()
+    from core.results import get_result_cache
+    data['result_cache'] = get_result_cache().stats()
+    return JsonResponse({'success': True, 'metrics': data})
@@ -1,5 +1,12 @@
+import io
 import os
-from jinja2 import Environment, FileSystemLoader
+import re
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+from jinja2 import Environment, FileSystemLoader, TemplateNotFound
+
+from core.cache import DiskCache
 
 try:
     from weasyprint import HTML, CSS
@@ -8,13 +15,143 @@ except Exception as e:
     print(f"WARNING: WeasyPrint not available ({e}). PDF generation disabled.")
     WEASY_AVAILABLE = False
 
+try:
+    from pypdf import PdfReader, PdfWriter
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+
+# Themes compiled when the render layer is first used
+THEMES = ("pro", "kids")
+# Markdown features used by rewritten tutorials (fenced code, tables, lists)
+MARKDOWN_EXTENSIONS = ["extra", "sane_lists"]
+
+# Section rendering: documents are split at level 1-2 headings, and sections
+# shorter than this are kept with the one before them
+SECTION_MIN_CHARS = int(os.getenv("PDF_SECTION_MIN_CHARS", "1500"))
+SECTION_HEADING_RE = re.compile(r"^#{1,2}\s")
+FENCE_RE = re.compile(r"^\s*(```|~~~)")
+# Reference-style link definitions ("[id]: url"), not footnotes ("[^id]: ...")
+LINK_REFERENCE_RE = re.compile(r"^ {0,3}\[[^\]^][^\]]*\]:\s+\S.*$", re.MULTILINE)
+
+# --- Process-wide render layer ---
+# Building a Jinja environment, a markdown converter or WeasyPrint's parsed
+# CSS/font configuration costs more than rendering a short document, so
+# each is created once and shared by every Assembler.
+
+_envs: Dict[str, Environment] = {}
+_weasy: Dict[str, Tuple[List, object]] = {}
+_render_lock = threading.Lock()
+_markdown_local = threading.local()
+
+
+def get_environment(template_dir: str) -> Environment:
+    """Shared Jinja environment for `template_dir`, with the themes precompiled."""
+    key = os.path.abspath(template_dir)
+    with _render_lock:
+        env = _envs.get(key)
+        if env is None:
+            # Templates ship with the code; skip the per-render mtime check
+            auto_reload = os.getenv("TEMPLATE_AUTO_RELOAD", "0") == "1"
+            env = Environment(loader=FileSystemLoader(template_dir), auto_reload=auto_reload)
+            for theme in THEMES:
+                try:
+                    env.get_template(f"theme_{theme}.html")
+                except TemplateNotFound:
+                    pass
+            _envs[key] = env
+        return env
+
+
+def render_markdown(text: str) -> str:
+    """Markdown to HTML with one reusable converter per thread."""
+    converter = getattr(_markdown_local, "converter", None)
+    if converter is None:
+        import markdown
+        converter = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+        _markdown_local.converter = converter
+    return converter.reset().convert(text)
+
+
+def _font_configuration():
+    try:
+        from weasyprint.text.fonts import FontConfiguration  # WeasyPrint >= 53
+    except ImportError:
+        from weasyprint.fonts import FontConfiguration
+    return FontConfiguration()
+
+
+def get_weasy_resources(template_dir: str) -> Tuple[List, Optional[object]]:
+    """Pre-parsed stylesheets and the font configuration for PDF rendering."""
+    if not WEASY_AVAILABLE:
+        return [], None
+    key = os.path.abspath(template_dir)
+    with _render_lock:
+        resources = _weasy.get(key)
+        if resources is None:
+            font_config = _font_configuration()
+            stylesheets = []
+            css_path = os.path.join(template_dir, "styles.css")
+            if os.path.exists(css_path):
+                stylesheets.append(CSS(filename=css_path, font_config=font_config))
+            resources = (stylesheets, font_config)
+            _weasy[key] = resources
+        return resources
+
+
+def split_sections(content: str, min_chars: int = SECTION_MIN_CHARS) -> List[str]:
+    """
+    Split markdown at level 1-2 headings outside code fences. Whether a short
+    section is joined to the previous one depends only on its own length, so
+    an edit changes the boundaries around that section and nowhere else.
+    """
+    sections: List[List[str]] = [[]]
+    in_fence = False
+    for line in content.splitlines(keepends=True):
+        if FENCE_RE.match(line):
+            in_fence = not in_fence
+        elif not in_fence and SECTION_HEADING_RE.match(line) and sections[-1]:
+            sections.append([])
+        sections[-1].append(line)
+
+    merged: List[str] = []
+    for text in ("".join(lines) for lines in sections if lines):
+        if merged and len(text) < min_chars:
+            merged[-1] += text
+        else:
+            merged.append(text)
+    if len(merged) > 1 and len(merged[0]) < min_chars:
+        # A short preamble stays on the first section's page
+        merged[1] = merged[0] + merged[1]
+        del merged[0]
+    return merged
+
+
+_section_cache: Optional[DiskCache] = None
+_section_cache_lock = threading.Lock()
+
+def _get_section_cache() -> Optional[DiskCache]:
+    """Rendered section PDFs, or None if disabled (PDF_SECTION_CACHE_MAX_MB=0)."""
+    global _section_cache
+    max_mb = float(os.getenv("PDF_SECTION_CACHE_MAX_MB", "512"))
+    if max_mb <= 0:
+        return None
+    with _section_cache_lock:
+        if _section_cache is None:
+            directory = os.getenv("PDF_SECTION_CACHE_DIR", "./cache/pdf_sections")
+            _section_cache = DiskCache(directory, max_bytes=int(max_mb * 1024 * 1024))
+        return _section_cache
+
+
 class Assembler:
     def __init__(self, template_dir: str = "templates"):
-        self.env = Environment(loader=FileSystemLoader(template_dir))
+        self.env = get_environment(template_dir)
+        self.template_dir = template_dir
 
-    def render_html(self, content: str, title: str, style: str = "pro") -> str:
+    def render_html(self, content: str, title: str, style: str = "pro", **context) -> str:
         """
         Renders content into HTML using the specified style template.
+        Extra context (e.g. continuation/has_more for sections) goes to the template.
         """
         template_name = f"theme_{style}.html"
         try:
@@ -23,30 +160,100 @@ class Assembler:
              print(f"Template {template_name} not found, falling back to base.")
              return f"<h1>{title}</h1><div class='content'>{content}</div>"
 
-        # Simple markdown to html conversion for the body content is needed if content is still markdown.
-        # But commonly we might want to use a markdown library here.
-        import markdown
-        html_content = markdown.markdown(content)
-        
+        html_content = render_markdown(content)
+
         return template.render(
             title=title,
             content=html_content,
-            style=style
+            style=style,
+            **context
         )
 
     def generate_pdf(self, html_content: str, output_path: str):
         """
         Converts HTML string to PDF file.
         """
+        return self.render_pdf(html_content, output_path)["path"]
+
+    def render_pdf(self, html_content: str, output_path: str) -> Dict:
+        """
+        Converts HTML string to PDF file and reports {'path', 'pages'}.
+        """
         if not WEASY_AVAILABLE:
             print("PDF Generation skipped (WeasyPrint missing). Creating placeholder.")
             # Create a dummy text file renamed as PDF so the link works
             with open(output_path, "w", encoding="utf-8") as f:
                 f.write(f"PDF Generation is disabled because WeasyPrint (GTK3) is missing.\n\nRaw Content:\n{html_content}")
-            return output_path
-            
-        HTML(string=html_content, base_url=".").write_pdf(output_path)
-        return output_path
+            return {"path": output_path, "pages": 0}
+
+        document = self._layout(html_content)
+        document.write_pdf(output_path)
+        return {"path": output_path, "pages": len(document.pages)}
+
+    def _layout(self, html_content: str):
+        # styles.css is linked relative to the template folder, which isn't
+        # the base URL here, so it is passed pre-parsed instead
+        stylesheets, font_config = get_weasy_resources(self.template_dir)
+        return HTML(string=html_content, base_url=".").render(
+            stylesheets=stylesheets, font_config=font_config)
+
+    def _template_version(self, style: str) -> str:
+        """Digest of everything besides the content that affects a section's layout."""
+        digest = hashlib.sha256(style.encode())
+        try:
+            import weasyprint
+            digest.update(weasyprint.__version__.encode())
+        except ImportError:
+            pass
+        for name in ("base.html", f"theme_{style}.html", "styles.css"):
+            try:
+                with open(os.path.join(self.template_dir, name), "rb") as f:
+                    digest.update(f.read())
+            except OSError:
+                digest.update(b"-")
+        return digest.hexdigest()
+
+    def render_sections_pdf(self, content: str, title: str, style: str, output_path: str) -> Dict:
+        """
+        Markdown to PDF one section at a time, reusing cached section PDFs.
+
+        Each level 1-2 section is rendered on its own (starting a new page)
+        and cached by its markdown, position flags and template version, so
+        re-rendering an edited document only lays out the changed sections
+        before merging. Reports {'path', 'pages', 'sections', 'reused'}.
+        Falls back to render_pdf for a single section or without WeasyPrint,
+        pypdf or the cache.
+        """
+        sections = split_sections(content)
+        cache = _get_section_cache()
+        if not (WEASY_AVAILABLE and PYPDF_AVAILABLE and cache is not None) or len(sections) < 2:
+            result = self.render_pdf(self.render_html(content, title=title, style=style), output_path)
+            result.update(sections=1, reused=0)
+            return result
+
+        # Reference-style links may be defined anywhere in the document
+        references = "\n\n" + "\n".join(LINK_REFERENCE_RE.findall(content)) + "\n"
+        version = self._template_version(style)
+        writer = PdfWriter()
+        reused = 0
+        for index, section in enumerate(sections):
+            first, last = index == 0, index == len(sections) - 1
+            key = DiskCache.make_key("pdf-section", version, title if first else None,
+                                     first, last, section, references)
+            data = cache.read(key, "pdf") if cache.get_meta(key) is not None else None
+            if data is None:
+                html = self.render_html(section + references, title=title, style=style,
+                                        continuation=not first, has_more=not last)
+                data = self._layout(html).write_pdf()
+                cache.put(key, {"pdf": data}, {"style": style, "chars": len(section)})
+            else:
+                reused += 1
+            writer.append(PdfReader(io.BytesIO(data)))
+
+        writer.add_metadata({"/Title": title})
+        with open(output_path, "wb") as f:
+            writer.write(f)
+        return {"path": output_path, "pages": len(writer.pages), "sections": len(sections), "reused": reused}
 
 if __name__ == "__main__":
     # Test
@@ -0,0 +1,257 @@
+"""
+Bulk Ingestion
+Fetches and parses many URLs (a list or a sitemap) concurrently, with
+per-host rate limits and politeness delays, and streams each result to
+the caller as soon as it completes.
+
+Usage:
+    python -m core.bulk --sitemap https://docs.example.com/sitemap.xml --index
+    python -m core.bulk --file urls.txt --out ./document/convertit/bulk
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+import argparse
+import hashlib
+import xml.etree.ElementTree as ET
+from typing import AsyncIterator, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+from core.ingestion import IngestionService
+from core.transport import get_transport
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = os.getenv("BULK_USER_AGENT", "ConvertItBot")
+
+
+def read_url_list(path: str) -> List[str]:
+    """Read URLs from a text file (one per line, '#' comments allowed)."""
+    urls = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                urls.append(line)
+    return urls
+
+
+def load_sitemap(url: str, max_urls: int = 10000, _depth: int = 0) -> List[str]:
+    """
+    Collect page URLs from a sitemap, following nested sitemap indexes.
+    """
+    resp = get_transport().get(url, timeout=15)
+    resp.raise_for_status()
+    root = ET.fromstring(resp.content)
+    # Ignore XML namespaces when matching tags
+    tag = lambda el: el.tag.rsplit("}", 1)[-1]
+
+    urls: List[str] = []
+    for entry in root:
+        loc = next((child.text.strip() for child in entry if tag(child) == "loc" and child.text), None)
+        if not loc:
+            continue
+        if tag(root) == "sitemapindex":
+            if _depth < 3:
+                urls.extend(load_sitemap(loc, max_urls - len(urls), _depth + 1))
+        else:
+            urls.append(loc)
+        if len(urls) >= max_urls:
+            break
+    return urls[:max_urls]
+
+
+class BulkIngestor:
+    """
+    Concurrent URL ingestion on top of IngestionService.
+
+    - At most `concurrency` URLs are processed at once overall, and at most
+      `per_host` against any single host.
+    - Requests to the same host start at least `delay` seconds apart, or
+      the robots.txt Crawl-delay if that is longer.
+    - URLs disallowed by robots.txt are reported as 'blocked' and not fetched.
+    """
+
+    def __init__(self, concurrency: int = 8, per_host: int = 2, delay: float = 1.0,
+                 respect_robots: bool = True, service: Optional[IngestionService] = None):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.delay = delay
+        self.respect_robots = respect_robots
+        self.service = service or IngestionService()
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._host_next_start: Dict[str, float] = {}
+        self._host_locks: Dict[str, asyncio.Lock] = {}
+        self._robots: Dict[str, Optional[RobotFileParser]] = {}
+        self._robots_locks: Dict[str, asyncio.Lock] = {}
+
+    async def _robots_for(self, url: str) -> Optional[RobotFileParser]:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        # One fetch per origin: concurrent callers wait for the first one
+        lock = self._robots_locks.setdefault(origin, asyncio.Lock())
+        async with lock:
+            if origin not in self._robots:
+                def fetch():
+                    try:
+                        resp = get_transport().get(f"{origin}/robots.txt", timeout=5, retries=0)
+                        if resp.status_code != 200:
+                            return None
+                        parser = RobotFileParser()
+                        parser.parse(resp.text.splitlines())
+                        return parser
+                    except Exception:
+                        return None
+                self._robots[origin] = await asyncio.to_thread(fetch)
+        return self._robots[origin]
+
+    async def _wait_turn(self, host: str, delay: float):
+        """Space out request starts to the same host."""
+        lock = self._host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            start_at = max(now, self._host_next_start.get(host, 0.0))
+            self._host_next_start[host] = start_at + delay
+        if start_at > now:
+            await asyncio.sleep(start_at - now)
+
+    async def _ingest_one(self, url: str, global_limit: asyncio.Semaphore) -> Dict:
+        host = urlsplit(url).netloc
+        result = {"url": url, "status": "failed", "chars": 0, "seconds": 0.0, "error": None, "content": None}
+
+        # The host slot covers the robots.txt check too, so a burst of URLs
+        # for one host doesn't become a burst of robots.txt requests
+        host_limit = self._host_limits.setdefault(host, asyncio.Semaphore(self.per_host))
+        async with host_limit:
+            delay = self.delay
+            if self.respect_robots:
+                robots = await self._robots_for(url)
+                if robots is not None:
+                    if not robots.can_fetch(USER_AGENT, url):
+                        result.update(status="blocked", error="disallowed by robots.txt")
+                        return result
+                    crawl_delay = robots.crawl_delay(USER_AGENT)
+                    if crawl_delay:
+                        delay = max(delay, float(crawl_delay))
+
+            # Wait out the host's delay before taking a global slot, so a
+            # slow-crawl host doesn't hold slots other hosts could use
+            await self._wait_turn(host, delay)
+            async with global_limit:
+                started = time.monotonic()
+                try:
+                    content = await asyncio.to_thread(self.service.parse_url, url)
+                    result.update(status="ok", content=content, chars=len(content))
+                except Exception as e:
+                    result["error"] = str(e)
+                result["seconds"] = round(time.monotonic() - started, 2)
+        return result
+
+    async def ingest(self, urls: List[str]) -> AsyncIterator[Dict]:
+        """
+        Yield one result dict per URL, in completion order:
+        {'url', 'status' ('ok'|'failed'|'blocked'), 'content', 'chars', 'seconds', 'error'}
+        """
+        global_limit = asyncio.Semaphore(self.concurrency)
+        seen = set()
+        tasks = []
+        for url in urls:
+            if url in seen:
+                continue
+            seen.add(url)
+            tasks.append(asyncio.create_task(self._ingest_one(url, global_limit)))
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def run(self, urls: List[str], on_result: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """
+        Ingest all URLs, passing each result to `on_result` as it completes.
+        Returns the status report (results without content).
+        """
+        report = []
+        async for result in self.ingest(urls):
+            if on_result is not None:
+                try:
+                    await asyncio.to_thread(on_result, result)
+                except Exception as e:
+                    logger.error(f"Result handler failed for {result['url']}: {e}")
+                    result.update(status="failed", error=f"handler: {e}")
+            logger.info(f"[{result['status']}] {result['url']} ({result['chars']} chars, {result['seconds']}s)")
+            report.append({k: v for k, v in result.items() if k != "content"})
+        return report
+
+
+def _output_filename(url: str) -> str:
+    """Readable, collision-free markdown filename for a URL."""
+    parts = urlsplit(url)
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", f"{parts.netloc}{parts.path}").strip("-")[:80] or "page"
+    return f"{slug}-{hashlib.md5(url.encode()).hexdigest()[:8]}.md"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch and parse many URLs concurrently.")
+    parser.add_argument("urls", nargs="*", help="URLs to ingest")
+    parser.add_argument("--file", help="Text file with one URL per line")
+    parser.add_argument("--sitemap", help="Sitemap (or sitemap index) URL")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--per-host", type=int, default=2)
+    parser.add_argument("--delay", type=float, default=1.0, help="Min seconds between requests to one host")
+    parser.add_argument("--ignore-robots", action="store_true")
+    parser.add_argument("--index", action="store_true", help="Index results into the RAG knowledge base")
+    parser.add_argument("--out", help="Write each page's markdown into this folder")
+    parser.add_argument("--report", help="Write the per-URL status report (JSON) here")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    urls = list(args.urls)
+    if args.file:
+        urls += read_url_list(args.file)
+    if args.sitemap:
+        urls += load_sitemap(args.sitemap)
+    if not urls:
+        parser.error("no URLs given")
+
+    indexer = None
+    if args.index:
+        from core.indexer import get_indexer
+        indexer = get_indexer()
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+
+    def handle(result: Dict):
+        if result["status"] != "ok":
+            return
+        if args.out:
+            with open(os.path.join(args.out, _output_filename(result["url"])), "w", encoding="utf-8") as f:
+                f.write(result["content"])
+        if indexer is not None:
+            outcome, error = indexer.index_text(result["content"], source=result["url"])
+            if outcome == "failed":
+                raise RuntimeError(error)
+
+    ingestor = BulkIngestor(
+        concurrency=args.concurrency,
+        per_host=args.per_host,
+        delay=args.delay,
+        respect_robots=not args.ignore_robots
+    )
+    report = asyncio.run(ingestor.run(urls, on_result=handle))
+    if indexer is not None:
+        indexer.save()
+
+    counts = {}
+    for entry in report:
+        counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+    print(f"Processed {len(report)} URLs: {counts}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
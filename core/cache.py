@@ -0,0 +1,406 @@
+"""
+In-process caching helpers shared by the core services.
+"""
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterator, Optional, Tuple
+
+try:
+    # Cross-process locks for files and directories shared by several workers
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Exclusive lock on `path` (created if missing), shared with other
+    processes. A no-op where fcntl is unavailable.
+    """
+    if not FCNTL_AVAILABLE:
+        yield
+        return
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with an optional per-entry time-to-live.
+    Tracks hits, misses and evictions so callers can report hit rates.
+    """
+
+    def __init__(self, max_size: int = 256, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for `key`, or `default` if missing/expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        """Store `value` under `key`, evicting the least recently used entries."""
+        if self.max_size <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all entries (statistics are kept)."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size and hit/miss counters."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class DiskCache:
+    """
+    Directory-backed cache of named byte blobs plus JSON metadata per key,
+    capped by total size with least-recently-used eviction.
+
+    Entries are written atomically (temp file + rename). Recency is tracked
+    through the metadata file's mtime so it survives restarts.
+
+    Several processes may share a directory: metadata updates and eviction
+    take a lock file, and the size accounting is rebuilt from the directory
+    before evicting and at least every `rescan_interval` seconds, so the
+    quota applies to the directory rather than to each process.
+    """
+
+    META_SUFFIX = ".json"
+    LOCK_NAME = ".lock"
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024,
+                 rescan_interval: float = 30.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rescan_interval = rescan_interval
+        self._lock = threading.Lock()
+        # key -> [total bytes, last access]
+        self._entries: Dict[str, list] = {}
+        self._total_bytes = 0
+        self._scanned_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._rescan()
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Digest arbitrary key parts into a stable hex key."""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2])
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self._entry_dir(key), key + self.META_SUFFIX)
+
+    def path(self, key: str, name: str) -> str:
+        """Filesystem path of blob `name` for `key` (may not exist)."""
+        return os.path.join(self._entry_dir(key), f"{key}.{name}")
+
+    def _locked(self):
+        """Exclusive lock on the cache directory, shared with other processes."""
+        return file_lock(os.path.join(self.directory, self.LOCK_NAME))
+
+    def _scan(self) -> Tuple[Dict[str, list], int]:
+        """Sizes and access times of all entries on disk, from stat() alone."""
+        sizes: Dict[str, int] = {}
+        accessed: Dict[str, float] = {}
+        try:
+            subdirs = [entry.path for entry in os.scandir(self.directory) if entry.is_dir()]
+        except OSError:
+            subdirs = []
+        for subdir in subdirs:
+            try:
+                files = list(os.scandir(subdir))
+            except OSError:
+                continue
+            for entry in files:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                if entry.name.endswith(self.META_SUFFIX):
+                    accessed[entry.name[:-len(self.META_SUFFIX)]] = st.st_mtime
+                else:
+                    key = entry.name.split(".", 1)[0]
+                    sizes[key] = sizes.get(key, 0) + st.st_size
+        # Blobs without metadata are still being written (or already deleted)
+        entries = {key: [sizes.get(key, 0), mtime] for key, mtime in accessed.items()}
+        return entries, sum(entry[0] for entry in entries.values())
+
+    def _rescan(self):
+        """Rebuild the size accounting from the directory (other processes write to it too)."""
+        entries, total = self._scan()
+        with self._lock:
+            self._entries, self._total_bytes = entries, total
+            self._scanned_at = time.monotonic()
+
+    def _write_atomic(self, path: str, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def get_meta(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the metadata for `key` and mark it as recently used."""
+        try:
+            with open(self._meta_path(key), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        self.touch(key)
+        with self._lock:
+            self.hits += 1
+        return meta
+
+    def read(self, key: str, name: str) -> Optional[bytes]:
+        """Return blob `name` for `key`, or None if it is gone."""
+        try:
+            with open(self.path(key, name), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, key: str, blobs: Dict[str, bytes], meta: Optional[Dict[str, Any]] = None):
+        """Store blobs and metadata under `key`, then evict down to the quota."""
+        os.makedirs(self._entry_dir(key), exist_ok=True)
+        meta = dict(meta or {})
+        meta["_blobs"] = sorted(blobs)
+        meta["_sizes"] = {name: len(data) for name, data in blobs.items()}
+        meta["_size"] = sum(meta["_sizes"].values())
+
+        for name, data in blobs.items():
+            self._write_atomic(self.path(key, name), data)
+        with self._locked():
+            self._write_atomic(self._meta_path(key), json.dumps(meta).encode("utf-8"))
+
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous:
+                self._total_bytes -= previous[0]
+            self._entries[key] = [meta["_size"], time.time()]
+            self._total_bytes += meta["_size"]
+        self._evict(keep=key)
+
+    def add_blob(self, key: str, name: str, data: Optional[bytes] = None,
+                 meta: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Add blob `name` to an existing entry, from `data` or from a file
+        already written at path(key, name); `meta` is merged into the entry's
+        metadata. Returns the new metadata, or None if the entry is gone.
+        """
+        if data is not None:
+            if key not in self:
+                return None
+            self._write_atomic(self.path(key, name), data)
+
+        with self._locked():
+            try:
+                with open(self._meta_path(key), "r", encoding="utf-8") as f:
+                    current = json.load(f)
+                blob_size = os.path.getsize(self.path(key, name))
+            except (OSError, ValueError):
+                current = None
+            if current is not None:
+                current.update(meta or {})
+                current["_blobs"] = sorted(set(current.get("_blobs", [])) | {name})
+                if "_sizes" in current:
+                    current["_sizes"][name] = blob_size
+                    current["_size"] = sum(current["_sizes"].values())
+                else:
+                    current["_size"] = int(current.get("_size", 0)) + blob_size
+                self._write_atomic(self._meta_path(key), json.dumps(current).encode("utf-8"))
+
+        if current is None:
+            if data is not None:
+                # Evicted while the blob was being written
+                try:
+                    os.unlink(self.path(key, name))
+                except OSError:
+                    pass
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                self._total_bytes += current["_size"] - entry[0]
+                entry[0] = current["_size"]
+                entry[1] = time.time()
+            else:
+                self._entries[key] = [current["_size"], time.time()]
+                self._total_bytes += current["_size"]
+        self._evict(keep=key)
+        return current
+
+    def update_meta(self, key: str, **changes: Any) -> Optional[Dict[str, Any]]:
+        """Merge `changes` into the stored metadata of an existing entry."""
+        with self._locked():
+            try:
+                with open(self._meta_path(key), "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                return None
+            meta.update(changes)
+            self._write_atomic(self._meta_path(key), json.dumps(meta).encode("utf-8"))
+        self.touch(key)
+        return meta
+
+    def touch(self, key: str):
+        """Mark `key` as recently used."""
+        now = time.time()
+        try:
+            os.utime(self._meta_path(key), (now, now))
+        except OSError:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries[key][1] = now
+
+    def delete(self, key: str):
+        """Remove an entry and its blobs."""
+        with self._locked():
+            self._delete_files(key)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry:
+                self._total_bytes -= entry[0]
+
+    def _delete_files(self, key: str):
+        meta_path = self._meta_path(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                names = json.load(f).get("_blobs", [])
+        except (OSError, ValueError):
+            names = []
+        # Metadata first, so a concurrent add_blob sees the entry as gone
+        try:
+            os.unlink(meta_path)
+        except OSError:
+            pass
+        for name in names:
+            try:
+                os.unlink(self.path(key, name))
+            except OSError:
+                pass
+
+    def _evict(self, keep: Optional[str] = None):
+        """
+        Drop least recently used entries until under `max_bytes`. The
+        directory is rescanned first, so entries written by other
+        processes count towards the quota.
+        """
+        with self._lock:
+            over = self._total_bytes > self.max_bytes
+            stale = time.monotonic() - self._scanned_at >= self.rescan_interval
+        if not over and not stale:
+            return
+        with self._locked():
+            self._rescan()
+            while True:
+                with self._lock:
+                    if self._total_bytes <= self.max_bytes:
+                        return
+                    candidates = [(entry[1], key) for key, entry in self._entries.items() if key != keep]
+                    if not candidates:
+                        return
+                    _, victim = min(candidates)
+                    self.evictions += 1
+                    self._total_bytes -= self._entries.pop(victim)[0]
+                self._delete_files(victim)
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._meta_path(key))
+
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        """Metadata of all entries, most recently used first (without touching them)."""
+        with self._lock:
+            keys = [key for key, _ in sorted(self._entries.items(), key=lambda item: -item[1][1])]
+        listing = {}
+        for key in keys:
+            try:
+                with open(self._meta_path(key), "r", encoding="utf-8") as f:
+                    listing[key] = json.load(f)
+            except (OSError, ValueError):
+                continue
+        return listing
+
+    def stats(self) -> Dict[str, Any]:
+        """Return entry count, byte usage and hit/miss counters."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,355 @@
+"""
+ComfyUI client.
+Queues workflows with POST /prompt, tracks completion over the websocket
+(when websocket-client is installed) or by polling /history, and downloads
+outputs from /view. Several workflows are queued at once so ComfyUI moves
+straight from one to the next while earlier results are downloaded, and
+compatible workflows can be merged into one submission.
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+
+from core.transport import get_transport
+
+try:
+    import websocket  # websocket-client
+    WEBSOCKET_AVAILABLE = True
+except ImportError:
+    WEBSOCKET_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Node ids in the default text-to-image graph
+SAVE_NODE = "9"
+
+
+class ComfyUIError(RuntimeError):
+    """ComfyUI rejected a workflow or failed while running it."""
+
+
+def default_seed(prompt: str) -> int:
+    """Stable seed per prompt, so the same prompt reproduces the same image."""
+    return int.from_bytes(hashlib.sha256(prompt.encode("utf-8")).digest()[:6], "big")
+
+
+def build_workflow(prompt: str, negative: str = "text, watermark", seed: Optional[int] = None,
+                   width: int = 1024, height: int = 1024, steps: int = 20, cfg: float = 8.0,
+                   checkpoint: Optional[str] = None, batch_size: int = 1,
+                   filename_prefix: str = "convertit") -> Dict:
+    """Minimal text-to-image graph in ComfyUI's API format."""
+    return {
+        "3": {
+            "inputs": {
+                "seed": default_seed(prompt) if seed is None else seed,
+                "steps": steps,
+                "cfg": cfg,
+                "sampler_name": "euler",
+                "scheduler": "normal",
+                "denoise": 1,
+                "model": ["4", 0],
+                "positive": ["6", 0],
+                "negative": ["7", 0],
+                "latent_image": ["5", 0]
+            },
+            "class_type": "KSampler"
+        },
+        "4": {
+            "inputs": {"ckpt_name": checkpoint or os.getenv("COMFYUI_CHECKPOINT", "flux1-schnell.safetensors")},
+            "class_type": "CheckpointLoaderSimple"
+        },
+        "6": {
+            "inputs": {"text": prompt, "clip": ["4", 1]},
+            "class_type": "CLIPTextEncode"
+        },
+        "7": {
+            "inputs": {"text": negative, "clip": ["4", 1]},
+            "class_type": "CLIPTextEncode"
+        },
+        "5": {
+            "inputs": {"width": width, "height": height, "batch_size": batch_size},
+            "class_type": "EmptyLatentImage"
+        },
+        "8": {
+            "inputs": {"samples": ["3", 0], "vae": ["4", 2]},
+            "class_type": "VAEDecode"
+        },
+        SAVE_NODE: {
+            "inputs": {"filename_prefix": filename_prefix, "images": ["8", 0]},
+            "class_type": "SaveImage"
+        }
+    }
+
+
+def merge_workflows(workflows: List[Dict], output_node: str = SAVE_NODE) -> Tuple[Dict, List[str]]:
+    """
+    Combine several workflows into one graph for a single queue entry.
+
+    Nodes with the same class and (resolved) inputs are shared, so the
+    checkpoint loader and common conditioning appear once while each
+    workflow keeps its own prompt, sampler and save branch. Returns the
+    merged graph and, per workflow, the id of its `output_node`.
+    """
+    merged: Dict[str, Dict] = {}
+    by_signature: Dict[str, str] = {}
+
+    def resolve(workflow: Dict, node_id: str, memo: Dict[str, str]) -> str:
+        if node_id in memo:
+            return memo[node_id]
+        node = workflow[node_id]
+        inputs = {}
+        for name, value in node["inputs"].items():
+            is_link = isinstance(value, list) and len(value) == 2 and isinstance(value[0], str) and value[0] in workflow
+            inputs[name] = [resolve(workflow, value[0], memo), value[1]] if is_link else value
+        signature = json.dumps([node["class_type"], inputs], sort_keys=True)
+        if signature not in by_signature:
+            new_id = str(len(merged) + 1)
+            merged[new_id] = {"inputs": inputs, "class_type": node["class_type"]}
+            by_signature[signature] = new_id
+        memo[node_id] = by_signature[signature]
+        return memo[node_id]
+
+    output_ids = []
+    for workflow in workflows:
+        memo: Dict[str, str] = {}
+        for node_id in workflow:
+            resolve(workflow, node_id, memo)
+        output_ids.append(memo[output_node])
+    return merged, output_ids
+
+
+class ComfyUIClient:
+    """
+    Client for one ComfyUI server.
+
+    `run()` queues a list of workflows and returns their images in order.
+    Each workflow gets `timeout` seconds, counted from submission and
+    stacked behind the ones queued before it. On timeout, error or
+    interruption, the client's unfinished prompts are removed from the
+    queue (and interrupted if already running).
+    """
+
+    def __init__(self, base_url: Optional[str] = None, timeout: Optional[float] = None,
+                 poll_interval: Optional[float] = None):
+        self.base_url = (base_url or os.getenv("COMFYUI_BASE_URL", "http://localhost:8188")).rstrip("/")
+        self.timeout = timeout or float(os.getenv("COMFYUI_TIMEOUT", "300"))
+        self.poll_interval = poll_interval or float(os.getenv("COMFYUI_POLL_INTERVAL", "1.0"))
+        self.client_id = uuid.uuid4().hex
+        self.http = get_transport()
+
+        self._lock = threading.Lock()
+        # prompt_id -> set when the websocket reports the prompt finished
+        self._done: Dict[str, threading.Event] = {}
+        self._ws = None
+        self._ws_attempted = False
+
+    # --- Websocket completion events ---
+
+    def _ensure_listener(self):
+        """Connect the websocket once; polling covers everything if it fails."""
+        with self._lock:
+            if not WEBSOCKET_AVAILABLE or self._ws_attempted:
+                return
+            self._ws_attempted = True
+        parts = urlsplit(self.base_url)
+        scheme = "wss" if parts.scheme == "https" else "ws"
+        try:
+            self._ws = websocket.create_connection(
+                f"{scheme}://{parts.netloc}/ws?clientId={self.client_id}", timeout=5)
+        except Exception as e:
+            logger.info(f"ComfyUI websocket unavailable ({e}); polling /history instead")
+            return
+        threading.Thread(target=self._listen, name="comfyui-ws", daemon=True).start()
+
+    def _listen(self):
+        ws = self._ws
+        ws.settimeout(None)
+        while True:
+            try:
+                message = ws.recv()
+            except Exception:
+                break
+            if not isinstance(message, str):
+                continue  # Binary preview frames
+            try:
+                event = json.loads(message)
+            except ValueError:
+                continue
+            kind = event.get("type")
+            data = event.get("data") or {}
+            prompt_id = data.get("prompt_id")
+            finished = kind in ("execution_success", "execution_error", "execution_interrupted") or (
+                kind == "executing" and data.get("node") is None)
+            if finished and prompt_id:
+                with self._lock:
+                    self._done.setdefault(prompt_id, threading.Event()).set()
+        self._ws = None
+
+    def close(self):
+        ws, self._ws = self._ws, None
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+    # --- HTTP API ---
+
+    def submit(self, workflow: Dict) -> str:
+        """Queue a workflow and return its prompt id."""
+        self._ensure_listener()
+        try:
+            # Not retried: a repeated POST would queue the workflow twice
+            response = self.http.post(f"{self.base_url}/prompt",
+                                      json={"prompt": workflow, "client_id": self.client_id},
+                                      timeout=30, retries=0)
+        except requests.exceptions.ConnectionError as e:
+            raise ConnectionError("ComfyUI not reachable") from e
+        if response.status_code != 200:
+            raise ComfyUIError(f"ComfyUI rejected the workflow ({response.status_code}): {response.text[:500]}")
+        data = response.json()
+        if data.get("node_errors"):
+            raise ComfyUIError(f"ComfyUI node errors: {json.dumps(data['node_errors'])[:500]}")
+        prompt_id = data["prompt_id"]
+        with self._lock:
+            self._done.setdefault(prompt_id, threading.Event())
+        return prompt_id
+
+    def history(self, prompt_id: str) -> Optional[Dict]:
+        """History entry for a prompt, or None while it is queued/running."""
+        response = self.http.get(f"{self.base_url}/history/{prompt_id}", timeout=10)
+        response.raise_for_status()
+        return response.json().get(prompt_id)
+
+    def wait(self, prompt_id: str, deadline: float) -> Dict:
+        """Block until the prompt finishes (monotonic `deadline`); return its history entry."""
+        interval = min(0.25, self.poll_interval)
+        while True:
+            entry = self.history(prompt_id)
+            if entry is not None:
+                status = entry.get("status") or {}
+                if status.get("status_str") == "error":
+                    raise ComfyUIError(f"ComfyUI execution failed: {_error_message(status)}")
+                return entry
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"ComfyUI prompt {prompt_id} timed out")
+            with self._lock:
+                event = self._done.get(prompt_id)
+            if self._ws is not None and event is not None and not event.is_set():
+                # Completion is pushed; poll only as a safety net
+                event.wait(min(remaining, self.poll_interval * 10))
+            else:
+                # Also when the push arrived before /history has the entry
+                time.sleep(min(remaining, interval))
+                interval = min(interval * 2, self.poll_interval)
+
+    def download(self, image: Dict) -> bytes:
+        """Fetch one output image described by a history entry."""
+        response = self.http.get(f"{self.base_url}/view", params={
+            "filename": image["filename"],
+            "subfolder": image.get("subfolder", ""),
+            "type": image.get("type", "output"),
+        }, timeout=60)
+        response.raise_for_status()
+        return response.content
+
+    def images_for(self, entry: Dict, node_id: str = SAVE_NODE) -> List[bytes]:
+        """Download the images a finished prompt saved from `node_id`."""
+        outputs = entry.get("outputs") or {}
+        return [self.download(image) for image in (outputs.get(node_id) or {}).get("images", [])]
+
+    def cancel(self, prompt_ids: List[str]):
+        """Drop queued prompts and interrupt the running one if it is ours."""
+        if not prompt_ids:
+            return
+        try:
+            self.http.post(f"{self.base_url}/queue", json={"delete": prompt_ids}, timeout=10, retries=0)
+            queue = self.http.get(f"{self.base_url}/queue", timeout=10).json()
+            running = {item[1] for item in queue.get("queue_running", []) if len(item) > 1}
+            if running & set(prompt_ids):
+                self.http.post(f"{self.base_url}/interrupt", timeout=10, retries=0)
+        except Exception as e:
+            logger.warning(f"Could not cancel ComfyUI prompts {prompt_ids}: {e}")
+
+    def run(self, workflows: List[Dict], timeout: Optional[float] = None,
+            outputs: Optional[List[List[str]]] = None) -> List[Dict]:
+        """
+        Queue all workflows, then collect them in order.
+
+        `outputs` lists, per workflow, the save nodes to collect (default:
+        the single SAVE_NODE). Returns one {'prompt_id', 'images', 'outputs',
+        'error'} per workflow, where 'outputs' holds the images of each
+        listed node and 'images' all of them in that order. A workflow
+        ComfyUI rejects or fails is reported there. Timeouts and lost
+        connections cancel the remaining prompts and raise.
+        """
+        timeout = timeout or self.timeout
+        outputs = outputs or [[SAVE_NODE]] * len(workflows)
+        started = time.monotonic()
+        submitted: List[Union[str, Exception]] = []
+        pending: List[str] = []
+        try:
+            for workflow in workflows:
+                try:
+                    prompt_id = self.submit(workflow)
+                    submitted.append(prompt_id)
+                    pending.append(prompt_id)
+                except ComfyUIError as e:
+                    submitted.append(e)
+
+            results = []
+            budget = 0.0
+            for item, node_ids in zip(submitted, outputs):
+                # Each image gets `timeout`, stacked behind everything queued before it
+                budget += timeout * len(node_ids)
+                if isinstance(item, Exception):
+                    results.append({"prompt_id": None, "images": [], "outputs": [], "error": str(item)})
+                    continue
+                try:
+                    entry = self.wait(item, started + budget)
+                    per_node = [self.images_for(entry, node_id) for node_id in node_ids]
+                    results.append({"prompt_id": item, "images": [img for imgs in per_node for img in imgs],
+                                    "outputs": per_node, "error": None})
+                except ComfyUIError as e:
+                    results.append({"prompt_id": item, "images": [], "outputs": [], "error": str(e)})
+                pending.remove(item)
+            return results
+        except BaseException:
+            self.cancel(pending)
+            raise
+        finally:
+            with self._lock:
+                for item in submitted:
+                    if isinstance(item, str):
+                        self._done.pop(item, None)
+
+
+def _error_message(status: Dict) -> str:
+    for kind, data in status.get("messages", []):
+        if kind == "execution_error":
+            return f"{data.get('node_type')}: {data.get('exception_message', '').strip()}"
+    return "unknown error"
+
+
+_client: Optional[ComfyUIClient] = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+
+def get_comfy_client() -> ComfyUIClient:
+    """Process-wide client, so the websocket connection is shared."""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = ComfyUIClient()
+            _client_pid = os.getpid()
+        return _client
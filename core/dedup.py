@@ -0,0 +1,111 @@
+"""
+Near-duplicate detection for text chunks using SimHash signatures.
+"""
+import re
+import hashlib
+from typing import Dict, Iterable, List, Optional, Set
+
+SIMHASH_BITS = 64
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """
+    Compute a 64-bit SimHash over word shingles of `text`.
+    Texts that differ only by a few words get signatures a few bits apart.
+    """
+    tokens = _TOKEN_RE.findall(text.lower())
+    if not tokens:
+        return 0
+
+    if len(tokens) < shingle_size:
+        shingles = [" ".join(tokens)]
+    else:
+        shingles = [" ".join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)]
+
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+
+    signature = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            signature |= 1 << bit
+    return signature
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two signatures."""
+    return bin(a ^ b).count("1")
+
+
+def to_hex(signature: int) -> str:
+    return f"{signature:016x}"
+
+
+def from_hex(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value, 16) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+class SimHashIndex:
+    """
+    Finds stored signatures within a small Hamming distance of a query.
+
+    The signature is split into `max_distance + 1` bands; by pigeonhole,
+    two signatures within `max_distance` bits share at least one band
+    exactly, so only keys in matching band buckets need checking.
+    """
+
+    def __init__(self, max_distance: int = 4):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = -(-SIMHASH_BITS // self.bands)  # ceil division
+        self._signatures: Dict[str, int] = {}
+        self._buckets: List[Dict[int, Set[str]]] = [{} for _ in range(self.bands)]
+
+    def _band_values(self, signature: int) -> Iterable[int]:
+        mask = (1 << self.band_bits) - 1
+        for band in range(self.bands):
+            yield (signature >> (band * self.band_bits)) & mask
+
+    def add(self, key: str, signature: int):
+        self.remove(key)
+        self._signatures[key] = signature
+        for band, value in enumerate(self._band_values(signature)):
+            self._buckets[band].setdefault(value, set()).add(key)
+
+    def remove(self, key: str):
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for band, value in enumerate(self._band_values(signature)):
+            bucket = self._buckets[band].get(value)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][value]
+
+    def find(self, signature: int) -> Optional[str]:
+        """Return the key of the closest stored near-duplicate, if any."""
+        best_key, best_distance = None, self.max_distance + 1
+        seen: Set[str] = set()
+        for band, value in enumerate(self._band_values(signature)):
+            for key in self._buckets[band].get(value, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                distance = hamming_distance(signature, self._signatures[key])
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+        return best_key
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._signatures
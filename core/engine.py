@@ -11,6 +11,10 @@ class LLMEngine:
         self.provider = os.getenv("LLM_PROVIDER", "local")
         self.ollama_base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
         self.remote_api_key = os.getenv("OPENAI_API_KEY")
+        self.local_model = f"ollama/{os.getenv('OLLAMA_MODEL', 'llama3.1:8b')}"
+        self.remote_model = os.getenv("REMOTE_MODEL", "gpt-4o")
+        # Tasks meant for the local model that ran on the remote one instead
+        self.fallback_tasks = set()
         
         # Configure LiteLLM
         if self.provider == "local":
@@ -22,9 +26,9 @@ class LLMEngine:
     def get_model_name(self) -> str:
         """Returns the default model string based on provider."""
         if self.provider == "local":
-            return "ollama/llama3.1:8b" # Updated to match installed model
+            return self.local_model
         else:
-            return "gpt-4o" # Default remote model
+            return self.remote_model
     
     def get_model_for_task(self, task_type: str = "default") -> tuple[str, str, str]:
         """
@@ -42,23 +46,25 @@ class LLMEngine:
         
         # If using local provider, always use local
         if self.provider == "local":
-            return ("ollama/llama3.1:8b", self.ollama_base_url, None)
+            return (self.local_model, self.ollama_base_url, None)
         
         # For remote provider: route simple tasks to local if available
         if task_type in SIMPLE_TASKS:
             # Try to use local for simple tasks to save API costs
             # Check if Ollama is available
             try:
-                import requests
-                resp = requests.get(f"{self.ollama_base_url}/api/tags", timeout=2)
+                from core.transport import get_transport
+                # Quick probe: no retries, the remote model is the fallback
+                resp = get_transport().get(f"{self.ollama_base_url}/api/tags", timeout=2, retries=0)
                 if resp.status_code == 200:
                     print(f"--- Using local LLM for '{task_type}' to save API costs ---")
-                    return ("ollama/llama3.1:8b", self.ollama_base_url, None)
+                    return (self.local_model, self.ollama_base_url, None)
             except:
                 pass  # Ollama not available, use remote
+            self.fallback_tasks.add(task_type)
         
         # Quality-critical tasks or fallback: use remote
-        return ("gpt-4o", None, self.remote_api_key)
+        return (self.remote_model, None, self.remote_api_key)
 
     def generate_text(self, prompt: str, system_prompt: str = "You are a helpful assistant.", task_type: str = "default") -> str:
         """
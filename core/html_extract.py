@@ -0,0 +1,281 @@
+"""
+Main-content extraction from HTML.
+An incremental parser turns a page into markdown blocks (headings, lists,
+code, paragraphs), scores block containers by text density and keeps
+the best container's whole subtree, without building a DOM.
+"""
+import re
+from html.parser import HTMLParser
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Subtrees that are never content
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "form",
+             "nav", "aside", "footer", "button", "select", "canvas"}
+# Containers whose text is grouped and scored together
+CONTAINER_TAGS = {"article", "main", "section", "div", "td", "body", "blockquote"}
+BLOCK_TAGS = {"p", "h1", "h2", "h3", "h4", "h5", "h6", "li", "pre", "blockquote",
+              "dt", "dd", "figcaption", "tr"}
+VOID_TAGS = {"br", "img", "hr", "meta", "link", "input", "source", "wbr", "col", "area", "base", "embed", "track"}
+# class/id hints for boilerplate containers
+BOILERPLATE_RE = re.compile(
+    r"(^|[\s_-])(nav|navbar|menu|sidebar|footer|header|breadcrumbs?|cookie|banner|"
+    r"share|social|comments?|related|advert|ads?|promo|subscribe|newsletter|toc)([\s_-]|$)",
+    re.IGNORECASE,
+)
+CONTENT_RE = re.compile(r"(^|[\s_-])(content|article|main|post|entry|body|docs?|markdown)([\s_-]|$)",
+                        re.IGNORECASE)
+
+
+# Share of a child container's score credited to its parent
+PARENT_SHARE = 0.5
+
+
+class _Container:
+    __slots__ = ("parent", "children", "text_chars", "link_chars", "bonus", "order")
+
+    def __init__(self, order: int, bonus: float, parent: Optional["_Container"] = None):
+        self.parent = parent
+        self.children: List["_Container"] = []
+        self.text_chars = 0
+        self.link_chars = 0
+        self.bonus = bonus
+        self.order = order
+        if parent is not None:
+            parent.children.append(self)
+
+    def score(self) -> float:
+        """Own text (less links) plus part of the children's scores, so a
+        container whose content is split across nested divs, code blocks
+        and notes outranks each of its parts."""
+        own = 0.0
+        if self.text_chars:
+            own = self.text_chars * (1.0 - self.link_chars / self.text_chars)
+        return (own + PARENT_SHARE * sum(child.score() for child in self.children)) * self.bonus
+
+    def contains(self, other: "_Container") -> bool:
+        while other is not None:
+            if other is self:
+                return True
+            other = other.parent
+        return False
+
+
+class MainContentExtractor(HTMLParser):
+    """
+    Feed HTML incrementally with `feed()`; call `markdown()` once done.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        # Skipped subtree: its tag name and nesting depth of that tag, so
+        # unclosed tags inside it can't swallow the rest of the page
+        self._skip_tag: Optional[str] = None
+        self._skip_depth = 0
+        # Text outside any container lands in the root container
+        self._root = _Container(0, 1.0)
+        self._containers: List[_Container] = [self._root]
+        # (container, markdown block) in document order
+        self._blocks: List[Tuple[_Container, str]] = []
+        # (tag, container or None) per open tag
+        self._stack: List[Tuple[str, Optional[_Container]]] = []
+        self._text: List[str] = []
+        self._block_tag: Optional[str] = None
+        self._heading_level = 0
+        self._in_pre = 0
+        self._in_link = 0
+        self._link_chars = 0
+        self._list_stack: List[str] = []
+        self._title_parts: List[str] = []
+        self._in_title = False
+        self._order = 0
+
+    # --- Parser callbacks ---
+
+    def handle_starttag(self, tag: str, attrs):
+        if self._skip_tag:
+            if tag == self._skip_tag:
+                self._skip_depth += 1
+            return
+
+        attr_map: Dict[str, str] = {k: (v or "") for k, v in attrs}
+        hints = f"{attr_map.get('class', '')} {attr_map.get('id', '')} {attr_map.get('role', '')}"
+        if tag in SKIP_TAGS or attr_map.get("aria-hidden") == "true" or (
+                tag in CONTAINER_TAGS and tag not in ("body", "main", "article")
+                and BOILERPLATE_RE.search(hints) and not CONTENT_RE.search(hints)):
+            if tag not in VOID_TAGS:
+                self._flush_block()
+                self._skip_tag, self._skip_depth = tag, 1
+            return
+
+        if tag == "title":
+            self._in_title = True
+        elif tag in CONTAINER_TAGS:
+            self._flush_block()
+            bonus = 1.5 if tag in ("article", "main") or CONTENT_RE.search(hints) else 1.0
+            self._order += 1
+            container = _Container(self._order, bonus, parent=self._current_container())
+            self._containers.append(container)
+            self._stack.append((tag, container))
+            return
+        elif tag in ("ul", "ol"):
+            self._flush_block()
+            self._list_stack.append(tag)
+        elif tag == "pre":
+            self._flush_block()
+            self._block_tag = "pre"
+            self._in_pre += 1
+        elif tag in BLOCK_TAGS:
+            self._flush_block()
+            self._block_tag = tag
+            if tag[0] == "h" and tag[1:].isdigit():
+                self._heading_level = int(tag[1])
+        elif tag == "br":
+            self._text.append("\n")
+        elif tag == "a":
+            self._in_link += 1
+        elif tag == "code" and not self._in_pre:
+            self._text.append("`")
+        elif tag in ("strong", "b"):
+            self._text.append("**")
+        elif tag in ("em", "i"):
+            self._text.append("*")
+
+        if tag not in VOID_TAGS:
+            self._stack.append((tag, None))
+
+    def handle_endtag(self, tag: str):
+        if self._skip_tag:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if not self._skip_depth:
+                    self._skip_tag = None
+            return
+
+        if tag == "title":
+            self._in_title = False
+        elif tag == "a":
+            self._in_link = max(self._in_link - 1, 0)
+        elif tag == "code" and not self._in_pre:
+            self._text.append("`")
+        elif tag in ("strong", "b"):
+            self._text.append("**")
+        elif tag in ("em", "i"):
+            self._text.append("*")
+        elif tag in ("ul", "ol"):
+            self._flush_block()
+            if self._list_stack:
+                self._list_stack.pop()
+        elif tag == "pre":
+            self._flush_block()
+            self._in_pre = max(self._in_pre - 1, 0)
+        elif tag in BLOCK_TAGS or tag in CONTAINER_TAGS:
+            self._flush_block()
+
+        # Pop back to the matching open tag (tolerates unclosed <p>, <li>...)
+        if any(open_tag == tag for open_tag, _ in self._stack):
+            while self._stack:
+                open_tag, _ = self._stack.pop()
+                if open_tag == tag:
+                    break
+
+    def handle_data(self, data: str):
+        if self._skip_tag:
+            return
+        if self._in_title:
+            self._title_parts.append(data)
+            return
+        self._text.append(data)
+        if self._in_link:
+            self._link_chars += len(data.strip())
+
+    # --- Block assembly ---
+
+    def _current_container(self) -> _Container:
+        for _, container in reversed(self._stack):
+            if container is not None:
+                return container
+        return self._root
+
+    def _flush_block(self):
+        raw = "".join(self._text)
+        link_chars = self._link_chars
+        block_tag = self._block_tag
+        self._text, self._link_chars, self._block_tag = [], 0, None
+        heading_level, self._heading_level = self._heading_level, 0
+
+        if block_tag == "pre":
+            code = raw.strip("\n")
+            if not code.strip():
+                return
+            block = f"```\n{code}\n```"
+            text_chars = len(code)
+        else:
+            text = re.sub(r"\s+", " ", raw).strip()
+            # Drop emphasis markers left without any text between them
+            if not text.strip("*` "):
+                return
+            if heading_level:
+                block = f"{'#' * heading_level} {text.strip('* ')}"
+            elif block_tag == "li" or (self._list_stack and block_tag is None):
+                marker = "1." if self._list_stack and self._list_stack[-1] == "ol" else "-"
+                indent = "  " * max(len(self._list_stack) - 1, 0)
+                block = f"{indent}{marker} {text}"
+            else:
+                block = text
+            text_chars = len(text)
+
+        container = self._current_container()
+        self._blocks.append((container, block))
+        container.text_chars += text_chars
+        container.link_chars += link_chars
+
+    def title(self) -> str:
+        return re.sub(r"\s+", " ", "".join(self._title_parts)).strip()
+
+    def markdown(self, min_ratio: float = 0.25) -> str:
+        """
+        Return the page's main content as markdown: the best-scoring
+        container with everything nested in it (code blocks, notes, tables),
+        plus sibling containers scoring at least `min_ratio` of it.
+        """
+        self.close()
+        self._flush_block()
+        if not self._blocks:
+            return ""
+        scores = {id(c): c.score() for c in self._containers}
+        # Ties go to the outermost container (document order)
+        best = max(self._containers, key=lambda c: (scores[id(c)], -c.order))
+        if scores[id(best)] <= 0:
+            kept = [self._root]
+        else:
+            kept = [best]
+            if best.parent is not None:
+                kept += [sibling for sibling in best.parent.children
+                         if sibling is not best and scores[id(sibling)] >= scores[id(best)] * min_ratio]
+
+        blocks = [block for container, block in self._blocks
+                  if any(root.contains(container) for root in kept)]
+
+        # Tight lists, blank lines between everything else
+        out: List[str] = []
+        for block in blocks:
+            is_item = block.lstrip().startswith(("- ", "1. "))
+            if out and not (is_item and out[-1].lstrip().startswith(("- ", "1. "))):
+                out.append("")
+            out.append(block)
+        return "\n".join(out).strip()
+
+
+def extract_main_content(chunks: Iterable[str]) -> str:
+    """
+    Extract main-content markdown from HTML given as an iterable of text
+    chunks (e.g. a decoded streaming response body).
+    """
+    extractor = MainContentExtractor()
+    for chunk in chunks:
+        extractor.feed(chunk)
+    content = extractor.markdown()
+    title = extractor.title()
+    if title and not content.startswith("# "):
+        content = f"# {title}\n\n{content}" if content else f"# {title}"
+    return content
@@ -0,0 +1,170 @@
+"""
+Image post-processing between image generation and document assembly.
+Downscales generated images to the theme's display width and recompresses
+them (JPEG by default, WebP optional) without metadata, in a thread pool.
+Pillow is optional; without it images pass through unchanged.
+"""
+import io
+import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+# Content width in CSS px per theme (styles.css max-width minus theme padding)
+DISPLAY_WIDTHS = {
+    "pro": 800,
+    "kids": 720,
+}
+DEFAULT_DISPLAY_WIDTH = 800
+
+FORMATS = {
+    "jpeg": ("JPEG", "jpg"),
+    "webp": ("WEBP", "webp"),
+    "png": ("PNG", "png"),
+}
+
+
+class ImageProcessor:
+    """
+    Resize and recompress images for embedding.
+
+    IMAGE_FORMAT (jpeg|webp|png), IMAGE_QUALITY and IMAGE_SCALE (pixels per
+    CSS px; raise for sharper print) control the output. Pillow's resize
+    and encoders release the GIL, so a thread pool processes images in
+    parallel.
+    """
+
+    def __init__(self):
+        self.format = os.getenv("IMAGE_FORMAT", "jpeg").lower()
+        if self.format not in FORMATS:
+            self.format = "jpeg"
+        self.quality = int(os.getenv("IMAGE_QUALITY", "82"))
+        self.scale = float(os.getenv("IMAGE_SCALE", "1.0"))
+        self._pool = ThreadPoolExecutor(max_workers=int(os.getenv("IMAGE_WORKERS", "4")),
+                                        thread_name_prefix="imaging")
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    @property
+    def extension(self) -> str:
+        return FORMATS[self.format][1] if PIL_AVAILABLE else "png"
+
+    def target_width(self, style: str) -> int:
+        return int(DISPLAY_WIDTHS.get(style, DEFAULT_DISPLAY_WIDTH) * self.scale)
+
+    def output_name(self, data: bytes, style: str) -> str:
+        """
+        Content-addressed filename for the processed version of `data`.
+        Depends only on the source bytes and settings, so existing output
+        can be reused without processing again.
+        """
+        digest = hashlib.sha256(data)
+        digest.update(f"{self.format}:{self.quality}:{self.target_width(style)}:{PIL_AVAILABLE}".encode())
+        return f"img_{digest.hexdigest()[:20]}.{self.extension}"
+
+    def find_output(self, directory: str, name: str) -> Optional[str]:
+        """
+        Name of an already processed file for `name` in `directory`, if any.
+        Processing can fall back to PNG, so the stem is checked with every
+        output extension, not just the configured one.
+        """
+        stem = os.path.splitext(name)[0]
+        for extension in [self.extension] + [ext for _, ext in FORMATS.values() if ext != self.extension]:
+            candidate = f"{stem}.{extension}"
+            if os.path.exists(os.path.join(directory, candidate)):
+                return candidate
+        return None
+
+    def process(self, data: bytes, style: str = "pro") -> Dict:
+        """
+        Returns {'data', 'extension', 'width', 'height', 'bytes_before', 'bytes_after'}.
+        Undecodable input (or no Pillow) is returned unchanged.
+        """
+        result = {"data": data, "extension": "png", "width": None, "height": None,
+                  "bytes_before": len(data), "bytes_after": len(data)}
+        if not PIL_AVAILABLE:
+            return result
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image.load()
+                width = self.target_width(style)
+                if image.width > width:
+                    height = max(1, round(image.height * width / image.width))
+                    image = image.resize((width, height), Image.LANCZOS)
+
+                pil_format, extension = FORMATS[self.format]
+                if pil_format == "JPEG" and image.mode != "RGB":
+                    # No alpha in JPEG: flatten onto white
+                    background = Image.new("RGB", image.size, (255, 255, 255))
+                    rgba = image.convert("RGBA")
+                    background.paste(rgba, mask=rgba.split()[-1])
+                    image = background
+
+                out = io.BytesIO()
+                # No exif/icc/info passed on: metadata is stripped
+                options = {"optimize": True}
+                if pil_format in ("JPEG", "WEBP"):
+                    options["quality"] = self.quality
+                if pil_format == "JPEG":
+                    options["progressive"] = True
+                image.save(out, format=pil_format, **options)
+                encoded = out.getvalue()
+                if len(encoded) >= len(data) and pil_format != "PNG":
+                    # Flat artwork can compress better losslessly
+                    lossless = io.BytesIO()
+                    image.save(lossless, format="PNG", optimize=True)
+                    if lossless.tell() < len(encoded):
+                        encoded, extension = lossless.getvalue(), "png"
+                result.update(width=image.width, height=image.height)
+        except Exception as e:
+            print(f"Image processing failed, embedding original: {e}")
+            return result
+
+        result.update(data=encoded, extension=extension, bytes_after=len(encoded))
+        return result
+
+    def process_many(self, images: List[bytes], style: str = "pro") -> List[Dict]:
+        """Process images in parallel, preserving order, and record byte counts."""
+        results = list(self._pool.map(lambda data: self.process(data, style), images))
+        with self._lock:
+            for result in results:
+                self.processed += 1
+                self.bytes_before += result["bytes_before"]
+                self.bytes_after += result["bytes_after"]
+        before = sum(r["bytes_before"] for r in results)
+        after = sum(r["bytes_after"] for r in results)
+        if results:
+            print(f"Processed {len(results)} image(s): {before} -> {after} bytes")
+        return results
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "pillow": PIL_AVAILABLE,
+                "format": self.format if PIL_AVAILABLE else "passthrough",
+                "images": self.processed,
+                "bytes_before": self.bytes_before,
+                "bytes_after": self.bytes_after,
+                "saved_ratio": round(1 - self.bytes_after / self.bytes_before, 4) if self.bytes_before else 0.0,
+            }
+
+
+_processor: Optional[ImageProcessor] = None
+_processor_lock = threading.Lock()
+
+def get_image_processor() -> ImageProcessor:
+    """Process-wide processor (shared thread pool and byte counters)."""
+    global _processor
+    with _processor_lock:
+        if _processor is None:
+            _processor = ImageProcessor()
+        return _processor
@@ -3,15 +3,37 @@ Document Indexer Service
 Scans the RAG database folder and indexes documents into the vector store.
 """
 import os
+import re
+import json
+import time
 import hashlib
 import logging
-from typing import List, Dict, Optional
+import threading
+import uuid
+from collections import deque
+from typing import Callable, Deque, Iterator, List, Dict, Optional, Tuple
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
 # Import VectorDB
 from database.vector_store import VectorDB
+from core.cache import LRUCache, file_lock
+from core.dedup import SimHashIndex, simhash, hamming_distance, to_hex, from_hex
+
+SUPPORTED_EXTENSIONS = {'.txt', '.md', '.pdf'}
+DEFAULT_RAG_FOLDER = "./document/convertit/database"
+
+# Separator for the 'sources' metadata of collapsed near-duplicate chunks
+# (Chroma metadata values must be scalars)
+SOURCES_SEP = "|"
+
+# Indexed file hashes, shared by every process indexing the folder
+HASH_FILE = ".indexed_hashes"
+
+# Rewritten on every index change, so other processes sharing the RAG
+# folder (the web app, the folder watcher) drop their cached queries
+GENERATION_FILE = ".index_generation"
 
 class DocumentIndexer:
     """
@@ -20,82 +42,475 @@ class DocumentIndexer:
     """
     
     def __init__(self, rag_folder: Optional[str] = None):
-        self.rag_folder = rag_folder or os.getenv("RAG_FOLDER", "./document/convertit/database")
+        self.rag_folder = rag_folder or os.getenv("RAG_FOLDER", DEFAULT_RAG_FOLDER)
         self.db = VectorDB(collection_name="rag_knowledge_base")
         self._indexed_hashes: set = set()
+        # Relative source path -> hash of the version currently indexed
+        self._source_hashes: Dict[str, str] = {}
+        # Source -> new hash (None when removed) since the last save(), merged
+        # into the hash file so other processes' updates aren't overwritten
+        self._hash_changes: Dict[str, Optional[str]] = {}
+        # Serializes index writes between scans and the folder watcher
+        self._write_lock = threading.RLock()
+        
+        # Bumped whenever new content lands in the index, here or in another
+        # process (see GENERATION_FILE); part of every query cache key so
+        # stale results are never served
+        self.generation = 0
+        self._generation_token = self._read_generation_token()
+        self._query_cache = LRUCache(
+            max_size=int(os.getenv("RAG_QUERY_CACHE_SIZE", "512")),
+            ttl=float(os.getenv("RAG_QUERY_CACHE_TTL", "600")),
+        )
+        
+        # Chunks are flushed to the vector store in batches of this size,
+        # bounding memory regardless of file size
+        self.batch_size = int(os.getenv("RAG_INDEX_BATCH_SIZE", "64"))
+        
+        # Near-duplicate chunks (SimHash within this many bits) are stored
+        # once and list every source; a negative value disables collapsing
+        self.dedup_distance = int(os.getenv("RAG_DEDUP_DISTANCE", "4"))
+        self._signatures: Optional[SimHashIndex] = None
+        # Source -> ids of chunks it shares as a non-primary source
+        self._secondary_refs: Dict[str, set] = {}
         
         # Track what's been indexed to avoid duplicates
         self._load_indexed_hashes()
     
+    def _read_hash_file(self) -> Tuple[Dict[str, str], set]:
+        """
+        Read the hash file: (source -> hash, hashes without a source).
+        Lines are `hash<TAB>source`; older files contain bare hashes.
+        """
+        sources: Dict[str, str] = {}
+        bare = set()
+        try:
+            with open(os.path.join(self.rag_folder, HASH_FILE), 'r') as f:
+                for line in f.read().strip().split('\n'):
+                    file_hash, _, source = line.partition('\t')
+                    if not file_hash:
+                        continue
+                    if source:
+                        sources[source] = file_hash
+                    else:
+                        bare.add(file_hash)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Could not read {HASH_FILE}: {e}")
+        return sources, bare
+    
     def _load_indexed_hashes(self):
         """Load previously indexed file hashes (simple persistence)."""
-        hash_file = os.path.join(self.rag_folder, ".indexed_hashes")
-        if os.path.exists(hash_file):
+        self._source_hashes, bare = self._read_hash_file()
+        self._indexed_hashes = set(self._source_hashes.values()) | bare
+        if self._migrate_legacy_hashes(bare):
+            self.save()
+    
+    def _migrate_legacy_hashes(self, bare: set) -> int:
+        """
+        Rewrite hashes taken from the full file path (before _file_hash used
+        the path relative to the RAG folder) to the current form, so an
+        upgrade doesn't re-index every file and orphan its old chunks.
+        Returns the number of entries migrated.
+        """
+        outdated = False
+        for source, stored in self._source_hashes.items():
+            filepath = os.path.join(self.rag_folder, source)
+            if os.path.exists(filepath) and self._file_hash(filepath) != stored:
+                outdated = True
+                break
+        if not bare and not outdated:
+            return 0
+        
+        # Legacy hash -> (relative path, current hash); scans hashed the
+        # path as walked, the watcher the absolute path
+        legacy: Dict[str, Tuple[str, str]] = {}
+        for filepath in self._scan_files():
             try:
-                with open(hash_file, 'r') as f:
-                    self._indexed_hashes = set(f.read().strip().split('\n'))
-            except Exception:
-                self._indexed_hashes = set()
+                mtime = os.stat(filepath).st_mtime
+            except OSError:
+                continue
+            current = (os.path.relpath(filepath, self.rag_folder), self._file_hash(filepath))
+            for variant in {filepath, os.path.abspath(filepath)}:
+                legacy[hashlib.md5(f"{variant}:{mtime}".encode()).hexdigest()] = current
+        
+        migrated = 0
+        for stored in list(self._indexed_hashes):
+            if stored not in legacy:
+                continue
+            source, current = legacy[stored]
+            if self._source_hashes.get(source, stored) != stored:
+                continue  # Indexed again since
+            self._indexed_hashes.discard(stored)
+            self._indexed_hashes.add(current)
+            self._source_hashes[source] = current
+            self._hash_changes[source] = current
+            migrated += 1
+        if migrated:
+            logger.info(f"Migrated {migrated} indexed file hash(es) to paths relative to {self.rag_folder}")
+        return migrated
     
-    def _save_indexed_hashes(self):
-        """Save indexed file hashes."""
-        os.makedirs(self.rag_folder, exist_ok=True)
-        hash_file = os.path.join(self.rag_folder, ".indexed_hashes")
-        with open(hash_file, 'w') as f:
-            f.write('\n'.join(self._indexed_hashes))
+    def save(self):
+        """
+        Persist indexed file hashes. The file is re-read under a lock and
+        this indexer's changes merged in, so the watcher, the web app and
+        the bulk CLI can update it concurrently.
+        """
+        with self._write_lock:
+            os.makedirs(self.rag_folder, exist_ok=True)
+            hash_file = os.path.join(self.rag_folder, HASH_FILE)
+            with file_lock(hash_file + ".lock"):
+                sources, bare = self._read_hash_file()
+                for source, file_hash in self._hash_changes.items():
+                    if file_hash is None:
+                        sources.pop(source, None)
+                    else:
+                        sources[source] = file_hash
+                lines = [f"{h}\t{src}" for src, h in sources.items()]
+                # Bare hashes are only left by older versions; keep those still in use
+                lines += [h for h in bare if h in self._indexed_hashes and h not in set(sources.values())]
+                tmp_path = f"{hash_file}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    f.write('\n'.join(lines))
+                os.replace(tmp_path, hash_file)
+            self._hash_changes = {}
+            # Pick up what other processes indexed
+            self._source_hashes = sources
+            self._indexed_hashes = set(sources.values()) | (bare & self._indexed_hashes)
     
     def _file_hash(self, filepath: str) -> str:
-        """Generate a hash for a file based on path + modification time."""
+        """
+        Generate a hash for a file based on path + modification time.
+        The path is taken relative to the RAG folder, so scans and the
+        watcher (which sees absolute paths) agree on it.
+        """
         stat = os.stat(filepath)
-        return hashlib.md5(f"{filepath}:{stat.st_mtime}".encode()).hexdigest()
+        relative_path = os.path.relpath(filepath, self.rag_folder)
+        return hashlib.md5(f"{relative_path}:{stat.st_mtime}".encode()).hexdigest()
     
     def _chunk_text(self, text: str, chunk_size: int = 1000, overlap: int = 100) -> List[str]:
         """Split text into overlapping chunks for better retrieval."""
-        chunks = []
-        words = text.split()
-        
-        if len(words) <= chunk_size:
-            return [text]
+        return list(self._iter_chunks(self._iter_words_from_text(text), chunk_size, overlap))
+    
+    @staticmethod
+    def _iter_chunks(words: Iterator[str], chunk_size: int = 1000, overlap: int = 100) -> Iterator[str]:
+        """
+        Yield overlapping word-window chunks from a word stream.
+        Only one window of words is held in memory at a time.
+        """
+        step = max(chunk_size - overlap, 1)
+        window: Deque[str] = deque()
+        fresh = 0  # words not yet included in any emitted chunk
         
-        i = 0
-        while i < len(words):
-            chunk = ' '.join(words[i:i + chunk_size])
-            chunks.append(chunk)
-            i += chunk_size - overlap
+        for word in words:
+            window.append(word)
+            fresh += 1
+            if len(window) == chunk_size:
+                yield ' '.join(window)
+                fresh = 0
+                for _ in range(step):
+                    window.popleft()
         
-        return chunks
+        if fresh:
+            yield ' '.join(window)
     
-    def _extract_text_from_file(self, filepath: str) -> Optional[str]:
-        """Extract text content from supported file types."""
+    @staticmethod
+    def _iter_words_from_text(text: str) -> Iterator[str]:
+        """Yield whitespace-separated words without materializing a list."""
+        for match in re.finditer(r'\S+', text):
+            yield match.group()
+    
+    @staticmethod
+    def _iter_words_from_file(filepath: str, block_size: int = 1 << 16) -> Iterator[str]:
+        """Stream words from a text file in fixed-size blocks."""
+        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
+            carry = ''
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                block = carry + block
+                words = block.split()
+                # The last word may continue into the next block
+                if words and not block[-1].isspace():
+                    carry = words.pop()
+                else:
+                    carry = ''
+                yield from words
+            if carry:
+                yield carry
+    
+    def _iter_file_chunks(self, filepath: str) -> Iterator[str]:
+        """Yield chunks for a file, streaming plain text straight from disk."""
         ext = Path(filepath).suffix.lower()
+        if ext in ('.txt', '.md'):
+            yield from self._iter_chunks(self._iter_words_from_file(filepath))
+            return
+        
+        if ext == '.pdf':
+            # Chunk pages as they come out of extraction
+            from core.ingestion import IngestionService
+            pages = IngestionService().iter_file_pages(filepath)
+            words = (word for page in pages for word in self._iter_words_from_text(page))
+            yield from self._iter_chunks(words)
+            return
+        
+        logger.debug(f"Unsupported file type: {ext}")
+    
+    def _scan_files(self) -> List[str]:
+        """List supported, non-hidden files under the RAG folder."""
+        filepaths = []
+        for root, dirs, files in os.walk(self.rag_folder):
+            # Skip hidden directories
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            
+            for filename in files:
+                if filename.startswith('.'):
+                    continue
+                if Path(filename).suffix.lower() not in SUPPORTED_EXTENSIONS:
+                    continue
+                filepaths.append(os.path.join(root, filename))
+        return filepaths
+    
+    def index_file(self, filepath: str, force_reindex: bool = False) -> Tuple[str, Optional[str]]:
+        """
+        Index a single file.
+        
+        Returns:
+            (outcome, error) where outcome is 'indexed', 'skipped' or 'failed'.
+        """
+        filename = os.path.basename(filepath)
+        file_hash = self._file_hash(filepath)
+        
+        # Skip if already indexed (unless force)
+        if not force_reindex and file_hash in self._indexed_hashes:
+            return "skipped", None
+        
+        # Extract, chunk and index in bounded batches
+        logger.info(f"Indexing: {filename}")
+        relative_path = os.path.relpath(filepath, self.rag_folder)
+        return self._index_chunks(self._iter_file_chunks(filepath), relative_path, file_hash)
+    
+    def index_text(self, text: str, source: str, force_reindex: bool = False) -> Tuple[str, Optional[str]]:
+        """
+        Index already extracted text (e.g. a fetched web page) under `source`.
+        Re-indexing the same source replaces its previous content; unchanged
+        text is skipped.
+        
+        Returns:
+            (outcome, error) where outcome is 'indexed', 'skipped' or 'failed'.
+        """
+        text_hash = hashlib.md5(f"{source}:".encode() + text.encode("utf-8", errors="ignore")).hexdigest()
+        if not force_reindex and self._source_hashes.get(source) == text_hash:
+            return "skipped", None
+        
+        logger.info(f"Indexing: {source}")
+        return self._index_chunks(self._iter_chunks(self._iter_words_from_text(text)), source, text_hash)
+    
+    def _index_chunks(self, chunks: Iterator[str], source: str, doc_hash: str) -> Tuple[str, Optional[str]]:
+        """Replace `source` in the index with `chunks`, flushed in batches."""
+        stored = collapsed = total = 0
         
         try:
-            if ext == '.txt' or ext == '.md':
-                with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                    return f.read()
+            with self._write_lock:
+                # Drop chunks from a previous version of this source
+                self._forget_source(source)
+                
+                batch: List[str] = []
+                for chunk in chunks:
+                    batch.append(chunk)
+                    if len(batch) >= self.batch_size:
+                        batch_stored, batch_collapsed = self._store_chunks(batch, source, doc_hash, start_index=total)
+                        stored, collapsed, total = stored + batch_stored, collapsed + batch_collapsed, total + len(batch)
+                        batch = []
+                if batch:
+                    batch_stored, batch_collapsed = self._store_chunks(batch, source, doc_hash, start_index=total)
+                    stored, collapsed, total = stored + batch_stored, collapsed + batch_collapsed, total + len(batch)
+                
+                if not total:
+                    return "failed", "no text extracted"
+                
+                self._indexed_hashes.add(doc_hash)
+                self._source_hashes[source] = doc_hash
+                self._hash_changes[source] = doc_hash
             
-            elif ext == '.pdf':
-                # Try to use LlamaParse or fallback to simple extraction
-                try:
-                    from core.ingestion import IngestionService
-                    service = IngestionService()
-                    return service.parse_url(filepath)
-                except Exception as e:
-                    logger.warning(f"PDF extraction failed for {filepath}: {e}")
-                    return None
+            if collapsed:
+                logger.info(f"{source}: {stored} chunks stored, {collapsed} near-duplicates collapsed")
+            # New content is queryable immediately; drop stale cached results
+            self.bump_generation()
+            return "indexed", None
             
-            else:
-                logger.debug(f"Unsupported file type: {ext}")
-                return None
-                
         except Exception as e:
-            logger.error(f"Error reading {filepath}: {e}")
+            logger.error(f"Failed to index {source}: {e}")
+            # Don't leave a partially indexed document behind
+            try:
+                with self._write_lock:
+                    self._forget_source(source)
+            except Exception:
+                pass
+            return "failed", str(e)
+    
+    def _signature_index(self) -> Optional[SimHashIndex]:
+        """Lazily build the SimHash index from chunks already in the store."""
+        if self.dedup_distance < 0:
             return None
+        if self._signatures is None:
+            index = SimHashIndex(max_distance=self.dedup_distance)
+            for record in self.db.get_documents(where={"type": "rag_document"}):
+                metadata = record["metadata"]
+                signature = from_hex(metadata.get("simhash"))
+                if signature is not None:
+                    index.add(record["id"], signature)
+                for source in self._sources_of(metadata)[1:]:
+                    self._secondary_refs.setdefault(source, set()).add(record["id"])
+            self._signatures = index
+        return self._signatures
+    
+    @staticmethod
+    def _sources_of(metadata: Dict) -> List[str]:
+        """All sources of a stored chunk, primary source first."""
+        sources = metadata.get("sources")
+        if sources:
+            return sources.split(SOURCES_SEP)
+        return [metadata["source"]] if metadata.get("source") else []
+    
+    def _store_chunks(self, chunks: List[str], relative_path: str, file_hash: str,
+                      start_index: int = 0) -> Tuple[int, int]:
+        """
+        Add a file's chunks to the vector store, collapsing near-duplicates
+        of already stored chunks into those chunks' source lists.
+        
+        Returns:
+            (stored, collapsed) chunk counts.
+        """
+        filename = os.path.basename(relative_path)
+        index = self._signature_index()
+        
+        documents, metadatas, ids = [], [], []
+        collapse_into: Dict[str, None] = {}  # ordered set of canonical chunk ids
+        # Signatures of this batch, added to the index once the write succeeds
+        batch_signatures = SimHashIndex(max_distance=self.dedup_distance) if index is not None else None
+        new_signatures: List[Tuple[str, int]] = []
+        
+        for offset, chunk in enumerate(chunks):
+            chunk_id = f"{file_hash}_chunk_{start_index + offset}"
+            metadata = {
+                "source": relative_path,
+                "filename": filename,
+                "chunk_index": start_index + offset,
+                "type": "rag_document"
+            }
+            
+            if index is not None:
+                signature = simhash(chunk)
+                duplicate_of = index.find(signature)
+                if duplicate_of is None:
+                    duplicate_of = batch_signatures.find(signature)
+                if duplicate_of is not None:
+                    collapse_into[duplicate_of] = None
+                    continue
+                batch_signatures.add(chunk_id, signature)
+                new_signatures.append((chunk_id, signature))
+                metadata["simhash"] = to_hex(signature)
+                metadata["sources"] = relative_path
+            
+            documents.append(chunk)
+            metadatas.append(metadata)
+            ids.append(chunk_id)
+        
+        if ids:
+            self.db.add_documents(documents=documents, metadatas=metadatas, ids=ids)
+        for chunk_id, signature in new_signatures:
+            index.add(chunk_id, signature)
+        
+        # Record this file as an extra source of the chunks it duplicated
+        update_ids, update_metadatas = [], []
+        for record in self.db.get_documents(ids=list(collapse_into)) if collapse_into else []:
+            sources = self._sources_of(record["metadata"])
+            if relative_path in sources:
+                continue  # repeated passage within the same file
+            metadata = dict(record["metadata"])
+            metadata["sources"] = SOURCES_SEP.join(sources + [relative_path])
+            update_ids.append(record["id"])
+            update_metadatas.append(metadata)
+            self._secondary_refs.setdefault(relative_path, set()).add(record["id"])
+        self.db.update_metadatas(update_ids, update_metadatas)
+        
+        return len(ids), len(chunks) - len(ids)
+    
+    def _forget_source(self, relative_path: str):
+        """Delete a source's chunks from the vector store and hash index."""
+        old_hash = self._source_hashes.pop(relative_path, None)
+        if old_hash:
+            self._indexed_hashes.discard(old_hash)
+        self._hash_changes[relative_path] = None
+        
+        index = self._signature_index()
+        if index is None:
+            self.db.delete_documents(where={"source": relative_path})
+            return
+        
+        # Chunks this source owns: hand them to the next source sharing
+        # them, or delete them if nobody else does
+        update_ids, update_metadatas, delete_ids = [], [], []
+        for record in self.db.get_documents(where={"source": relative_path}):
+            others = [src for src in self._sources_of(record["metadata"]) if src != relative_path]
+            if others:
+                metadata = dict(record["metadata"])
+                metadata.update(source=others[0], filename=os.path.basename(others[0]),
+                                sources=SOURCES_SEP.join(others))
+                update_ids.append(record["id"])
+                update_metadatas.append(metadata)
+                self._secondary_refs.get(others[0], set()).discard(record["id"])
+            else:
+                delete_ids.append(record["id"])
+                index.remove(record["id"])
+        
+        # Chunks this source only shared: drop it from their source lists
+        shared_ids = self._secondary_refs.pop(relative_path, set())
+        for record in self.db.get_documents(ids=list(shared_ids)) if shared_ids else []:
+            metadata = dict(record["metadata"])
+            metadata["sources"] = SOURCES_SEP.join(
+                src for src in self._sources_of(metadata) if src != relative_path
+            )
+            update_ids.append(record["id"])
+            update_metadatas.append(metadata)
+        
+        self.db.update_metadatas(update_ids, update_metadatas)
+        self.db.delete_documents(ids=delete_ids)
     
-    def index_folder(self, force_reindex: bool = False) -> Dict[str, int]:
+    def remove_file(self, filepath: str) -> bool:
+        """
+        Remove a deleted (or moved away) file from the index.
+        
+        Returns:
+            True if the file had been indexed.
+        """
+        relative_path = os.path.relpath(filepath, self.rag_folder)
+        with self._write_lock:
+            known = relative_path in self._source_hashes
+            try:
+                self._forget_source(relative_path)
+            except Exception as e:
+                logger.error(f"Failed to remove {relative_path} from index: {e}")
+                return False
+        
+        logger.info(f"Removed from index: {relative_path}")
+        self.bump_generation()
+        return known
+    
+    def index_folder(self, force_reindex: bool = False,
+                     progress: Optional[Callable[[str, str, Optional[str]], None]] = None,
+                     on_scan: Optional[Callable[[int], None]] = None) -> Dict[str, int]:
         """
         Scan the RAG folder and index all supported documents.
         
+        Args:
+            force_reindex: Re-index files even if their hash is known.
+            progress: Optional callback(filepath, outcome, error) after each file.
+            on_scan: Optional callback(total_files) once the folder has been listed.
+        
         Returns:
             Dict with counts of files indexed, skipped, and failed.
         """
@@ -104,106 +519,319 @@ class DocumentIndexer:
         if not os.path.exists(self.rag_folder):
             logger.warning(f"RAG folder does not exist: {self.rag_folder}")
             os.makedirs(self.rag_folder, exist_ok=True)
+            if on_scan:
+                on_scan(0)
             return stats
         
-        supported_extensions = {'.txt', '.md', '.pdf'}
-        
         logger.info(f"Scanning RAG folder: {self.rag_folder}")
+        filepaths = self._scan_files()
+        if on_scan:
+            on_scan(len(filepaths))
         
-        for root, dirs, files in os.walk(self.rag_folder):
-            # Skip hidden directories
-            dirs[:] = [d for d in dirs if not d.startswith('.')]
-            
-            for filename in files:
-                if filename.startswith('.'):
-                    continue
-                    
-                filepath = os.path.join(root, filename)
-                ext = Path(filename).suffix.lower()
-                
-                if ext not in supported_extensions:
-                    continue
-                
-                file_hash = self._file_hash(filepath)
-                
-                # Skip if already indexed (unless force)
-                if not force_reindex and file_hash in self._indexed_hashes:
-                    stats["skipped"] += 1
-                    continue
-                
-                # Extract and index
-                logger.info(f"Indexing: {filename}")
-                text = self._extract_text_from_file(filepath)
-                
-                if not text:
-                    stats["failed"] += 1
-                    continue
-                
-                # Chunk the text
-                chunks = self._chunk_text(text)
-                
-                # Add to vector DB
+        try:
+            for filepath in filepaths:
                 try:
-                    relative_path = os.path.relpath(filepath, self.rag_folder)
-                    
-                    documents = chunks
-                    metadatas = [
-                        {
-                            "source": relative_path,
-                            "filename": filename,
-                            "chunk_index": i,
-                            "total_chunks": len(chunks),
-                            "type": "rag_document"
-                        }
-                        for i in range(len(chunks))
-                    ]
-                    ids = [f"{file_hash}_chunk_{i}" for i in range(len(chunks))]
-                    
-                    self.db.add_documents(documents=documents, metadatas=metadatas, ids=ids)
-                    
-                    self._indexed_hashes.add(file_hash)
-                    stats["indexed"] += 1
-                    
-                except Exception as e:
-                    logger.error(f"Failed to index {filename}: {e}")
-                    stats["failed"] += 1
-        
-        # Save hashes
-        self._save_indexed_hashes()
+                    outcome, error = self.index_file(filepath, force_reindex=force_reindex)
+                except OSError as e:
+                    # File vanished or became unreadable mid-scan
+                    outcome, error = "failed", str(e)
+                stats[outcome] += 1
+                if progress:
+                    progress(filepath, outcome, error)
+        finally:
+            # Save hashes
+            self.save()
         
         logger.info(f"Indexing complete: {stats}")
         return stats
     
-    def query_knowledge(self, query: str, n_results: int = 5) -> List[Dict]:
+    def query_knowledge(self, query: str, n_results: int = 5,
+                        where: Optional[Dict] = None) -> List[Dict]:
         """
         Query the indexed knowledge base for relevant content.
         
         Returns:
-            List of dicts with 'content' and 'source' keys.
+            List of dicts with 'content', 'source', 'metadata' and 'score' keys.
+        """
+        return self.query_knowledge_batch([query], n_results=n_results, where=where)[0]
+    
+    def query_knowledge_batch(self, queries: List[str], n_results: int = 5,
+                              where: Optional[Dict] = None) -> List[List[Dict]]:
+        """
+        Query the knowledge base with several queries in a single round-trip.
+        
+        Args:
+            queries: Query texts.
+            n_results: Maximum hits per query.
+            where: Optional metadata filter; defaults to indexed RAG documents.
+        
+        Returns:
+            One result list per query, in the same order as `queries`.
         """
-        results = self.db.query_similar(query, n_results=n_results)
+        if where is None:
+            where = {"type": "rag_document"}
+        self._sync_generation()
+        
+        filter_key = json.dumps(where, sort_keys=True, default=str)
+        keys = [(self.generation, self._normalize_query(q), n_results, filter_key) for q in queries]
+        
+        results: List[Optional[List[Dict]]] = [self._query_cache.get(key) for key in keys]
+        missing = [i for i, cached in enumerate(results) if cached is None]
+        
+        if missing:
+            # Only the cache misses go to the vector store, still in one batch.
+            # Over-fetch when deduplicating so near-duplicates can be dropped.
+            fetch_n = n_results * 2 if self.dedup_distance >= 0 else n_results
+            batched = self.db.query_batch([queries[i] for i in missing], n_results=fetch_n, where=where)
+            for i, hits in zip(missing, batched):
+                results[i] = self._dedupe_hits([self._format_hit(hit) for hit in hits])[:n_results]
+                self._query_cache.set(keys[i], results[i])
         
-        # For now, return simple list of content
-        return [{"content": r, "source": "knowledge_base"} for r in results]
+        # Hand out copies so callers can't mutate cached entries
+        return [[dict(hit) for hit in hits] for hits in results]
+    
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        """Normalize query text so trivially different queries share a cache entry."""
+        return re.sub(r'\s+', ' ', query).strip().lower()
+    
+    def bump_generation(self):
+        """Mark the index as changed, invalidating cached query results in every process."""
+        token = uuid.uuid4().hex
+        path = os.path.join(self.rag_folder, GENERATION_FILE)
+        try:
+            os.makedirs(self.rag_folder, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(token)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not publish index generation: {e}")
+        self._generation_token = token
+        self.generation += 1
+        self._query_cache.clear()
+    
+    def _read_generation_token(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.rag_folder, GENERATION_FILE), "r") as f:
+                return f.read()
+        except OSError:
+            return None
+    
+    def _sync_generation(self):
+        """Pick up index changes made by another process (e.g. the folder watcher)."""
+        token = self._read_generation_token()
+        if token != self._generation_token:
+            self._generation_token = token
+            self.generation += 1
+            self._query_cache.clear()
+    
+    def get_cache_stats(self) -> Dict:
+        """Return query cache statistics (hits, misses, hit rate)."""
+        stats = self._query_cache.stats()
+        stats["generation"] = self.generation
+        return stats
+    
+    def _dedupe_hits(self, hits: List[Dict]) -> List[Dict]:
+        """Drop hits that are near-duplicates of a better-ranked hit."""
+        if self.dedup_distance < 0:
+            return hits
+        kept, signatures = [], []
+        for hit in hits:
+            signature = from_hex(hit["metadata"].get("simhash"))
+            if signature is None:
+                signature = simhash(hit["content"] or "")
+            if any(hamming_distance(signature, other) <= self.dedup_distance for other in signatures):
+                continue
+            kept.append(hit)
+            signatures.append(signature)
+        return kept
+    
+    @classmethod
+    def _format_hit(cls, hit: Dict) -> Dict:
+        """Convert a raw vector store hit into a knowledge result."""
+        metadata = hit.get("metadata") or {}
+        distance = hit.get("distance")
+        return {
+            "content": hit.get("content", ""),
+            "source": metadata.get("source", "knowledge_base"),
+            "sources": cls._sources_of(metadata) or ["knowledge_base"],
+            "metadata": metadata,
+            # Similarity score in (0, 1]; higher is more relevant
+            "score": 1.0 / (1.0 + distance) if distance is not None else None,
+        }
+    
+    def indexed_sources(self) -> List[str]:
+        """Sources currently in the index (paths relative to the RAG folder, or URLs)."""
+        with self._write_lock:
+            return list(self._source_hashes)
     
     def get_indexed_count(self) -> int:
         """Return count of indexed files."""
         return len(self._indexed_hashes)
 
 
-# Singleton instance for use across the app
-_indexer_instance: Optional[DocumentIndexer] = None
+def _folder_key(rag_folder: Optional[str]) -> str:
+    """Absolute path of a RAG folder (default: $RAG_FOLDER)."""
+    return os.path.abspath(rag_folder or os.getenv("RAG_FOLDER", DEFAULT_RAG_FOLDER))
+
 
-def get_indexer() -> DocumentIndexer:
-    """Get or create the document indexer singleton."""
-    global _indexer_instance
-    if _indexer_instance is None:
-        _indexer_instance = DocumentIndexer()
-    return _indexer_instance
+# One indexer per RAG folder for use across the app
+_indexers: Dict[str, DocumentIndexer] = {}
+_indexer_lock = threading.Lock()
 
-def index_rag_folder_on_startup():
-    """Called on app startup to index documents."""
+def get_indexer(rag_folder: Optional[str] = None) -> DocumentIndexer:
+    """
+    Get or create the document indexer for `rag_folder` (default:
+    $RAG_FOLDER). Other folders get their own indexer, so indexing one
+    doesn't redirect queries, the watcher or the bulk CLI.
+    """
+    key = _folder_key(rag_folder)
+    with _indexer_lock:
+        if key not in _indexers:
+            _indexers[key] = DocumentIndexer(rag_folder=rag_folder or None)
+        return _indexers[key]
+
+
+class IndexingJob:
+    """
+    A folder scan running on a background thread.
+    Progress is recorded as the scan goes so it can be polled while the
+    index keeps serving queries.
+    """
+    
+    MAX_ERRORS = 50  # Keep the status payload bounded
+    
+    def __init__(self, indexer: DocumentIndexer, force_reindex: bool = False):
+        self.indexer = indexer
+        self.force_reindex = force_reindex
+        self.state = "pending"
+        self.total: Optional[int] = None
+        self.done = 0
+        self.stats = {"indexed": 0, "skipped": 0, "failed": 0}
+        self.errors: List[Dict[str, str]] = []
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="rag-indexer", daemon=True)
+    
+    def start(self):
+        self.started_at = time.time()
+        self.state = "running"
+        self._thread.start()
+    
+    def is_running(self) -> bool:
+        return self.state in ("pending", "running")
+    
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job finishes. Returns False on timeout."""
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+    
+    def _on_scan(self, total: int):
+        with self._lock:
+            self.total = total
+    
+    def _on_progress(self, filepath: str, outcome: str, error: Optional[str]):
+        with self._lock:
+            self.done += 1
+            self.stats[outcome] += 1
+            if error and len(self.errors) < self.MAX_ERRORS:
+                self.errors.append({
+                    "file": os.path.relpath(filepath, self.indexer.rag_folder),
+                    "error": error
+                })
+    
+    def _run(self):
+        try:
+            self.indexer.index_folder(
+                force_reindex=self.force_reindex,
+                progress=self._on_progress,
+                on_scan=self._on_scan
+            )
+            self.state = "completed"
+        except Exception as e:
+            logger.error(f"Background indexing failed: {e}", exc_info=True)
+            with self._lock:
+                self.errors.append({"file": "", "error": str(e)})
+            self.state = "failed"
+        finally:
+            self.finished_at = time.time()
+            logger.info(f"Background indexing {self.state}: {self.stats}")
+    
+    def status(self) -> Dict:
+        """Snapshot of the job's progress, including an ETA while running."""
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            remaining = max(self.total - self.done, 0) if self.total is not None else None
+            
+            eta = None
+            if self.state == "running" and remaining is not None and self.done:
+                eta = round(elapsed / self.done * remaining, 1)
+            
+            return {
+                "state": self.state,
+                "rag_folder": self.indexer.rag_folder,
+                "total": self.total,
+                "done": self.done,
+                "remaining": remaining,
+                "indexed": self.stats["indexed"],
+                "skipped": self.stats["skipped"],
+                "failed": self.stats["failed"],
+                "errors": list(self.errors),
+                "elapsed_seconds": round(elapsed, 1),
+                "eta_seconds": eta,
+            }
+
+
+_current_job: Optional[IndexingJob] = None
+_job_lock = threading.Lock()
+
+def start_background_indexing(rag_folder: Optional[str] = None,
+                              force_reindex: bool = False) -> Tuple[bool, Dict]:
+    """
+    Start indexing the RAG folder on a background thread.
+    
+    A request for the folder that is already being indexed is merged into
+    the running job; a request for a different folder is rejected until
+    the running job finishes.
+    
+    Returns:
+        (started, status) - `started` is False if an existing job was reused
+        or the request was rejected (status['conflict'] is then True).
+    """
+    global _current_job
+    with _job_lock:
+        if _current_job is not None and _current_job.is_running():
+            status = _current_job.status()
+            if _folder_key(rag_folder) != _folder_key(_current_job.indexer.rag_folder):
+                status["conflict"] = True
+            return False, status
+        
+        job = IndexingJob(get_indexer(rag_folder), force_reindex=force_reindex)
+        job.start()
+        _current_job = job
+        return True, job.status()
+
+def get_indexing_status() -> Dict:
+    """Return the status of the current (or last) background indexing job."""
+    with _job_lock:
+        job = _current_job
+    if job is None:
+        return {"state": "idle"}
+    return job.status()
+
+def index_rag_folder_on_startup(background: bool = True):
+    """
+    Called on app startup to index documents.
+    By default the scan runs in the background so startup is not blocked.
+    """
     try:
+        if background:
+            _, status = start_background_indexing()
+            return status
+        
         indexer = get_indexer()
         stats = indexer.index_folder()
         logger.info(f"Startup indexing: {stats['indexed']} new, {stats['skipped']} cached, {stats['failed']} failed")
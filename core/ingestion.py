@@ -1,38 +1,144 @@
 import os
+import time
+import codecs
+import hashlib
+import tempfile
 import requests
+from typing import Dict, Iterator, List, Optional, Tuple
 from llama_index.core.node_parser import HierarchicalNodeParser, SimpleNodeParser
 from llama_index.core import Document
 from llama_parse import LlamaParse
 
+from core import pdf
+from core.cache import DiskCache
+from core.transport import get_transport
+from core.html_extract import extract_main_content
+
 class IngestionService:
     def __init__(self):
         self.llama_cloud_api_key = os.getenv("LLAMA_CLOUD_API_KEY")
         self.firecrawl_api_url = os.getenv("FIRECRAWL_API_URL", "http://localhost:3002")
         
+        self.firecrawl_timeout = float(os.getenv("FIRECRAWL_TIMEOUT", "30"))
+        self.firecrawl_retries = int(os.getenv("FIRECRAWL_RETRIES", "1"))
+        self.http = get_transport()
+        
         # Determine preferred provider based on available keys/config
         if self.llama_cloud_api_key:
             self.provider = "llama_parse"
         else:
             self.provider = "firecrawl"
+        
+        # On-disk cache of fetched pages (raw body + parsed markdown).
+        # Entries younger than the TTL are served without any network call;
+        # older ones are revalidated with a conditional GET.
+        self.fetch_cache_ttl = float(os.getenv("FETCH_CACHE_TTL", "3600"))
+        self.fetch_cache = _get_fetch_cache()
+        
+        # Parsed local documents keyed by content digest
+        self.parse_cache = _get_parse_cache()
 
     def parse_url(self, url: str) -> str:
         """
         Parses a URL or PDF and returns structured Markdown.
         """
-        # Determine priority: If URL is web-based, prefer Firecrawl.
         if url.startswith("http"):
-             if self.firecrawl_api_url:
-                 try:
-                    return self._parse_with_firecrawl(url)
-                 except Exception as e:
-                     print(f"Firecrawl failed ({e}). Falling back to direct fetch.")
-                     return self._parse_with_fallback(url)
-             
-             # Fallback if no Firecrawl configured
-             return self._parse_with_fallback(url)
+             return self._parse_web(url)
         else:
              # Local file path
-             return self._parse_with_llama(url)
+             return self._parse_with_llama(url)[0]
+
+    def _parse_web(self, url: str) -> str:
+        """Parse a web URL, going through the fetch cache when enabled."""
+        if self.fetch_cache is None:
+            return self._fetch_and_parse(url)[0]
+        
+        key = DiskCache.make_key("url", url)
+        meta = self.fetch_cache.get_meta(key)
+        cached = self.fetch_cache.read(key, "md") if meta else None
+        
+        if cached is not None:
+            age = time.time() - meta.get("fetched_at", 0)
+            if age < self.fetch_cache_ttl:
+                print(f"Fetch cache hit ({age:.0f}s old): {url}")
+                return cached.decode("utf-8")
+            
+            # Stale: revalidate with the stored validators
+            headers = {}
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+            if headers:
+                try:
+                    resp = self.http.get(url, headers=headers, timeout=10, stream=True)
+                    try:
+                        if resp.status_code == 304:
+                            print(f"Fetch cache revalidated (304): {url}")
+                            self.fetch_cache.update_meta(key, fetched_at=time.time())
+                            return cached.decode("utf-8")
+                        resp.raise_for_status()
+                        if _cached_parser(meta) == "direct":
+                            # Changed upstream: parse the body we just received
+                            markdown, body = self._extract_from_response(resp)
+                            return self._store_fetch(key, url, markdown, resp, body)
+                    finally:
+                        resp.close()
+                except requests.RequestException as e:
+                    print(f"Revalidation failed ({e}). Serving stale cached copy.")
+                    return cached.decode("utf-8")
+                # Changed upstream and parsed by Firecrawl: parse it the same way again
+        
+        markdown, resp, body, validators = self._fetch_and_parse(url)
+        return self._store_fetch(key, url, markdown, resp, body, validators)
+
+    def _fetch_and_parse(self, url: str) -> Tuple[str, Optional[requests.Response], Optional[bytes], Dict]:
+        """
+        Fetch and parse a web page: Firecrawl first, direct fetch as fallback.
+        
+        Returns:
+            (markdown, response, body, validators) - the direct-fetch response
+            and its raw body, if the fallback was used, and any validators
+            Firecrawl reported for the page.
+        """
+        # Determine priority: If URL is web-based, prefer Firecrawl.
+        if self.firecrawl_api_url:
+            try:
+                validators: Dict = {}
+                return self._parse_with_firecrawl(url, validators=validators), None, None, validators
+            except Exception as e:
+                print(f"Firecrawl failed ({e}). Falling back to direct fetch.")
+        
+        # Fallback if Firecrawl failed or is not configured
+        print(f"Parsing with Direct Request Fallback: {url}")
+        response = self._fetch_direct(url)
+        try:
+            markdown, body = self._extract_from_response(response)
+        finally:
+            response.close()
+        return markdown, response, body, {}
+
+    def _store_fetch(self, key: str, url: str, markdown: str, response: Optional[requests.Response],
+                     body: Optional[bytes], validators: Optional[Dict] = None) -> str:
+        """Cache parsed markdown with the page's validators and raw body."""
+        meta = {"url": url, "fetched_at": time.time(),
+                "parser": "direct" if response is not None else "firecrawl"}
+        blobs = {"md": markdown.encode("utf-8")}
+        if response is not None:
+            meta["etag"] = response.headers.get("ETag")
+            meta["last_modified"] = response.headers.get("Last-Modified")
+            if body is not None:
+                blobs["body"] = body
+        else:
+            # Parsed by Firecrawl: without validators from its metadata the
+            # entry is simply refetched once the TTL has passed
+            meta.update(validators or {})
+        
+        try:
+            self.fetch_cache.put(key, blobs, meta)
+        except OSError as e:
+            print(f"Could not write fetch cache: {e}")
+        return markdown
             
     def get_chunks(self, text: str, chunk_size: int = 1024):
         """
@@ -43,13 +149,126 @@ class IngestionService:
         nodes = parser.get_nodes_from_documents([doc])
         return [node.text for node in nodes]
 
-    def _parse_with_llama(self, filepath: str) -> str:
-        """Parse local PDF/document file with LlamaParse or fallback parsers."""
+    def parse_document(self, filepath: str, digest: Optional[str] = None) -> Dict:
+        """
+        Parses a local PDF/document file and reports how the text was produced:
+        {'content', 'parser', 'structured'} - `structured` is True when the
+        parser already emitted markdown structure (LlamaParse, layout-aware
+        PDF extraction), so the LLM clean step can be skipped.
+        """
+        content, parser = self._parse_with_llama(filepath, digest=digest)
+        return {
+            "content": content,
+            "parser": parser,
+            "structured": parser == "llama_parse" or parser in pdf.MARKDOWN_BACKENDS,
+        }
+
+    def _parse_key(self, filepath: str, digest: Optional[str]) -> str:
+        # Layout mode changes the output for the same bytes
+        layout = "layout" if "pymupdf_layout" in pdf.available_backends() else "text"
+        return DiskCache.make_key("parsed", digest or file_digest(filepath), layout)
+
+    def _parse_with_llama(self, filepath: str, digest: Optional[str] = None,
+                          cache_checked: bool = False) -> Tuple[str, str]:
+        """
+        Parse local PDF/document file with LlamaParse or fallback parsers.
+        Results are cached by the SHA-256 of the file bytes, so identical
+        files (re-uploads, indexed copies) are only parsed once.
+        `cache_checked` means the caller already looked the file up and missed.
+        
+        Returns:
+            (content, parser)
+        """
         print(f"Parsing local file: {filepath}")
         
         if not os.path.exists(filepath):
             raise FileNotFoundError(f"File not found: {filepath}")
         
+        if self.parse_cache is None:
+            return self._extract_local(filepath)
+        
+        key = self._parse_key(filepath, digest)
+        if not cache_checked:
+            meta = self.parse_cache.get_meta(key)
+            cached = self.parse_cache.read(key, "md") if meta else None
+            if cached is not None:
+                print(f"Parse cache hit ({meta.get('parser')}): {filepath}")
+                return cached.decode("utf-8"), meta.get("parser", "cache")
+        
+        content, parser = self._extract_local(filepath)
+        try:
+            self.parse_cache.put(key, {"md": content.encode("utf-8")}, {
+                "parser": parser,
+                "filename": os.path.basename(filepath),
+                "chars": len(content),
+                "parsed_at": time.time()
+            })
+        except OSError as e:
+            print(f"Could not write parse cache: {e}")
+        return content, parser
+
+    def iter_file_pages(self, filepath: str, digest: Optional[str] = None) -> Iterator[str]:
+        """
+        Yield a local PDF's text page by page as extraction progresses.
+        
+        Cached documents, and LlamaParse when configured, are yielded as a
+        single piece. Otherwise pages stream from the first local backend
+        that produces text, and the joined result is added to the parse cache.
+        """
+        key = None
+        if self.parse_cache is not None:
+            key = self._parse_key(filepath, digest)
+            meta = self.parse_cache.get_meta(key)
+            cached = self.parse_cache.read(key, "md") if meta else None
+            if cached is not None:
+                yield cached.decode("utf-8")
+                return
+        
+        if self.llama_cloud_api_key:
+            yield self._parse_with_llama(filepath, digest=digest, cache_checked=key is not None)[0]
+            return
+        
+        for backend in pdf.select_backends(filepath):
+            produced = False
+            spool = self._spool_pages(key) if key is not None else None
+            try:
+                for page in pdf.iter_pdf_pages(filepath, backend=backend):
+                    if spool is not None:
+                        spool.write(page)
+                    if page.strip():
+                        produced = True
+                        yield page
+                if produced and spool is not None:
+                    spool.commit(backend, os.path.basename(filepath))
+            except Exception as e:
+                if produced:
+                    raise  # Pages already handed out; don't mix backends
+                print(f"{backend} failed: {e}")
+                continue
+            finally:
+                if spool is not None:
+                    spool.discard()
+            
+            if produced:
+                return
+        
+        raise ValueError(f"Could not extract text from PDF. Install PyMuPDF: pip install pymupdf")
+
+    def _spool_pages(self, key: str) -> Optional["_PageSpool"]:
+        """Temp file collecting extracted pages for the parse cache, or None if it can't be created."""
+        try:
+            return _PageSpool(self.parse_cache, key)
+        except OSError as e:
+            print(f"Could not write parse cache: {e}")
+            return None
+
+    def _extract_local(self, filepath: str) -> Tuple[str, str]:
+        """
+        Run the parser chain on a local file.
+        
+        Returns:
+            (content, parser) - parser is the name of the backend that succeeded.
+        """
         # Try LlamaParse first (if API key available)
         if self.llama_cloud_api_key:
             try:
@@ -62,66 +281,31 @@ class IngestionService:
                 documents = parser.load_data(filepath)
                 content = "\n\n".join([doc.text for doc in documents])
                 if content.strip():
-                    return content
+                    return content, "llama_parse"
                 print("LlamaParse returned empty content, trying fallbacks...")
             except Exception as e:
                 print(f"LlamaParse failed: {e}, trying fallbacks...")
         
-        # Fallback 1: PyMuPDF (fitz) - good for general PDFs
-        try:
-            import fitz  # PyMuPDF
-            print("Attempting PyMuPDF (fitz)...")
-            doc = fitz.open(filepath)
-            text_parts = []
-            for page in doc:
-                text_parts.append(page.get_text())
-            doc.close()
-            content = "\n\n".join(text_parts)
-            if content.strip():
-                print(f"PyMuPDF extracted {len(content)} chars")
-                return content
-        except ImportError:
-            print("PyMuPDF not installed, trying other fallbacks...")
-        except Exception as e:
-            print(f"PyMuPDF failed: {e}")
-        
-        # Fallback 2: pypdf
-        try:
-            from pypdf import PdfReader
-            print("Attempting pypdf...")
-            reader = PdfReader(filepath)
-            text_parts = []
-            for page in reader.pages:
-                text_parts.append(page.extract_text() or "")
-            content = "\n\n".join(text_parts)
-            if content.strip():
-                print(f"pypdf extracted {len(content)} chars")
-                return content
-        except ImportError:
-            print("pypdf not installed, trying other fallbacks...")
-        except Exception as e:
-            print(f"pypdf failed: {e}")
-        
-        # Fallback 3: pdfplumber
-        try:
-            import pdfplumber
-            print("Attempting pdfplumber...")
-            text_parts = []
-            with pdfplumber.open(filepath) as pdf:
-                for page in pdf.pages:
-                    text_parts.append(page.extract_text() or "")
-            content = "\n\n".join(text_parts)
-            if content.strip():
-                print(f"pdfplumber extracted {len(content)} chars")
-                return content
-        except ImportError:
-            print("pdfplumber not installed")
-        except Exception as e:
-            print(f"pdfplumber failed: {e}")
+        # Fallbacks: PyMuPDF (fitz, good for general PDFs), pypdf, pdfplumber,
+        # best-first for this file according to the benchmark profile.
+        # Pages are extracted in parallel ranges by core.pdf.
+        for backend in pdf.select_backends(filepath):
+            try:
+                print(f"Attempting {backend}...")
+                content = pdf.extract_pdf_text(filepath, backend=backend)
+                if content.strip():
+                    print(f"{backend} extracted {len(content)} chars")
+                    return content, backend
+            except Exception as e:
+                print(f"{backend} failed: {e}")
         
         raise ValueError(f"Could not extract text from PDF. Install PyMuPDF: pip install pymupdf")
 
-    def _parse_with_firecrawl(self, url: str) -> str:
+    def _parse_with_firecrawl(self, url: str, validators: Optional[Dict] = None) -> str:
+        """
+        Scrape a page through Firecrawl. If `validators` is given, it is
+        filled with the page's ETag/Last-Modified when Firecrawl reports them.
+        """
         print(f"Parsing with Firecrawl: {url}")
         # Firecrawl API endpoint: /v0/scrape
         payload = {
@@ -131,43 +315,186 @@ class IngestionService:
             }
         }
         # Don't catch exception here, let it propagate to parse_url to trigger fallback
-        response = requests.post(f"{self.firecrawl_api_url}/v0/scrape", json=payload, timeout=5)
+        # Scraping is idempotent, so a failed POST is safe to retry
+        response = self.http.post(
+            f"{self.firecrawl_api_url}/v0/scrape",
+            json=payload,
+            timeout=self.firecrawl_timeout,
+            retries=self.firecrawl_retries,
+            retry_non_idempotent=True
+        )
         response.raise_for_status()
         data = response.json()
         
         if data and 'data' in data and 'markdown' in data['data']:
+            if validators is not None:
+                validators.update(_firecrawl_validators(data['data'].get('metadata') or {}))
             return data['data']['markdown']
         else:
             raise ValueError(f"Firecrawl response missing markdown: {data}")
 
-    def _parse_with_fallback(self, url: str) -> str:
-        """
-        Fallback: Direct simplistic HTML fetch.
-        """
-        print(f"Parsing with Direct Request Fallback: {url}")
+    def _fetch_direct(self, url: str) -> requests.Response:
+        """Streaming GET of a page for the direct-fetch fallback."""
         try:
-            resp = requests.get(url, timeout=10)
-            resp.raise_for_status()
-            
-            # Very basic cleanup without BS4 dependency
-            text = resp.text
-            import re
-            
-            # Remove scripts and styles
-            text = re.sub(r'<script.*?>.*?</script>', '', text, flags=re.DOTALL)
-            text = re.sub(r'<style.*?>.*?</style>', '', text, flags=re.DOTALL)
-            
-            # Simple tag removal
-            clean_text = re.sub(r'<[^>]+>', '\n', text)
-            
-            # Collapse whitespace
-            clean_text = re.sub(r'\n\s*\n', '\n\n', clean_text)
-            
-            return clean_text.strip()
-            
+            resp = self.http.get(url, timeout=10, stream=True)
+            try:
+                resp.raise_for_status()
+            except Exception:
+                resp.close()
+                raise
+            return resp
         except Exception as e:
             raise ConnectionError(f"Failed to fetch content from {url}. Check internet connection. Error: {e}")
 
+    def _extract_from_response(self, resp: requests.Response) -> Tuple[str, bytes]:
+        """
+        Stream a response body through the main-content extractor.
+        
+        Returns:
+            (markdown, raw body bytes)
+        """
+        # requests assumes ISO-8859-1 for text/* without a charset; most
+        # pages without one are UTF-8
+        content_type = resp.headers.get("Content-Type", "").lower()
+        encoding = resp.encoding if resp.encoding and "charset" in content_type else "utf-8"
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        raw_parts: List[bytes] = []
+        
+        def decoded_chunks():
+            for chunk in resp.iter_content(chunk_size=64 * 1024):
+                raw_parts.append(chunk)
+                yield decoder.decode(chunk)
+            yield decoder.decode(b"", final=True)
+        
+        markdown = extract_main_content(decoded_chunks())
+        return markdown, b"".join(raw_parts)
+
+
+class _PageSpool:
+    """
+    Pages appended to a temp file next to a parse cache entry, so caching a
+    streamed document doesn't hold all of its text in memory. commit()
+    moves the file into the entry; otherwise discard() removes it.
+    """
+
+    def __init__(self, cache: DiskCache, key: str):
+        self.cache = cache
+        self.key = key
+        self.chars = 0
+        self._pages = 0
+        self._path = None
+        target = cache.path(key, "md")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, self._path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".tmp-")
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, page: str):
+        if self._file is None:
+            return
+        text = f"\n\n{page}" if self._pages else page
+        try:
+            self._file.write(text.encode("utf-8"))
+        except OSError as e:
+            print(f"Could not write parse cache: {e}")
+            self.discard()
+            return
+        self._pages += 1
+        self.chars += len(text)
+
+    def commit(self, parser: str, filename: str):
+        if self._file is None:
+            return
+        try:
+            self._file.close()
+            self._file = None
+            self.cache.put(self.key, {}, {
+                "parser": parser,
+                "filename": filename,
+                "chars": self.chars,
+                "parsed_at": time.time()
+            })
+            target = self.cache.path(self.key, "md")
+            os.replace(self._path, target)
+            self._path = None
+            if self.cache.add_blob(self.key, "md") is None:
+                os.unlink(target)  # Evicted in the meantime
+        except OSError as e:
+            print(f"Could not write parse cache: {e}")
+
+    def discard(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+        if self._path is not None:
+            try:
+                os.unlink(self._path)
+            except OSError:
+                pass
+            self._path = None
+
+
+def _firecrawl_validators(metadata: Dict) -> Dict[str, str]:
+    """ETag/Last-Modified from Firecrawl page metadata, if it has them."""
+    lowered = {str(k).lower().replace("_", "-"): v for k, v in metadata.items()}
+    validators = {}
+    if isinstance(lowered.get("etag"), str):
+        validators["etag"] = lowered["etag"]
+    last_modified = lowered.get("last-modified") or lowered.get("lastmodified")
+    if isinstance(last_modified, str):
+        validators["last_modified"] = last_modified
+    return validators
+
+
+def _cached_parser(meta: Dict) -> str:
+    """Parser of a fetch cache entry ('direct' or 'firecrawl')."""
+    if meta.get("parser"):
+        return meta["parser"]
+    # Older entries: only direct fetches stored the raw body
+    return "direct" if "body" in meta.get("_blobs", []) else "firecrawl"
+
+
+_fetch_cache: Optional[DiskCache] = None
+
+def _get_fetch_cache() -> Optional[DiskCache]:
+    """Process-wide fetch cache, or None if disabled (FETCH_CACHE_MAX_MB=0)."""
+    global _fetch_cache
+    max_mb = float(os.getenv("FETCH_CACHE_MAX_MB", "256"))
+    if max_mb <= 0:
+        return None
+    if _fetch_cache is None:
+        _fetch_cache = DiskCache(
+            os.getenv("FETCH_CACHE_DIR", "./cache/fetch"),
+            max_bytes=int(max_mb * 1024 * 1024)
+        )
+    return _fetch_cache
+
+
+_parse_cache: Optional[DiskCache] = None
+
+def _get_parse_cache() -> Optional[DiskCache]:
+    """Process-wide parsed-document cache, or None if disabled (PARSE_CACHE_MAX_MB=0)."""
+    global _parse_cache
+    max_mb = float(os.getenv("PARSE_CACHE_MAX_MB", "512"))
+    if max_mb <= 0:
+        return None
+    if _parse_cache is None:
+        _parse_cache = DiskCache(
+            os.getenv("PARSE_CACHE_DIR", "./cache/parsed"),
+            max_bytes=int(max_mb * 1024 * 1024)
+        )
+    return _parse_cache
+
+def file_digest(filepath: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 hex digest of a file's bytes, read in blocks."""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
 
 # Example usage
 if __name__ == "__main__":
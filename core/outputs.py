@@ -0,0 +1,343 @@
+"""
+Conversion outputs.
+The assembly stage stores each converted document once, as canonical
+markdown plus its themed HTML. Downloadable formats (standalone HTML, EPUB,
+PDF) are derived on first request and kept next to it, so a conversion
+that is only read in the browser never pays for a PDF render.
+
+Documents are content-addressed (the same rewrite is stored once) in a
+DiskCache under OUTPUT_FOLDER with an OUTPUT_MAX_MB quota and LRU eviction;
+its metadata doubles as the index (job, style, sizes, created, ETags).
+"""
+import io
+import os
+import re
+import time
+import base64
+import hashlib
+import logging
+import zipfile
+import mimetypes
+import threading
+from collections import Counter
+from html import escape
+from typing import Dict, List, Optional, Tuple
+
+from core.cache import DiskCache
+from core.assembly import Assembler, WEASY_AVAILABLE, render_markdown, split_sections
+
+logger = logging.getLogger(__name__)
+
+# Download format -> content type; each is a blob of the document's entry
+FORMATS = {
+    "md": "text/markdown; charset=utf-8",
+    "html": "text/html; charset=utf-8",
+    "epub": "application/epub+zip",
+    "pdf": "application/pdf",
+}
+# Blob with the canonical themed HTML (links styles.css and images by relative path)
+CANONICAL_HTML = "source.html"
+
+DOC_ID_RE = re.compile(r"^[0-9a-f]{16}$")
+IMG_SRC_RE = re.compile(r'(<img\b[^>]*?\bsrc=")([^"]+)(")')
+STYLESHEET_RE = re.compile(r'<link rel="stylesheet" href="styles\.css">')
+HEADING_RE = re.compile(r"^#{1,2}\s+(.+?)\s*#*\s*$", re.MULTILINE)
+
+
+class FormatUnavailable(RuntimeError):
+    """The format can't be produced here (e.g. PDF without WeasyPrint)."""
+
+
+def _local_image(src: str) -> Optional[str]:
+    """Filesystem path for a relative image reference, if it exists."""
+    if re.match(r"^[a-z][a-z0-9+.-]*:", src, re.IGNORECASE) or src.startswith("/"):
+        return None  # Remote, data: or absolute URL
+    path = os.path.normpath(os.path.join(os.getcwd(), src))
+    return path if os.path.isfile(path) else None
+
+
+def build_standalone_html(canonical_html: str, css: str) -> str:
+    """Single-file HTML: stylesheet inlined, local images embedded as data URIs."""
+    html = STYLESHEET_RE.sub(lambda _: f"<style>\n{css}\n</style>", canonical_html, count=1)
+
+    def embed(match):
+        path = _local_image(match.group(2))
+        if path is None:
+            return match.group(0)
+        mime = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        with open(path, "rb") as f:
+            data = base64.b64encode(f.read()).decode("ascii")
+        return f"{match.group(1)}data:{mime};base64,{data}{match.group(3)}"
+
+    return IMG_SRC_RE.sub(embed, html)
+
+
+def _xhtml_page(title: str, body: str) -> str:
+    return ('<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+            '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="en">\n'
+            f'<head><title>{escape(title)}</title><link rel="stylesheet" type="text/css" href="style.css"/></head>\n'
+            f"<body>\n{body}\n</body>\n</html>\n")
+
+
+def build_epub(content: str, title: str, css: str, identifier: str) -> bytes:
+    """EPUB 3 with one chapter per document section (stdlib zipfile, no extra dependency)."""
+    chapters: List[Tuple[str, str, str]] = []  # (file name, chapter title, xhtml)
+    images: Dict[str, str] = {}  # local path -> name inside the book
+    for index, section in enumerate(split_sections(content), start=1):
+        heading = HEADING_RE.search(section)
+        chapter_title = heading.group(1) if heading else (title if index == 1 else f"Part {index}")
+        body = render_markdown(section)
+
+        def relink(match):
+            path = _local_image(match.group(2))
+            if path is None:
+                return match.group(0)
+            name = images.setdefault(path, f"images/{len(images)}_{os.path.basename(path)}")
+            return f"{match.group(1)}{name}{match.group(3)}"
+
+        body = IMG_SRC_RE.sub(relink, body)
+        if index == 1:
+            body = f"<h1>{escape(title)}</h1>\n{body}"
+        chapters.append((f"chapter_{index:03d}.xhtml", chapter_title, _xhtml_page(chapter_title, body)))
+
+    nav_items = "\n".join(f'<li><a href="{name}">{escape(chapter_title)}</a></li>'
+                          for name, chapter_title, _ in chapters)
+    nav = _xhtml_page(title, f'<nav epub:type="toc" id="toc"><h1>Contents</h1><ol>\n{nav_items}\n</ol></nav>')
+
+    manifest = ['<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>',
+                '<item id="css" href="style.css" media-type="text/css"/>']
+    manifest += [f'<item id="c{i}" href="{name}" media-type="application/xhtml+xml"/>'
+                 for i, (name, _, _) in enumerate(chapters)]
+    manifest += [f'<item id="img{i}" href="{name}" media-type="{mimetypes.guess_type(name)[0] or "image/png"}"/>'
+                 for i, name in enumerate(images.values())]
+    spine = "\n".join(f'<itemref idref="c{i}"/>' for i in range(len(chapters)))
+    modified = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    opf = ('<?xml version="1.0" encoding="utf-8"?>\n'
+           '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="uid">\n'
+           '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+           f'<dc:identifier id="uid">urn:tutorial:{identifier}</dc:identifier>\n'
+           f"<dc:title>{escape(title)}</dc:title>\n<dc:language>en</dc:language>\n"
+           f'<meta property="dcterms:modified">{modified}</meta>\n</metadata>\n'
+           "<manifest>\n" + "\n".join(manifest) + "\n</manifest>\n"
+           f"<spine>\n{spine}\n</spine>\n</package>\n")
+    container = ('<?xml version="1.0" encoding="utf-8"?>\n'
+                 '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">\n'
+                 '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+                 "</rootfiles>\n</container>\n")
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as book:
+        # mimetype must come first and uncompressed
+        book.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        book.writestr("META-INF/container.xml", container, compress_type=zipfile.ZIP_DEFLATED)
+        book.writestr("OEBPS/content.opf", opf, compress_type=zipfile.ZIP_DEFLATED)
+        book.writestr("OEBPS/nav.xhtml", nav, compress_type=zipfile.ZIP_DEFLATED)
+        book.writestr("OEBPS/style.css", css, compress_type=zipfile.ZIP_DEFLATED)
+        for name, _, xhtml in chapters:
+            book.writestr(f"OEBPS/{name}", xhtml, compress_type=zipfile.ZIP_DEFLATED)
+        for path, name in images.items():
+            book.write(path, f"OEBPS/{name}", compress_type=zipfile.ZIP_STORED)  # Already compressed
+    return buffer.getvalue()
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OutputStore:
+    """
+    Converted documents keyed by a digest of their content.
+
+    save() stores the markdown and themed HTML (or finds the identical
+    document already stored); ensure() derives a download format on first
+    use. PDFs go through the render service, and concurrent requests for
+    the same PDF share one render job.
+    """
+
+    def __init__(self, directory: Optional[str] = None, template_dir: str = "templates"):
+        self.directory = directory or os.getenv("OUTPUT_FOLDER", "./cache/outputs")
+        self.template_dir = template_dir
+        max_mb = float(os.getenv("OUTPUT_MAX_MB", "2048"))
+        self.cache = DiskCache(self.directory, max_bytes=int(max_mb * 1024 * 1024))
+        # Reentrant: a render that fails to start finishes (and calls back) inside submit
+        self._lock = threading.RLock()
+        self._format_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._pending: Dict[str, str] = {}  # doc_id -> PDF render job id
+        self.saved = 0
+        self.deduplicated = 0
+        self.generated: Counter = Counter()
+
+    def available_formats(self) -> List[str]:
+        return [fmt for fmt in FORMATS if fmt != "pdf" or WEASY_AVAILABLE]
+
+    def save(self, content: str, title: str, style: str, job: Optional[str] = None) -> str:
+        """Store a converted document (markdown + themed HTML) and return its id."""
+        html = Assembler(self.template_dir).render_html(content, title=title, style=style)
+        doc_id = DiskCache.make_key("output", content, html)[:16]
+        if self.cache.get_meta(doc_id) is not None:
+            with self._lock:
+                self.deduplicated += 1
+            return doc_id
+
+        md = content.encode("utf-8")
+        self.cache.put(doc_id, {"md": md, CANONICAL_HTML: html.encode("utf-8")}, {
+            "id": doc_id, "job": job, "title": title, "style": style, "created": time.time(),
+            "etag_md": hashlib.sha256(md).hexdigest(),
+        })
+        with self._lock:
+            self.saved += 1
+        return doc_id
+
+    def meta(self, doc_id: str) -> Optional[Dict]:
+        """Index entry for a document (marks it as recently used)."""
+        if not DOC_ID_RE.match(doc_id or ""):
+            return None
+        return self.cache.get_meta(doc_id)
+
+    def _read(self, doc_id: str, name: str) -> str:
+        data = self.cache.read(doc_id, name)
+        if data is None:
+            raise KeyError(f"{doc_id}.{name}")
+        return data.decode("utf-8")
+
+    def _css(self) -> str:
+        try:
+            with open(os.path.join(self.template_dir, "styles.css"), "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return ""
+
+    def _output(self, doc_id: str, fmt: str, meta: Dict) -> Optional[Dict]:
+        path = self.cache.path(doc_id, fmt)
+        if fmt not in meta.get("_blobs", []) or not os.path.exists(path):
+            return None
+        return {"path": path, "etag": meta.get(f"etag_{fmt}"), "size": meta.get("_sizes", {}).get(fmt),
+                "created": meta.get("created")}
+
+    def ensure(self, doc_id: str, fmt: str, wait: bool = True) -> Dict:
+        """
+        Make sure `fmt` exists for the document. Returns {'path', 'etag',
+        'size', 'created'} when it is ready, or {'job_id'} for a PDF still
+        rendering when wait=False. Raises KeyError (unknown or evicted
+        document, unknown format), FormatUnavailable, or the render
+        service's errors.
+        """
+        meta = self.meta(doc_id)
+        if meta is None or fmt not in FORMATS:
+            raise KeyError(f"{doc_id}.{fmt}")
+        if fmt not in self.available_formats():
+            raise FormatUnavailable(f"{fmt.upper()} output needs WeasyPrint, which is not installed.")
+        output = self._output(doc_id, fmt, meta)
+        if output is not None:
+            return output
+        if fmt == "pdf":
+            return self._ensure_pdf(doc_id, meta, wait)
+
+        with self._lock:
+            lock = self._format_locks.setdefault((doc_id, fmt), threading.Lock())
+        with lock:
+            meta = self.cache.get_meta(doc_id) or meta
+            output = self._output(doc_id, fmt, meta)
+            if output is None:
+                started = time.perf_counter()
+                if fmt == "html":
+                    data = build_standalone_html(self._read(doc_id, CANONICAL_HTML), self._css()).encode("utf-8")
+                else:
+                    data = build_epub(self._read(doc_id, "md"), meta["title"], self._css(), doc_id)
+                meta = self.cache.add_blob(doc_id, fmt, data, {f"etag_{fmt}": hashlib.sha256(data).hexdigest()})
+                if meta is None:
+                    raise KeyError(f"{doc_id}.{fmt}")  # Evicted meanwhile
+                output = self._output(doc_id, fmt, meta)
+                with self._lock:
+                    self.generated[fmt] += 1
+                logger.info(f"Generated {fmt} for {doc_id} in {time.perf_counter() - started:.2f}s")
+        with self._lock:
+            self._format_locks.pop((doc_id, fmt), None)
+        return output
+
+    def _ensure_pdf(self, doc_id: str, meta: Dict, wait: bool) -> Dict:
+        from core.render import get_render_service, RenderTimeout
+        service = get_render_service()
+        path = self.cache.path(doc_id, "pdf")
+        with self._lock:
+            job_id = self._pending.get(doc_id)
+            if job_id is None or service.status(job_id) is None:
+                # The worker writes the blob in place (temp file + rename);
+                # _pdf_rendered registers it with the entry
+                job_id = service.submit_document(
+                    self._read(doc_id, "md"), meta["title"], meta["style"], path,
+                    on_done=lambda job: self._pdf_rendered(doc_id, path, job))
+                if service.status(job_id)["status"] not in ("done", "failed", "timeout"):
+                    self._pending[doc_id] = job_id
+        if not wait:
+            job = service.status(job_id)
+            if job["status"] not in ("done", "failed", "timeout"):
+                return {"job_id": job_id}
+        job = service.wait(job_id)
+        if job["status"] == "timeout":
+            raise RenderTimeout(job["error"])
+        if job["status"] != "done":
+            raise RuntimeError(f"PDF render failed: {job['error']}")
+        meta = self.cache.get_meta(doc_id)
+        output = self._output(doc_id, "pdf", meta) if meta else None
+        if output is None:
+            raise KeyError(f"{doc_id}.pdf")  # Evicted meanwhile
+        return output
+
+    def _pdf_rendered(self, doc_id: str, path: str, job: Dict):
+        """Render completion: add the PDF to its entry, so it counts against the quota."""
+        with self._lock:
+            if self._pending.get(doc_id) == job["id"]:
+                del self._pending[doc_id]
+        if job["status"] != "done":
+            return
+        meta = self.cache.add_blob(doc_id, "pdf", meta={"etag_pdf": _file_digest(path), "pages": job["pages"]})
+        if meta is None:
+            # Evicted while rendering: don't leave an untracked file behind
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self.generated["pdf"] += 1
+
+    def index(self) -> List[Dict]:
+        """Stored documents, most recently used first."""
+        return [{
+            "id": doc_id,
+            "job": meta.get("job"),
+            "title": meta.get("title"),
+            "style": meta.get("style"),
+            "created": meta.get("created"),
+            "size": meta.get("_size"),
+            "formats": {name: size for name, size in meta.get("_sizes", {}).items() if name in FORMATS},
+        } for doc_id, meta in self.cache.entries().items() if "id" in meta]
+
+    def stats(self) -> Dict:
+        stats = self.cache.stats()
+        with self._lock:
+            stats.update(
+                documents_saved=self.saved,
+                deduplicated=self.deduplicated,
+                generated=dict(self.generated),
+                rendering=len(self._pending),
+                formats=self.available_formats(),
+            )
+        return stats
+
+
+_store: Optional[OutputStore] = None
+_store_lock = threading.Lock()
+
+def get_output_store() -> OutputStore:
+    """Process-wide output store (shares in-flight PDF renders)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = OutputStore()
+        return _store
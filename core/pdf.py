@@ -0,0 +1,318 @@
+"""
+Local PDF text extraction.
+Pages are extracted in ranges across a process pool and yielded in page
+order, so downstream stages can start before the last page is done.
+Backends are tried in an order chosen from benchmark measurements.
+"""
+import os
+import re
+import json
+import importlib
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+# Backends in default fallback order: (name, module that must be importable)
+BACKENDS: List[Tuple[str, str]] = [
+    ("pymupdf_layout", "fitz"),  # Markdown with headings, lists and code (core.pdf_layout)
+    ("pymupdf", "fitz"),
+    ("pypdf", "pypdf"),
+    ("pdfplumber", "pdfplumber"),
+]
+
+
+# Backends whose output is already structured markdown
+MARKDOWN_BACKENDS = {"pymupdf_layout"}
+
+
+def available_backends() -> List[str]:
+    """
+    Names of the backends whose library is installed, in fallback order.
+    PDF_LAYOUT=0 disables layout-aware (markdown) extraction.
+    """
+    layout_enabled = os.getenv("PDF_LAYOUT", "1") != "0"
+    names = []
+    for name, module in BACKENDS:
+        if name in MARKDOWN_BACKENDS and not layout_enabled:
+            continue
+        try:
+            importlib.import_module(module)
+            names.append(name)
+        except ImportError:
+            continue
+    return names
+
+
+# --- Per-backend page counting and range extraction ---
+# Module-level functions so they can be sent to worker processes.
+
+def _count_pymupdf(filepath: str) -> int:
+    import fitz  # PyMuPDF
+    with fitz.open(filepath) as doc:
+        return doc.page_count
+
+def _range_pymupdf(filepath: str, start: int, end: int) -> List[str]:
+    import fitz  # PyMuPDF
+    with fitz.open(filepath) as doc:
+        return [doc[i].get_text() for i in range(start, end)]
+
+def _range_pymupdf_layout(filepath: str, start: int, end: int) -> List[str]:
+    from core.pdf_layout import extract_range
+    return extract_range(filepath, start, end)
+
+def _count_pypdf(filepath: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(filepath).pages)
+
+def _range_pypdf(filepath: str, start: int, end: int) -> List[str]:
+    from pypdf import PdfReader
+    reader = PdfReader(filepath)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+def _count_pdfplumber(filepath: str) -> int:
+    import pdfplumber
+    with pdfplumber.open(filepath) as pdf:
+        return len(pdf.pages)
+
+def _range_pdfplumber(filepath: str, start: int, end: int) -> List[str]:
+    import pdfplumber
+    with pdfplumber.open(filepath) as pdf:
+        return [pdf.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+_COUNTERS: Dict[str, Callable[[str], int]] = {
+    "pymupdf_layout": _count_pymupdf,
+    "pymupdf": _count_pymupdf,
+    "pypdf": _count_pypdf,
+    "pdfplumber": _count_pdfplumber,
+}
+
+_EXTRACTORS: Dict[str, Callable[[str, int, int], List[str]]] = {
+    "pymupdf_layout": _range_pymupdf_layout,
+    "pymupdf": _range_pymupdf,
+    "pypdf": _range_pypdf,
+    "pdfplumber": _range_pdfplumber,
+}
+
+
+# --- Shared worker pool ---
+
+# Pools by worker count, so callers asking for a different size get one
+_executors: Dict[int, ProcessPoolExecutor] = {}
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+
+def _default_workers() -> int:
+    return int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+def _mp_context():
+    # Not forked: the web process has threads (and held locks) of its own
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    """One pool per worker count and process, created on first use (and again after a fork)."""
+    global _executor_pid
+    with _executor_lock:
+        if _executor_pid != os.getpid():
+            _executors.clear()
+            _executor_pid = os.getpid()
+        executor = _executors.get(workers)
+        if executor is None:
+            executor = _executors[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context())
+        return executor
+
+def _drop_executor(workers: int, executor: ProcessPoolExecutor):
+    """Forget a broken pool so the next caller gets a fresh one."""
+    with _executor_lock:
+        if _executors.get(workers) is executor:
+            del _executors[workers]
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def page_count(filepath: str, backend: str = "pymupdf") -> int:
+    return _COUNTERS[backend](filepath)
+
+
+def iter_pdf_pages(filepath: str, backend: str = "pymupdf",
+                   workers: Optional[int] = None, pages_per_task: int = 16) -> Iterator[str]:
+    """
+    Yield the text of each page of a PDF, in page order.
+
+    Large documents are split into page ranges extracted in parallel by a
+    process pool; at most two ranges per worker are in flight, so memory
+    stays bounded while pages are consumed. Small documents, or
+    `workers=1`, are extracted serially in this process.
+    """
+    if backend not in _EXTRACTORS:
+        raise ValueError(f"Unknown PDF backend: {backend}")
+
+    workers = workers or _default_workers()
+    total = page_count(filepath, backend)
+    extract = _EXTRACTORS[backend]
+
+    if workers <= 1 or total < pages_per_task * 2:
+        for start in range(0, total, pages_per_task):
+            yield from extract(filepath, start, min(start + pages_per_task, total))
+        return
+
+    executor = _get_executor(workers)
+    ranges = deque((start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task))
+    in_flight: Deque[Tuple[Tuple[int, int], Future]] = deque()
+    retried = False
+    try:
+        while ranges or in_flight:
+            try:
+                while ranges and len(in_flight) < workers * 2:
+                    in_flight.append((ranges[0], executor.submit(extract, filepath, *ranges[0])))
+                    ranges.popleft()
+                # Wait for the oldest range so pages come out in order
+                pages = in_flight[0][1].result()
+            except BrokenProcessPool:
+                # A worker died (crash or OOM in a native library): rerun the
+                # unfinished ranges once on a fresh pool
+                if retried:
+                    raise
+                retried = True
+                _drop_executor(workers, executor)
+                executor = _get_executor(workers)
+                ranges.extendleft(reversed([page_range for page_range, _ in in_flight]))
+                in_flight.clear()
+                continue
+            in_flight.popleft()
+            yield from pages
+    finally:
+        # Consumer stopped early or a range failed: drop queued work
+        for _, future in in_flight:
+            future.cancel()
+
+
+def extract_pdf_text(filepath: str, backend: str = "pymupdf",
+                     workers: Optional[int] = None) -> str:
+    """Extract a whole PDF with one backend, pages joined by blank lines."""
+    return "\n\n".join(iter_pdf_pages(filepath, backend=backend, workers=workers))
+
+
+# --- Adaptive backend selection ---
+# `python -m benchmarks.pdf_backends --write-profile` measures each backend on
+# a local corpus; the selector uses that profile plus cheap per-file features
+# to decide which backend to try first.
+
+PROFILE_PATH = os.getenv("PDF_BACKEND_PROFILE", "./cache/pdf_backends.json")
+# Backends whose quality is within this band are treated as equal and
+# ordered by speed instead
+QUALITY_BAND = 0.05
+FEATURE_SAMPLE_PAGES = 3
+
+_profile: Optional[Dict] = None
+_profile_mtime: Optional[float] = None
+
+
+def producer_family(producer: Optional[str]) -> str:
+    """Normalise a PDF Producer string ('WeasyPrint 60.1' -> 'weasyprint')."""
+    match = re.match(r"[a-z]+", (producer or "").strip().lower())
+    return match.group(0) if match else "unknown"
+
+
+def pdf_features(filepath: str) -> Dict:
+    """
+    Cheap document features for backend selection: page count, whether the
+    first pages carry a text layer, producer family and file size.
+    Only opens the document and samples a few pages.
+    """
+    features = {
+        "pages": 0,
+        "has_text": None,
+        "producer": "unknown",
+        "encrypted": False,
+        "size_bytes": os.path.getsize(filepath),
+    }
+    try:
+        import fitz  # PyMuPDF
+        with fitz.open(filepath) as doc:
+            features["pages"] = doc.page_count
+            features["encrypted"] = bool(doc.needs_pass)
+            features["producer"] = producer_family((doc.metadata or {}).get("producer"))
+            if not doc.needs_pass:
+                sample = range(min(FEATURE_SAMPLE_PAGES, doc.page_count))
+                features["has_text"] = any(doc[i].get_text().strip() for i in sample)
+        return features
+    except ImportError:
+        pass
+    except Exception:
+        return features
+
+    try:
+        from pypdf import PdfReader
+        reader = PdfReader(filepath)
+        features["encrypted"] = bool(reader.is_encrypted)
+        features["pages"] = len(reader.pages)
+        features["producer"] = producer_family((reader.metadata or {}).get("/Producer"))
+        sample = range(min(FEATURE_SAMPLE_PAGES, len(reader.pages)))
+        features["has_text"] = any((reader.pages[i].extract_text() or "").strip() for i in sample)
+    except Exception:
+        pass
+    return features
+
+
+def load_profile(path: Optional[str] = None) -> Optional[Dict]:
+    """Load the benchmark profile, re-reading it when the file changes."""
+    global _profile, _profile_mtime
+    path = path or PROFILE_PATH
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if _profile is None or mtime != _profile_mtime:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                _profile = json.load(f)
+            _profile_mtime = mtime
+        except (OSError, ValueError):
+            return None
+    return _profile
+
+
+def _rank_key(stats: Optional[Dict]):
+    """Sort key: quality band first (higher is better), then seconds per page."""
+    if not stats:
+        return (1, 0.0, 0.0)  # Unmeasured: after measured backends
+    usable = stats.get("quality", 0.0) * (1.0 - stats.get("empty_rate", 0.0))
+    return (0, -round(usable / QUALITY_BAND), _sec_per_page(stats))
+
+
+def _sec_per_page(stats: Optional[Dict]) -> float:
+    value = (stats or {}).get("sec_per_page")
+    return float("inf") if value is None else value
+
+
+def select_backends(filepath: str, features: Optional[Dict] = None,
+                    profile: Optional[Dict] = None) -> List[str]:
+    """
+    Installed backends ordered best-first for this file.
+
+    Uses per-producer measurements from the profile when there are any for
+    the file's producer, otherwise the corpus-wide ones. Without a text
+    layer every backend returns (almost) nothing, so the cheapest goes
+    first. Otherwise layout-aware (markdown) backends always lead, since
+    the profile's quality score doesn't measure structure; the rest are
+    ranked by the profile. With no profile, the default fallback order is
+    kept.
+    """
+    names = available_backends()
+    profile = profile if profile is not None else load_profile()
+    if not profile or len(names) < 2:
+        return names
+    features = features if features is not None else pdf_features(filepath)
+
+    stats = profile.get("backends", {})
+    by_producer = profile.get("producers", {}).get(features.get("producer", "unknown"))
+    if by_producer and any(name in by_producer for name in names):
+        stats = {**stats, **by_producer}
+
+    if features.get("has_text") is False:
+        return sorted(names, key=lambda n: _sec_per_page(stats.get(n)))
+    return sorted(names, key=lambda n: (n not in MARKDOWN_BACKENDS, _rank_key(stats.get(n))))
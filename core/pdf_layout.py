@@ -0,0 +1,233 @@
+"""
+Layout-aware PDF extraction (PyMuPDF).
+Recovers markdown structure from font sizes, weights, monospace fonts and
+block positions: headings, bullet/numbered lists and fenced code blocks.
+Running headers, footers and page numbers are dropped.
+"""
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+MONO_FONT_RE = re.compile(r"mono|courier|consol|menlo|inconsolata|code|fixed", re.IGNORECASE)
+BULLET_RE = re.compile(r"^(?:[•◦▪▫●○■□‣⁃∙·]\s*|[-–—*]\s+)")
+NUMBERED_RE = re.compile(r"^(\(?\d{1,3}[.)]|\(?[a-z][.)])\s+")
+PAGE_NUMBER_RE = re.compile(r"^(page\s*)?\d+(\s*(of|/)\s*\d+)?$", re.IGNORECASE)
+
+# Share of the page height at the top and bottom where running headers/footers live
+MARGIN_BAND = 0.08
+# Pages sampled per document for font statistics and repeated margin lines
+SAMPLE_PAGES = 24
+# Text this much larger than the body font is a heading
+HEADING_RATIO = 1.15
+MAX_HEADING_CHARS = 150
+
+# PyMuPDF span flags
+FLAG_MONO = 8
+FLAG_BOLD = 16
+
+
+def _line_info(line: Dict) -> Optional[Dict]:
+    """Summarise one PyMuPDF line: text plus its dominant size/weight/font."""
+    spans = [s for s in line["spans"] if s["text"].strip()]
+    if not spans:
+        return None
+    raw = "".join(s["text"] for s in line["spans"]).rstrip()
+    weights = [len(s["text"].strip()) for s in spans]
+    total = sum(weights)
+    sizes = Counter()
+    bold_chars = 0
+    for span, weight in zip(spans, weights):
+        sizes[round(span["size"] * 2) / 2] += weight
+        if span["flags"] & FLAG_BOLD or "bold" in span["font"].lower():
+            bold_chars += weight
+    return {
+        "raw": raw,
+        "text": raw.strip(),
+        "size": sizes.most_common(1)[0][0],
+        "bold": bold_chars * 2 > total,
+        "mono": all(s["flags"] & FLAG_MONO or MONO_FONT_RE.search(s["font"]) for s in spans),
+        "x0": line["bbox"][0],
+        "y0": line["bbox"][1],
+        "y1": line["bbox"][3],
+    }
+
+
+def _page_blocks(page) -> tuple:
+    """(page height, text blocks as lists of line infos) in reading order."""
+    data = page.get_text("dict", sort=True)
+    blocks = []
+    for block in data["blocks"]:
+        if block.get("type", 0) != 0:
+            continue  # Images
+        lines = [info for info in (_line_info(l) for l in block["lines"]) if info]
+        if lines:
+            blocks.append(lines)
+    return data["height"], blocks
+
+
+def _normalize(text: str) -> str:
+    """Margin text with digits masked, so 'Page 3' and 'Page 4' compare equal."""
+    return re.sub(r"\d+", "#", re.sub(r"\s+", " ", text.lower())).strip()
+
+
+def _in_margin(line: Dict, height: float) -> bool:
+    return line["y1"] <= height * MARGIN_BAND or line["y0"] >= height * (1 - MARGIN_BAND)
+
+
+@lru_cache(maxsize=8)
+def _analyze(filepath: str, mtime_ns: int, size: int) -> Dict:
+    """
+    Document-wide layout statistics from a sample of pages: body font size,
+    heading sizes (largest first) and the normalised text of lines that
+    repeat in the page margins. Cached per file version, so each worker
+    process computes it once per document.
+    """
+    import fitz  # PyMuPDF
+    with fitz.open(filepath) as doc:
+        step = max(1, doc.page_count // SAMPLE_PAGES)
+        sample = list(range(0, doc.page_count, step))[:SAMPLE_PAGES]
+        sizes: Counter = Counter()
+        margin_counts: Counter = Counter()
+        for i in sample:
+            height, blocks = _page_blocks(doc[i])
+            seen = set()
+            for block in blocks:
+                for line in block:
+                    sizes[line["size"]] += len(line["text"])
+                    if _in_margin(line, height):
+                        seen.add(_normalize(line["text"]))
+            margin_counts.update(seen)
+
+    body = sizes.most_common(1)[0][0] if sizes else 10.0
+    heading_sizes = sorted((s for s in sizes if s >= body * HEADING_RATIO), reverse=True)
+    repeating = set()
+    if len(sample) >= 3:
+        repeating = {text for text, count in margin_counts.items() if count >= max(2, len(sample) / 2)}
+    return {"body_size": body, "heading_sizes": heading_sizes[:3], "repeating": repeating}
+
+
+def _is_running(line: Dict, height: float, layout: Dict) -> bool:
+    """Running header/footer or bare page number."""
+    if not _in_margin(line, height):
+        return False
+    return PAGE_NUMBER_RE.match(line["text"]) is not None or _normalize(line["text"]) in layout["repeating"]
+
+
+def _segments(lines: List[Dict]) -> List[List[Dict]]:
+    """Split a block where font size, weight or monospace changes."""
+    segments: List[List[Dict]] = []
+    key = None
+    for line in lines:
+        line_key = (line["mono"], line["size"], line["bold"])
+        if segments and line_key == key:
+            segments[-1].append(line)
+        else:
+            segments.append([line])
+            key = line_key
+    return segments
+
+
+def _join(lines: List[Dict]) -> str:
+    """Join wrapped lines into one paragraph, undoing end-of-line hyphenation."""
+    text = ""
+    for line in lines:
+        part = line["text"]
+        if text.endswith("-") and len(text) > 1 and text[-2].isalpha() and part[:1].islower():
+            text = text[:-1] + part
+        else:
+            text = f"{text} {part}" if text else part
+    return text
+
+
+def _heading_level(lines: List[Dict], text: str, layout: Dict) -> int:
+    if len(lines) > 3 or len(text) > MAX_HEADING_CHARS or text.endswith((".", ",", ";")):
+        return 0
+    if PAGE_NUMBER_RE.match(text) or not any(ch.isalpha() for ch in text):
+        return 0
+    levels = layout["heading_sizes"]
+    size = max(line["size"] for line in lines)
+    if size in levels:
+        return levels.index(size) + 1
+    if size >= layout["body_size"] * HEADING_RATIO:
+        return len(levels) or 1
+    # Bold lines at body size are the lowest heading level
+    if all(line["bold"] for line in lines) and len(text) <= 80:
+        return min(len(levels) + 1, 4)
+    return 0
+
+
+def _list_items(lines: List[Dict]) -> Optional[List[str]]:
+    """Markdown list items if the lines start with bullets or numbers, else None."""
+    items: List[List[str]] = []
+    pending_marker = None
+    for line in lines:
+        text = line["text"]
+        bullet = BULLET_RE.match(text)
+        numbered = NUMBERED_RE.match(text)
+        if bullet and not text[bullet.end():]:
+            pending_marker = "-"  # Bullet glyph on a line of its own
+            continue
+        if bullet or numbered:
+            match = bullet or numbered
+            items.append(["-" if bullet else "1.", text[match.end():].strip()])
+        elif pending_marker:
+            items.append([pending_marker, text])
+        elif items:
+            items[-1][1] = _join([{"text": items[-1][1]}, line])
+        else:
+            return None
+        pending_marker = None
+    return [f"{marker} {text}" for marker, text in items] if items else None
+
+
+def render_page(page, layout: Dict) -> str:
+    """Render one PyMuPDF page as markdown using document layout statistics."""
+    height, blocks = _page_blocks(page)
+    out: List[str] = []
+    code: List[Dict] = []  # Pending monospace lines, possibly from several blocks
+
+    def flush_code():
+        if code:
+            # Keep indentation from x offsets (monospace advance ~0.6 em)
+            left = min(line["x0"] for line in code)
+            rendered = [" " * int(round((line["x0"] - left) / (line["size"] * 0.6))) + line["raw"].strip()
+                        for line in code]
+            out.append("```\n" + "\n".join(rendered) + "\n```")
+            code.clear()
+
+    for block in blocks:
+        lines = [line for line in block if not _is_running(line, height, layout)]
+        for segment in _segments(lines):
+            if segment[0]["mono"]:
+                code.extend(segment)
+                continue
+            flush_code()
+
+            text = _join(segment)
+            level = _heading_level(segment, text, layout)
+            if level:
+                out.append(f"{'#' * level} {text}")
+                continue
+            items = _list_items(segment)
+            out.extend(items if items else [text])
+    flush_code()
+
+    # Tight lists, blank lines between everything else
+    parts: List[str] = []
+    for block in out:
+        is_item = block.startswith(("- ", "1. "))
+        if parts and not (is_item and parts[-1].startswith(("- ", "1. "))):
+            parts.append("")
+        parts.append(block)
+    return "\n".join(parts)
+
+
+def extract_range(filepath: str, start: int, end: int) -> List[str]:
+    """Markdown for pages [start, end) of a PDF."""
+    import fitz  # PyMuPDF
+    stat = os.stat(filepath)
+    layout = _analyze(filepath, stat.st_mtime_ns, stat.st_size)
+    with fitz.open(filepath) as doc:
+        return [render_page(doc[i], layout) for i in range(start, end)]
@@ -0,0 +1,326 @@
+"""
+PDF render service.
+Runs WeasyPrint in a pool of worker processes, so a long render neither
+blocks a request thread nor holds the web process's GIL. Submissions are
+bounded (workers + queue slots), every render has a timeout, and render
+time and page counts are tracked for /api/metrics/.
+"""
+import os
+import time
+import uuid
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs kept for status lookups
+MAX_FINISHED_JOBS = 256
+# How often the watchdog checks running renders against their timeout
+WATCHDOG_INTERVAL = 1.0
+
+
+class RenderQueueFull(RuntimeError):
+    """All worker and queue slots are taken."""
+
+
+class RenderTimeout(TimeoutError):
+    """A render ran past its timeout and its worker was stopped."""
+
+
+def _init_worker(template_dir: str):
+    """Load WeasyPrint, stylesheets and fonts once per worker process."""
+    from core.assembly import get_weasy_resources
+    get_weasy_resources(template_dir)
+
+
+def _render(html_content: str, output_path: str, template_dir: str) -> Dict:
+    """Worker entry point for HTML: {'path', 'pages', 'seconds'}."""
+    from core.assembly import Assembler
+    return _write(output_path, lambda tmp_path: Assembler(template_dir).render_pdf(html_content, tmp_path))
+
+
+def _render_document(content: str, title: str, style: str, output_path: str, template_dir: str) -> Dict:
+    """Worker entry point for markdown, rendered by section: also {'sections', 'reused'}."""
+    from core.assembly import Assembler
+    return _write(output_path, lambda tmp_path: Assembler(template_dir).render_sections_pdf(
+        content, title, style, tmp_path))
+
+
+def _write(output_path: str, render_to) -> Dict:
+    started = time.perf_counter()
+    # Write next to the target and rename, so a killed render leaves no partial PDF
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        result = render_to(tmp_path)
+        os.replace(tmp_path, output_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    result["path"] = output_path
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+class PdfRenderService:
+    """
+    Process pool for Assembler.render_pdf.
+
+    submit() (HTML) and submit_document() (markdown, rendered and cached
+    by section) return a job id immediately or raise RenderQueueFull;
+    status() and wait() retrieve the result; render() does both. A
+    ProcessPoolExecutor can't stop a single task, so when a render passes
+    PDF_RENDER_TIMEOUT the pool's workers are terminated and other renders
+    that were running in it are resubmitted once to a fresh pool.
+    """
+
+    def __init__(self, workers: Optional[int] = None, queue_size: Optional[int] = None,
+                 timeout: Optional[float] = None, template_dir: str = "templates"):
+        self.workers = workers or int(os.getenv("PDF_RENDER_WORKERS", "2"))
+        self.queue_size = queue_size if queue_size is not None else int(os.getenv("PDF_RENDER_QUEUE", "8"))
+        self.timeout = timeout or float(os.getenv("PDF_RENDER_TIMEOUT", "120"))
+        self.template_dir = template_dir
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._watchdog: Optional[threading.Thread] = None
+        self._stats = {
+            "submitted": 0, "completed": 0, "failed": 0, "timeouts": 0,
+            "rejected": 0, "resubmitted": 0, "pool_restarts": 0,
+            "render_seconds": 0.0, "max_render_seconds": 0.0, "pages": 0,
+            "sections": 0, "sections_reused": 0,
+        }
+
+    # --- Pool management ---
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Spawned, not forked: the web process has threads (and locks) of its own
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"),
+                                                     initializer=_init_worker, initargs=(self.template_dir,))
+            if self._watchdog is None or not self._watchdog.is_alive():
+                self._watchdog = threading.Thread(target=self._watch, name="pdf-render-watchdog", daemon=True)
+                self._watchdog.start()
+            return self._executor
+
+    def _restart_pool(self, executor: ProcessPoolExecutor):
+        """Terminate a pool's workers; its pending futures fail with BrokenProcessPool."""
+        with self._lock:
+            if self._executor is not executor:
+                return  # Already replaced
+            self._executor = None
+            self._stats["pool_restarts"] += 1
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            try:
+                process.terminate()
+            except Exception:
+                pass
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _watch(self):
+        # A future counts as running once it is handed to the workers' call
+        # queue, which can be up to one render early, so the timeout is
+        # measured from there with that much slack.
+        while True:
+            time.sleep(WATCHDOG_INTERVAL)
+            now = time.monotonic()
+            with self._lock:
+                expired = []
+                for job in self._jobs.values():
+                    future = job.get("future")
+                    if job["status"] != "queued" or future is None or not future.running():
+                        continue
+                    started = job.setdefault("running_since", now)
+                    if now - started > self.timeout:
+                        expired.append(job)
+            for job in expired:
+                logger.warning(f"PDF render {job['id']} exceeded {self.timeout:.0f}s; restarting render workers")
+                job["timed_out"] = True
+                self._restart_pool(job["executor"])
+
+    # --- Jobs ---
+
+    def submit(self, html_content: str, output_path: str, block: float = 0,
+               on_done: Optional[Callable[[Dict], None]] = None) -> str:
+        """
+        Queue an HTML render and return its job id. Waits up to `block`
+        seconds for a free slot. `on_done(status)` runs once the job has
+        finished, before waiters are woken.
+        """
+        return self._submit(_render, (html_content, output_path, self.template_dir), output_path, block, on_done)
+
+    def submit_document(self, content: str, title: str, style: str, output_path: str, block: float = 0,
+                        on_done: Optional[Callable[[Dict], None]] = None) -> str:
+        """Queue a markdown render (section by section, see Assembler.render_sections_pdf)."""
+        return self._submit(_render_document, (content, title, style, output_path, self.template_dir),
+                            output_path, block, on_done)
+
+    def _submit(self, task, args: tuple, output_path: str, block: float,
+                on_done: Optional[Callable[[Dict], None]] = None) -> str:
+        acquired = self._slots.acquire(timeout=block) if block > 0 else self._slots.acquire(blocking=False)
+        if not acquired:
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise RenderQueueFull(f"PDF render queue is full ({self.workers} running, {self.queue_size} queued)")
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "task": task,
+            "args": args,
+            "output_path": output_path,
+            "status": "queued",
+            "submitted_at": time.time(),
+            "result": None,
+            "error": None,
+            "timed_out": False,
+            "resubmitted": False,
+            "on_done": on_done,
+            "done": threading.Event(),
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+            self._stats["submitted"] += 1
+        try:
+            self._start(job)
+        except Exception as e:
+            self._finish(job, "failed", error=str(e))
+        return job["id"]
+
+    def _start(self, job: Dict):
+        executor = self._pool()
+        job["executor"] = executor
+        job.pop("running_since", None)
+        job["future"] = executor.submit(job["task"], *job["args"])
+        job["future"].add_done_callback(lambda future, job=job: self._on_done(job, future))
+
+    def _on_done(self, job: Dict, future):
+        if future.cancelled():
+            error: Optional[BaseException] = CancelledError()
+        else:
+            error = future.exception()
+        if error is None:
+            self._finish(job, "done", result=future.result())
+        elif job["timed_out"]:
+            self._finish(job, "timeout", error=f"Render exceeded {self.timeout:.0f}s")
+        elif isinstance(error, (BrokenProcessPool, CancelledError)) and not job["resubmitted"]:
+            # Collateral of another render's timeout, or a crashed worker: try once more
+            self._restart_pool(job["executor"])
+            job["resubmitted"] = True
+            job["status"] = "queued"
+            with self._lock:
+                self._stats["resubmitted"] += 1
+            try:
+                self._start(job)
+            except Exception as e:
+                self._finish(job, "failed", error=str(e))
+        else:
+            self._finish(job, "failed", error=str(error) or type(error).__name__)
+
+    def _finish(self, job: Dict, status: str, result: Optional[Dict] = None, error: Optional[str] = None):
+        with self._lock:
+            job.update(status=status, result=result, error=error, finished_at=time.time())
+            job["args"] = None  # Free the document once it can't be retried
+            if status == "done":
+                self._stats["completed"] += 1
+                self._stats["render_seconds"] += result["seconds"]
+                self._stats["max_render_seconds"] = max(self._stats["max_render_seconds"], result["seconds"])
+                self._stats["pages"] += result["pages"]
+                self._stats["sections"] += result.get("sections", 0)
+                self._stats["sections_reused"] += result.get("reused", 0)
+            elif status == "timeout":
+                self._stats["timeouts"] += 1
+            else:
+                self._stats["failed"] += 1
+            finished = [job_id for job_id, j in self._jobs.items() if j["done"].is_set()]
+            for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self._jobs[job_id]
+        self._slots.release()
+        callback = job.pop("on_done", None)
+        if callback is not None:
+            try:
+                callback(self.status(job["id"]))
+            except Exception as e:
+                logger.error(f"PDF render {job['id']} completion callback failed: {e}")
+        job["done"].set()
+        if status != "done":
+            logger.error(f"PDF render {job['id']} {status}: {error}")
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        """{'id', 'status', 'path', 'pages', 'seconds', 'error'}, or None for unknown jobs."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            status = job["status"]
+            if status == "queued" and job.get("future") is not None and job["future"].running():
+                status = "running"
+            result = job["result"] or {}
+            return {
+                "id": job_id,
+                "status": status,
+                "path": result.get("path"),
+                "pages": result.get("pages"),
+                "seconds": round(result["seconds"], 3) if "seconds" in result else None,
+                "sections": result.get("sections"),
+                "reused": result.get("reused"),
+                "error": job["error"],
+            }
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Block until the job finishes (or `timeout` passes) and return its status."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            job["done"].wait(timeout)
+        return self.status(job_id)
+
+    def render(self, html_content: str, output_path: str, block: float = 0) -> Dict:
+        """Submit and wait. Raises RenderQueueFull, RenderTimeout or RuntimeError."""
+        job_id = self.submit(html_content, output_path, block=block)
+        # The watchdog bounds each render, so this wait ends
+        status = self.wait(job_id)
+        if status["status"] == "timeout":
+            raise RenderTimeout(status["error"])
+        if status["status"] != "done":
+            raise RuntimeError(f"PDF render failed: {status['error']}")
+        return status
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            active = [j for j in self._jobs.values() if not j["done"].is_set()]
+        completed = stats["completed"]
+        stats.update(
+            workers=self.workers,
+            queue_size=self.queue_size,
+            timeout=self.timeout,
+            in_flight=len(active),
+            render_seconds=round(stats["render_seconds"], 3),
+            max_render_seconds=round(stats["max_render_seconds"], 3),
+            avg_render_seconds=round(stats["render_seconds"] / completed, 3) if completed else 0.0,
+            avg_pages=round(stats["pages"] / completed, 1) if completed else 0.0,
+            seconds_per_page=round(stats["render_seconds"] / stats["pages"], 4) if stats["pages"] else 0.0,
+        )
+        return stats
+
+
+_service: Optional[PdfRenderService] = None
+_service_pid: Optional[int] = None
+_service_lock = threading.Lock()
+
+def get_render_service() -> PdfRenderService:
+    """Process-wide render service (one worker pool per web process)."""
+    global _service, _service_pid
+    with _service_lock:
+        if _service is None or _service_pid != os.getpid():
+            _service = PdfRenderService()
+            _service_pid = os.getpid()
+        return _service
@@ -0,0 +1,181 @@
+"""
+End-to-end conversion result cache.
+Rewritten tutorials are cached by a digest of the normalised inputs: the
+ingested source content, style, vision strategy, custom prompt, output
+options and model configuration. A hit skips the whole workflow, and
+identical requests that arrive while one is running wait for its result
+instead of starting their own.
+"""
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core.cache import DiskCache
+
+logger = logging.getLogger(__name__)
+
+# Bump when a workflow change should invalidate cached results
+RESULT_VERSION = 1
+
+
+def model_config() -> Dict:
+    """Settings besides the request that change the rewritten output."""
+    return {
+        # Model names as LLMEngine resolves them
+        "llm_provider": os.getenv("LLM_PROVIDER", "local"),
+        "local_model": os.getenv("OLLAMA_MODEL", "llama3.1:8b"),
+        "remote_model": os.getenv("REMOTE_MODEL", "gpt-4o"),
+        "vision_provider": os.getenv("VISION_PROVIDER", "local"),
+        "comfyui_checkpoint": os.getenv("COMFYUI_CHECKPOINT", "flux1-schnell.safetensors"),
+        "image_format": os.getenv("IMAGE_FORMAT", "jpeg"),
+        "image_quality": os.getenv("IMAGE_QUALITY", "82"),
+        "image_scale": os.getenv("IMAGE_SCALE", "1.0"),
+        "cache_version": os.getenv("CONVERT_CACHE_VERSION", ""),
+    }
+
+
+def normalize_inputs(style: str, vision_strategy: str, custom_prompt: str,
+                     output_options: List[str]) -> Dict:
+    """Canonical form of the request options, so trivially different requests share a key."""
+    return {
+        "style": (style or "pro").strip().lower(),
+        "vision_strategy": (vision_strategy or "").strip().lower(),
+        "custom_prompt": re.sub(r"\s+", " ", custom_prompt or "").strip(),
+        "output_options": sorted({option.strip() for option in output_options or [] if option.strip()}),
+    }
+
+
+class _Flight:
+    """One conversion in progress, shared by identical requests."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[Dict] = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class ResultCache:
+    """
+    DiskCache of rewritten markdown (CONVERT_CACHE_DIR, CONVERT_CACHE_MAX_MB,
+    entries older than CONVERT_CACHE_TTL seconds are recomputed) plus the
+    table of conversions in flight. With the cache disabled, in-flight
+    requests are still coalesced.
+    """
+
+    def __init__(self):
+        max_mb = float(os.getenv("CONVERT_CACHE_MAX_MB", "256"))
+        self.ttl = float(os.getenv("CONVERT_CACHE_TTL", str(7 * 24 * 3600)))
+        self.cache = None
+        if max_mb > 0:
+            self.cache = DiskCache(os.getenv("CONVERT_CACHE_DIR", "./cache/results"),
+                                   max_bytes=int(max_mb * 1024 * 1024))
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, _Flight] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def make_key(source: str, options: Dict, structured: bool = False) -> str:
+        """Key from the ingested source text and normalised options (see normalize_inputs)."""
+        source_digest = hashlib.sha256(source.encode("utf-8")).hexdigest()
+        return DiskCache.make_key("convert", RESULT_VERSION, source_digest, options, structured, model_config())
+
+    def get(self, key: str) -> Optional[Dict]:
+        if self.cache is None:
+            return None
+        meta = self.cache.get_meta(key)
+        if meta is None:
+            return None
+        if self.ttl > 0 and time.time() - meta.get("created", 0) > self.ttl:
+            self.cache.delete(key)
+            return None
+        data = self.cache.read(key, "md")
+        if data is None:
+            return None
+        return {"markdown": data.decode("utf-8"), "created": meta.get("created")}
+
+    def put(self, key: str, result: Dict):
+        """Store a result; degraded ones (a step fell back, see result['degraded']) are not cached."""
+        if self.cache is None or not result.get("markdown"):
+            return
+        if result.get("degraded"):
+            logger.info(f"Not caching degraded conversion ({', '.join(result['degraded'])})")
+            return
+        self.cache.put(key, {"md": result["markdown"].encode("utf-8")},
+                       {"created": time.time(), "style": result.get("style")})
+
+    def run(self, key: str, compute: Callable[[], Dict], refresh: bool = False) -> Tuple[Dict, str]:
+        """
+        Cached result for `key`, or compute() it once for all concurrent
+        callers. Returns (result, 'hit' | 'coalesced' | 'computed'); errors
+        from compute() are raised in every waiting caller.
+        """
+        if not refresh:
+            cached = self.get(key)
+            if cached is not None:
+                with self._lock:
+                    self.hits += 1
+                return cached, "hit"
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self.misses += 1
+            else:
+                flight.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            logger.info(f"Waiting for identical conversion in progress ({key[:12]})")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, "coalesced"
+
+        try:
+            flight.result = compute()
+            try:
+                self.put(key, flight.result)
+            except OSError as e:
+                logger.warning(f"Could not cache conversion result: {e}")
+            return flight.result, "computed"
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.done.set()
+
+    def stats(self) -> Dict:
+        stats = self.cache.stats() if self.cache is not None else {"enabled": False}
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            stats.update(
+                result_hits=self.hits,
+                computed=self.misses,
+                coalesced=self.coalesced,
+                in_flight=len(self._inflight),
+                served_without_workflow=round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            )
+        return stats
+
+
+_results: Optional[ResultCache] = None
+_results_lock = threading.Lock()
+
+def get_result_cache() -> ResultCache:
+    """Process-wide result cache (in-flight conversions are coalesced per process)."""
+    global _results
+    with _results_lock:
+        if _results is None:
+            _results = ResultCache()
+        return _results
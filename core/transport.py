@@ -0,0 +1,194 @@
+"""
+Shared HTTP transport for outbound calls.
+One keep-alive session per process with per-host connection pools,
+retries with jittered exponential backoff, per-host concurrency limits
+and counters for connection reuse and retries.
+"""
+import os
+import time
+import random
+import logging
+import weakref
+import threading
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Retried for idempotent requests (and for others when asked explicitly)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class HttpTransport:
+    def __init__(self):
+        self.max_retries = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+        self.backoff_base = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+        self.backoff_max = float(os.getenv("HTTP_BACKOFF_MAX", "10"))
+        self.max_per_host = int(os.getenv("HTTP_MAX_PER_HOST", "8"))
+
+        self.session = requests.Session()
+        # Retries are handled here (with jitter and metrics), not by urllib3
+        self.adapter = HTTPAdapter(
+            pool_connections=int(os.getenv("HTTP_POOL_HOSTS", "32")),
+            pool_maxsize=self.max_per_host,
+            max_retries=0,
+        )
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+        self._lock = threading.Lock()
+        self._host_limits: Dict[str, threading.BoundedSemaphore] = {}
+        self._host_stats: Dict[str, Dict[str, int]] = {}
+
+    def _host_of(self, url: str) -> str:
+        parts = urlsplit(url)
+        return parts.netloc or parts.path
+
+    def _limit_for(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.max_per_host)
+                self._host_stats[host] = {"requests": 0, "retries": 0, "errors": 0}
+            return self._host_limits[host]
+
+    def _count(self, host: str, key: str):
+        with self._lock:
+            self._host_stats[host][key] += 1
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After when given."""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method: str, url: str, retries: Optional[int] = None,
+                retry_non_idempotent: bool = False, **kwargs: Any) -> requests.Response:
+        """
+        Send a request through the shared session.
+
+        Connection errors, timeouts and 429/5xx responses are retried up to
+        `retries` times (default HTTP_MAX_RETRIES) for idempotent methods;
+        set `retry_non_idempotent` to retry e.g. a POST that is safe to repeat.
+        The final response is returned as-is (call raise_for_status as usual).
+        A `stream=True` response holds its per-host slot until it is closed.
+        """
+        method = method.upper()
+        host = self._host_of(url)
+        limit = self._limit_for(host)
+        retries = self.max_retries if retries is None else retries
+        can_retry = method in IDEMPOTENT_METHODS or retry_non_idempotent
+        kwargs.setdefault("timeout", 10)
+
+        attempt = 0
+        while True:
+            self._count(host, "requests")
+            response = None
+            limit.acquire()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                limit.release()
+                self._count(host, "errors")
+                if not can_retry or attempt >= retries:
+                    raise
+                logger.info(f"{method} {url} failed ({e}); retry {attempt + 1}/{retries}")
+            except BaseException:
+                limit.release()
+                raise
+            else:
+                if kwargs.get("stream"):
+                    # The body is still to be read over this connection
+                    self._hold_until_closed(response, limit)
+                else:
+                    limit.release()
+
+            if response is not None:
+                if response.status_code not in RETRY_STATUSES or not can_retry or attempt >= retries:
+                    return response
+                logger.info(f"{method} {url} returned {response.status_code}; retry {attempt + 1}/{retries}")
+                response.close()
+
+            self._count(host, "retries")
+            time.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    @staticmethod
+    def _hold_until_closed(response: requests.Response, limit: threading.BoundedSemaphore):
+        """Keep a host slot until a streamed response is closed (or garbage collected)."""
+        released = []
+        release_lock = threading.Lock()
+
+        def release():
+            with release_lock:
+                if not released:
+                    released.append(True)
+                    limit.release()
+
+        # Weak reference: the wrapper must not keep the response alive
+        response_ref = weakref.ref(response)
+
+        def close():
+            current = response_ref()
+            try:
+                if current is not None:
+                    requests.Response.close(current)
+            finally:
+                release()
+
+        response.close = close
+        weakref.finalize(response, release)
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def head(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("HEAD", url, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Per-host request/retry/error counts plus connection reuse taken from
+        the urllib3 pools (connections opened vs. requests served).
+        """
+        with self._lock:
+            hosts = {host: dict(counts) for host, counts in self._host_stats.items()}
+
+        connections_opened = requests_served = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections_opened += pool.num_connections
+            requests_served += pool.num_requests
+
+        return {
+            "hosts": hosts,
+            "requests": sum(h["requests"] for h in hosts.values()),
+            "retries": sum(h["retries"] for h in hosts.values()),
+            "errors": sum(h["errors"] for h in hosts.values()),
+            "connections_opened": connections_opened,
+            "connections_reused": max(requests_served - connections_opened, 0),
+        }
+
+
+_transport: Optional[HttpTransport] = None
+_transport_pid: Optional[int] = None
+_transport_lock = threading.Lock()
+
+def get_transport() -> HttpTransport:
+    """Process-wide transport (rebuilt after a fork so sockets aren't shared)."""
+    global _transport, _transport_pid
+    with _transport_lock:
+        if _transport is None or _transport_pid != os.getpid():
+            _transport = HttpTransport()
+            _transport_pid = os.getpid()
+        return _transport
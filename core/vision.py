@@ -1,113 +1,165 @@
 import os
 import time
-import json
-import base64
-import requests
-import uuid
+from typing import Dict, List, Optional
+
+from core.cache import DiskCache
+from core.comfy import build_workflow, get_comfy_client, merge_workflows
+from core.transport import get_transport
+
+# Returned when no image backend produced an image
+PLACEHOLDER_IMAGE = b"placeholder_image"
 
 class VisionClient:
     def __init__(self):
         self.provider = os.getenv("VISION_PROVIDER", "local")
-        self.comfy_url = os.getenv("COMFYUI_BASE_URL", "http://localhost:8188")
         self.remote_api_key = os.getenv("STABILITY_API_KEY") or os.getenv("OPENAI_API_KEY")
+        self.http = get_transport()
+        self.image_cache = _get_image_cache()
+        self.batch_size = max(1, int(os.getenv("COMFYUI_BATCH_SIZE", "4")))
         
     def generate_image(self, prompt: str, style: str = "photorealistic") -> bytes:
         """
         Generates an image. Returns bytes.
         """
-        if self.provider == "local":
-            try:
-                return self._generate_comfy(prompt)
-            except Exception as e:
-                print(f"ComfyUI failed: {e}. Falling back to remote.")
-                return self._generate_remote(prompt)
-        else:
-            return self._generate_remote(prompt)
+        return self.generate_images([prompt], style=style)[0]
 
-    def _generate_comfy(self, prompt: str) -> bytes:
-        print(f"Generating image with ComfyUI: {prompt}")
+    def generate_images(self, prompts: List[str], style: str = "photorealistic") -> List[bytes]:
+        """
+        Generates one image per prompt, in order.
         
-        # Load Workflow Template (Mock)
-        # In reality, load a JSON file with the graph.
-        # Minimal Workflow for Text to Image
-        prompt_id = str(uuid.uuid4())
+        ComfyUI images are cached by their full workflow (prompt, style,
+        model, seed, size, sampler settings), so repeated prompts are served
+        without running diffusion again. Misses are queued at once; any that
+        fail fall back to the remote provider.
+        """
+        if self.provider != "local":
+            return [self._generate_remote(prompt) for prompt in prompts]
         
-        # NOTE: This defines a VERY basic ComfyUI payload structure.
-        # Actual ComfyUI API requires "prompt" object with node links.
-        # We assume a standard endpoint or simplified wrapper here.
-        # If using standard ComfyUI, we POST to /prompt
+        workflows = [build_workflow(self._styled_prompt(prompt, style)) for prompt in prompts]
+        keys = [DiskCache.make_key("comfy", workflow) for workflow in workflows]
+        images: List[Optional[bytes]] = [self._cached_image(key) for key in keys]
         
-        # Mocking the payload structure (simplification)
-        payload = {
-            "prompt": {
-                "3": {
-                    "inputs": {
-                        "seed": 156680208700286,
-                        "steps": 20,
-                        "cfg": 8,
-                        "sampler_name": "euler",
-                        "scheduler": "normal",
-                        "denoise": 1,
-                        "model": ["4", 0],
-                        "positive": ["6", 0],
-                        "negative": ["7", 0],
-                        "latent_image": ["5", 0]
-                    },
-                    "class_type": "KSampler"
-                },
-                "4": {
-                    "inputs": {"ckpt_name": "flux1-schnell.safetensors"},
-                    "class_type": "CheckpointLoaderSimple"
-                },
-                "6": {
-                    "inputs": {"text": prompt, "clip": ["4", 1]},
-                    "class_type": "CLIPTextEncode"
-                },
-                "7": {
-                    "inputs": {"text": "text, watermark", "clip": ["4", 1]},
-                    "class_type": "CLIPTextEncode"
-                },
-                "5": {
-                    "inputs": {"width": 1024, "height": 1024, "batch_size": 1},
-                    "class_type": "EmptyLatentImage"
-                },
-                "8": {
-                    "inputs": {"samples": ["3", 0], "vae": ["4", 2]},
-                    "class_type": "VAEDecode"
-                },
-                "9": {
-                    "inputs": {"filename_prefix": "ComfyUI", "images": ["8", 0]},
-                    "class_type": "SaveImage"
-                }
-            }
-        }
+        # Identical requests within one call are generated once
+        missing: Dict[str, List[int]] = {}
+        for i, (key, image) in enumerate(zip(keys, images)):
+            if image is None:
+                missing.setdefault(key, []).append(i)
+        hits = sum(1 for image in images if image is not None)
+        if hits:
+            print(f"Image cache: {hits}/{len(prompts)} hits")
+        if not missing:
+            return images
         
-        # Send to queue
+        todo = [indices[0] for indices in missing.values()]
+        try:
+            results = self._generate_comfy([workflows[i] for i in todo])
+        except Exception as e:
+            print(f"ComfyUI failed: {e}. Falling back to remote.")
+            results = [None] * len(todo)
+        
+        for (key, indices), result in zip(missing.items(), results):
+            prompt = prompts[indices[0]]
+            if result and result["images"]:
+                image = result["images"][0]
+                self._store_image(key, image, prompt, style, workflows[indices[0]])
+            else:
+                if result:
+                    print(f"ComfyUI failed for '{prompt}': {result['error']}. Falling back to remote.")
+                image = self._generate_remote(prompt)
+            for i in indices:
+                images[i] = image
+        return images
+
+    def _styled_prompt(self, prompt: str, style: str) -> str:
+        return f"{prompt}, {style} style" if style else prompt
+
+    def _cached_image(self, key: str) -> Optional[bytes]:
+        if self.image_cache is None:
+            return None
+        meta = self.image_cache.get_meta(key)
+        return self.image_cache.read(key, "png") if meta else None
+
+    def _store_image(self, key: str, image: bytes, prompt: str, style: str, workflow: Dict):
+        if self.image_cache is None:
+            return
         try:
-            p = {"prompt": payload["prompt"], "client_id": "client_1"}
-            # response = requests.post(f"{self.comfy_url}/prompt", json=p)
-            # response.raise_for_status()
-            # In a real impl, we listen to WS for completion or poll /history
-            # For this plan, we mock return after "generation"
-            time.sleep(1) # Sim generation
-            
-            # Retrieve latest image (Simulated)
-            # In real code: fetch info, get filename, download from /view
-            return b"fake_image_bytes_comfy"
-            
-        except requests.exceptions.ConnectionError:
-            raise ConnectionError("ComfyUI not reachable")
+            self.image_cache.put(key, {"png": image}, {
+                "prompt": prompt,
+                "style": style,
+                "model": workflow["4"]["inputs"]["ckpt_name"],
+                "seed": workflow["3"]["inputs"]["seed"],
+                "created_at": time.time()
+            })
+        except OSError as e:
+            print(f"Could not write image cache: {e}")
+
+    def _generate_comfy(self, workflows: List[Dict]) -> List[Dict]:
+        """
+        Run workflows on ComfyUI, returning one result per workflow.
+        Workflows that share a checkpoint and image size are merged into
+        submissions of up to COMFYUI_BATCH_SIZE images, so the model is
+        loaded once and each image skips its own queue round trip.
+        """
+        groups: Dict[tuple, List[int]] = {}
+        for i, workflow in enumerate(workflows):
+            latent = workflow["5"]["inputs"]
+            compatible = (workflow["4"]["inputs"]["ckpt_name"], latent["width"], latent["height"])
+            groups.setdefault(compatible, []).append(i)
+        
+        batches: List[List[int]] = []
+        for indices in groups.values():
+            for start in range(0, len(indices), self.batch_size):
+                batches.append(indices[start:start + self.batch_size])
+        
+        graphs, outputs = [], []
+        for batch in batches:
+            graph, save_nodes = merge_workflows([workflows[i] for i in batch])
+            graphs.append(graph)
+            outputs.append(save_nodes)
+        
+        print(f"Generating {len(workflows)} image(s) with ComfyUI in {len(batches)} submission(s)")
+        client = get_comfy_client()
+        results: List[Optional[Dict]] = [None] * len(workflows)
+        retry: List[int] = []
+        for batch, run in zip(batches, client.run(graphs, outputs=outputs)):
+            if run["error"] and len(batch) > 1:
+                retry.extend(batch)  # One bad prompt fails the whole graph
+                continue
+            for position, i in enumerate(batch):
+                images = run["outputs"][position] if run["outputs"] else []
+                results[i] = {"prompt_id": run["prompt_id"], "images": images, "error": run["error"]}
+        
+        if retry:
+            print(f"Batched submission failed; retrying {len(retry)} image(s) one by one")
+            for i, run in zip(retry, client.run([workflows[i] for i in retry])):
+                results[i] = run
+        return results
 
     def _generate_remote(self, prompt: str) -> bytes:
         print(f"Generating image with Remote API: {prompt}")
         if not self.remote_api_key:
              print("No remote API key. Returning placeholder.")
-             return b"placeholder_image"
+             return PLACEHOLDER_IMAGE
              
         # Example OpenAI DALL-E 3 call logic (simplified)
-        # response = requests.post("https://api.openai.com/v1/images/generations", ...)
+        # response = self.http.post("https://api.openai.com/v1/images/generations", ...)
         return b"fake_image_bytes_remote"
 
+_image_cache: Optional[DiskCache] = None
+
+def _get_image_cache() -> Optional[DiskCache]:
+    """Process-wide generated-image cache, or None if disabled (IMAGE_CACHE_MAX_MB=0)."""
+    global _image_cache
+    max_mb = float(os.getenv("IMAGE_CACHE_MAX_MB", "1024"))
+    if max_mb <= 0:
+        return None
+    if _image_cache is None:
+        _image_cache = DiskCache(
+            os.getenv("IMAGE_CACHE_DIR", "./cache/images"),
+            max_bytes=int(max_mb * 1024 * 1024)
+        )
+    return _image_cache
+
 if __name__ == "__main__":
     client = VisionClient()
     # img = client.generate_image("A futuristic city")
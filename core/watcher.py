@@ -0,0 +1,264 @@
+"""
+RAG Folder Watcher
+Long-running indexer mode that keeps the knowledge base in sync with the
+RAG folder by applying file create/modify/delete events incrementally.
+
+Usage:
+    python -m core.watcher [--folder PATH] [--poll] [--debounce SECONDS]
+"""
+import os
+import time
+import logging
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from core.indexer import DocumentIndexer, SUPPORTED_EXTENSIONS, get_indexer
+
+logger = logging.getLogger(__name__)
+
+try:
+    # watchdog uses inotify on Linux (FSEvents/ReadDirectoryChangesW elsewhere)
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG_AVAILABLE = True
+except Exception:
+    WATCHDOG_AVAILABLE = False
+    FileSystemEventHandler = object
+
+
+class FolderWatcher:
+    """
+    Watches a DocumentIndexer's RAG folder and re-indexes changed files.
+
+    Events are debounced per path: a file is only (re)indexed once it has
+    been quiet for `debounce` seconds, so editors writing in several steps
+    and large copies in progress trigger a single update.
+    """
+
+    def __init__(self, indexer: Optional[DocumentIndexer] = None,
+                 debounce: float = 2.0, poll_interval: float = 5.0,
+                 use_polling: bool = False):
+        self.indexer = indexer or get_indexer()
+        self.rag_folder = os.path.abspath(self.indexer.rag_folder)
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_polling = use_polling or not WATCHDOG_AVAILABLE
+
+        # path -> (action, time of last event); action is 'upsert' or 'delete'
+        self._pending: Dict[str, Tuple[str, float]] = {}
+        self._pending_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._observer = None
+        self._snapshot: Dict[str, Tuple[float, int]] = {}
+        self.stats = {"indexed": 0, "removed": 0, "skipped": 0, "failed": 0}
+
+    # --- Event intake ---
+
+    def _is_relevant(self, path: str) -> bool:
+        """Only supported, non-hidden files inside the RAG folder."""
+        rel = os.path.relpath(path, self.rag_folder)
+        if rel.startswith('..'):
+            return False
+        if any(part.startswith('.') for part in Path(rel).parts):
+            return False
+        return Path(path).suffix.lower() in SUPPORTED_EXTENSIONS
+
+    def notify(self, path: str, action: str):
+        """Queue a debounced 'upsert' or 'delete' for `path`."""
+        path = os.path.abspath(path)
+        if not self._is_relevant(path):
+            return
+        with self._pending_lock:
+            self._pending[path] = (action, time.monotonic())
+
+    def notify_directory(self, path: str, action: str):
+        """
+        Queue events for a whole directory: a 'delete' for every indexed
+        file that was under it, or an 'upsert' for every file now in it.
+        """
+        path = os.path.abspath(path)
+        if action == "delete":
+            prefix = os.path.relpath(path, self.rag_folder) + os.sep
+            for source in self.indexer.indexed_sources():
+                if source.startswith(prefix):
+                    self.notify(os.path.join(self.rag_folder, source), "delete")
+            return
+        for root, dirs, files in os.walk(path):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for filename in files:
+                self.notify(os.path.join(root, filename), "upsert")
+
+    # --- Polling fallback ---
+
+    def _take_snapshot(self) -> Dict[str, Tuple[float, int]]:
+        """Stat every relevant file (mtime, size) without reading contents."""
+        snapshot = {}
+        stack = [self.rag_folder]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.name.startswith('.'):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif Path(entry.name).suffix.lower() in SUPPORTED_EXTENSIONS:
+                            try:
+                                st = entry.stat()
+                                snapshot[entry.path] = (st.st_mtime, st.st_size)
+                            except OSError:
+                                continue
+            except OSError:
+                continue
+        return snapshot
+
+    def _poll_once(self):
+        current = self._take_snapshot()
+        for path, sig in current.items():
+            if self._snapshot.get(path) != sig:
+                self.notify(path, "upsert")
+        for path in self._snapshot.keys() - current.keys():
+            self.notify(path, "delete")
+        self._snapshot = current
+
+    # --- Applying events ---
+
+    def _due_events(self) -> Dict[str, str]:
+        """Pop events whose path has been quiet for at least `debounce`."""
+        now = time.monotonic()
+        due = {}
+        with self._pending_lock:
+            for path, (action, last_seen) in list(self._pending.items()):
+                if now - last_seen >= self.debounce:
+                    due[path] = action
+                    del self._pending[path]
+        return due
+
+    def _apply(self, events: Dict[str, str]):
+        for path, action in events.items():
+            if action == "upsert" and not os.path.exists(path):
+                action = "delete"
+            try:
+                if action == "delete":
+                    if self.indexer.remove_file(path):
+                        self.stats["removed"] += 1
+                else:
+                    outcome, error = self.indexer.index_file(path)
+                    self.stats[outcome] += 1
+                    if error:
+                        logger.warning(f"Watcher could not index {path}: {error}")
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"Watcher failed on {path}: {e}")
+        if events:
+            self.indexer.save()
+            logger.info(f"Watcher applied {len(events)} change(s): {self.stats}")
+
+    # --- Lifecycle ---
+
+    def start(self, initial_scan: bool = True):
+        """Start watching (non-blocking)."""
+        os.makedirs(self.rag_folder, exist_ok=True)
+        if initial_scan:
+            # Catch up on changes made while nothing was watching
+            self.indexer.index_folder()
+
+        if self.use_polling:
+            logger.info(f"Watching {self.rag_folder} by polling every {self.poll_interval}s")
+            self._snapshot = self._take_snapshot()
+        else:
+            logger.info(f"Watching {self.rag_folder} with filesystem events")
+            self._observer = Observer()
+            self._observer.schedule(_EventHandler(self), self.rag_folder, recursive=True)
+            self._observer.start()
+
+        self._stop.clear()
+        threading.Thread(target=self._loop, name="rag-watcher", daemon=True).start()
+
+    def _loop(self):
+        tick = min(self.debounce, 1.0) or 0.5
+        last_poll = time.monotonic()
+        while not self._stop.wait(tick):
+            if self.use_polling and time.monotonic() - last_poll >= self.poll_interval:
+                self._poll_once()
+                last_poll = time.monotonic()
+            self._apply(self._due_events())
+
+    def stop(self):
+        """Stop watching and flush any pending events."""
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        with self._pending_lock:
+            remaining = {path: action for path, (action, _) in self._pending.items()}
+            self._pending.clear()
+        self._apply(remaining)
+
+    def run_forever(self, initial_scan: bool = True):
+        """Start watching and block until interrupted."""
+        self.start(initial_scan=initial_scan)
+        try:
+            while not self._stop.is_set():
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+class _EventHandler(FileSystemEventHandler):
+    """Translates watchdog events into watcher notifications."""
+
+    def __init__(self, watcher: FolderWatcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if event.is_directory:
+            # Usually a directory moved in from outside the watched tree
+            self.watcher.notify_directory(event.src_path, "upsert")
+        else:
+            self.watcher.notify(event.src_path, "upsert")
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.src_path, "upsert")
+
+    def on_deleted(self, event):
+        if event.is_directory:
+            self.watcher.notify_directory(event.src_path, "delete")
+        else:
+            self.watcher.notify(event.src_path, "delete")
+
+    def on_moved(self, event):
+        # A moved directory produces this one event, not one per file
+        if event.is_directory:
+            self.watcher.notify_directory(event.src_path, "delete")
+            self.watcher.notify_directory(event.dest_path, "upsert")
+        else:
+            self.watcher.notify(event.src_path, "delete")
+            self.watcher.notify(event.dest_path, "upsert")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep the RAG knowledge base in sync with its folder.")
+    parser.add_argument("--folder", help="RAG folder to watch (default: $RAG_FOLDER)")
+    parser.add_argument("--poll", action="store_true", help="Force polling instead of filesystem events")
+    parser.add_argument("--poll-interval", type=float, default=5.0, help="Seconds between polls")
+    parser.add_argument("--debounce", type=float, default=2.0, help="Quiet period before applying a change")
+    parser.add_argument("--no-initial-scan", action="store_true", help="Skip the catch-up scan on start")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    watcher = FolderWatcher(
+        indexer=DocumentIndexer(rag_folder=args.folder) if args.folder else None,
+        debounce=args.debounce,
+        poll_interval=args.poll_interval,
+        use_polling=args.poll
+    )
+    watcher.run_forever(initial_scan=not args.no_initial_scan)
@@ -1,5 +1,9 @@
 import os
-from typing import List, Dict, Any
+import logging
+import threading
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
 
 try:
     import chromadb
@@ -9,46 +13,197 @@ except Exception as e:
     print(f"WARNING: ChromaDB not available ({e}). Using Mock VectorDB.")
     CHROMA_AVAILABLE = False
 
+# One client per process, shared by every VectorDB instance. In server
+# mode this is a single HTTP client whose session keeps connections alive.
+_client = None
+_client_mode: Optional[str] = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+
+def _create_client():
+    """
+    Build the process-wide client.
+    Uses the Chroma server when CHROMA_SERVER_HOST is set and reachable,
+    otherwise degrades to the embedded PersistentClient.
+    """
+    server_host = os.getenv("CHROMA_SERVER_HOST", "").strip()
+    if server_host:
+        port = int(os.getenv("CHROMA_SERVER_PORT", "8000"))
+        ssl = os.getenv("CHROMA_SERVER_SSL", "false").lower() in ("1", "true", "yes")
+        try:
+            client = chromadb.HttpClient(host=server_host, port=port, ssl=ssl)
+            client.heartbeat()
+            logger.info(f"Using Chroma server at {server_host}:{port}")
+            return client, "http"
+        except Exception as e:
+            logger.warning(f"Chroma server {server_host}:{port} unreachable ({e}). Falling back to embedded client.")
+
+    db_path = os.getenv("CHROMA_DB_PATH", "./chroma_db")
+    # PersistentClient is preferred for local storage
+    return chromadb.PersistentClient(path=db_path), "embedded"
+
+def get_client():
+    """
+    Return the shared ChromaDB client for this process.
+    Recreated after a fork (e.g. gunicorn preload) so workers never share sockets.
+    """
+    global _client, _client_mode, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client, _client_mode = _create_client()
+            _client_pid = os.getpid()
+        return _client
+
+def set_client(client, mode: str = "custom"):
+    """
+    Install a client for this process (e.g. a local stand-in server's
+    HttpClient in tests). Pass None to go back to the configured client.
+    """
+    global _client, _client_mode, _client_pid
+    with _client_lock:
+        _client = client
+        _client_mode = mode if client is not None else None
+        _client_pid = os.getpid() if client is not None else None
+
+def get_client_mode() -> Optional[str]:
+    """Return 'http', 'embedded' or 'custom' once a client exists."""
+    return _client_mode
+
 class VectorDB:
     def __init__(self, collection_name: str = "tutorial_chunks"):
-        if not CHROMA_AVAILABLE:
+        self.collection = None
+        if not CHROMA_AVAILABLE and _client is None:
             return
 
-        db_path = os.getenv("CHROMA_DB_PATH", "./chroma_db")
-        
         # Initialize Client
-        # PersistentClient is preferred for local storage
-        self.client = chromadb.PersistentClient(path=db_path)
+        self.client = get_client()
         
         # Get or create collection
         self.collection = self.client.get_or_create_collection(name=collection_name)
+        
+        # Writes are sent in batches no larger than the server accepts
+        self.write_batch_size = int(os.getenv("CHROMA_WRITE_BATCH_SIZE", "500"))
+        try:
+            max_batch = getattr(self.client, "max_batch_size", None)
+        except Exception:
+            max_batch = None
+        if isinstance(max_batch, int) and max_batch > 0:
+            self.write_batch_size = min(self.write_batch_size, max_batch)
 
     def add_documents(self, documents: List[str], metadatas: List[Dict[str, Any]], ids: List[str]):
         """
-        Add documents to the vector store.
+        Add documents to the vector store, in write batches.
+        """
+        if self.collection is None:
+            return
+
+        step = max(self.write_batch_size, 1)
+        for start in range(0, len(ids), step):
+            self.collection.add(
+                documents=documents[start:start + step],
+                metadatas=metadatas[start:start + step],
+                ids=ids[start:start + step]
+            )
+
+    def get_documents(self, ids: Optional[List[str]] = None,
+                      where: Optional[Dict[str, Any]] = None,
+                      include_documents: bool = False) -> List[Dict[str, Any]]:
+        """
+        Fetch stored documents by id and/or metadata filter.
+        Returns dicts with 'id', 'metadata' and (optionally) 'content'.
+        """
+        if self.collection is None:
+            return []
+
+        include = ["metadatas", "documents"] if include_documents else ["metadatas"]
+        results = self.collection.get(ids=ids, where=where, include=include)
+
+        found_ids = results.get("ids") or []
+        metadatas = results.get("metadatas") or []
+        documents = results.get("documents") or []
+        records = []
+        for i, doc_id in enumerate(found_ids):
+            record = {"id": doc_id, "metadata": (metadatas[i] if i < len(metadatas) else None) or {}}
+            if include_documents:
+                record["content"] = documents[i] if i < len(documents) else None
+            records.append(record)
+        return records
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """
+        Replace the metadata of existing documents.
         """
-        if not CHROMA_AVAILABLE:
+        if self.collection is None or not ids:
             return
 
-        self.collection.add(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids
-        )
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def delete_documents(self, ids: Optional[List[str]] = None,
+                         where: Optional[Dict[str, Any]] = None):
+        """
+        Delete documents by id and/or metadata filter.
+        """
+        if self.collection is None or (not ids and not where):
+            return
+
+        self.collection.delete(ids=ids, where=where)
 
     def query_similar(self, query: str, n_results: int = 3) -> List[str]:
         """
         Query for similar documents.
         """
-        if not CHROMA_AVAILABLE:
-            return []
+        results = self.query_batch([query], n_results=n_results)
+        return [hit["content"] for hit in results[0]]
+
+    def query_batch(self, queries: List[str], n_results: int = 3,
+                    where: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Query for similar documents for several queries in one round-trip.
+
+        Args:
+            queries: Query texts, embedded and searched together.
+            n_results: Maximum hits per query.
+            where: Optional ChromaDB metadata filter, e.g. {"type": "rag_document"}.
+
+        Returns:
+            One list per query (same order) of dicts with 'id', 'content',
+            'metadata' and 'distance' keys, nearest first.
+        """
+        if self.collection is None or not queries:
+            return [[] for _ in queries]
+
+        query_kwargs = {
+            "query_texts": list(queries),
+            "n_results": n_results,
+            "include": ["documents", "metadatas", "distances"],
+        }
+        if where:
+            query_kwargs["where"] = where
+
+        results = self.collection.query(**query_kwargs)
+
+        batched = []
+        for q in range(len(queries)):
+            ids = self._result_row(results, "ids", q)
+            documents = self._result_row(results, "documents", q)
+            metadatas = self._result_row(results, "metadatas", q)
+            distances = self._result_row(results, "distances", q)
+            hits = []
+            for i, document in enumerate(documents):
+                hits.append({
+                    "id": ids[i] if i < len(ids) else None,
+                    "content": document,
+                    "metadata": (metadatas[i] if i < len(metadatas) else None) or {},
+                    "distance": distances[i] if i < len(distances) else None,
+                })
+            batched.append(hits)
+        return batched
 
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=n_results
-        )
-        # Flatten results list (list of lists)
-        return results['documents'][0] if results['documents'] else []
+    @staticmethod
+    def _result_row(results: Dict[str, Any], key: str, row: int) -> list:
+        """Pick one query's row out of a ChromaDB list-of-lists result field."""
+        rows = results.get(key) or []
+        return (rows[row] or []) if row < len(rows) else []
 
     def clear(self):
         """
@@ -193,7 +193,7 @@ document.addEventListener('DOMContentLoaded', () => {
             ['ingest', 'Ingestion Complete', 'Source content parsed.'],
             ['rewrite', 'Rewrite Logic Applied', 'Content simplified and glossary added.'],
             ['vision', 'Assets Generated', 'Images synthesized and embedded.'],
-            ['assembly', 'Final Assembly', 'PDF rendered successfully.'],
+            ['assembly', 'Final Assembly', 'Document stored; downloads are generated on request.'],
             ['success', 'Pipeline Finished', 'Document is ready for review.']
         ];
         steps.forEach(step => addActivityCard(step[0], step[1], step[2], 'completed'));
@@ -205,6 +205,10 @@ document.addEventListener('DOMContentLoaded', () => {
         exportActions.classList.remove('hidden');
 
         downloadLink.href = data.pdf_url;
+        if (data.downloads && !data.downloads.pdf) {
+            // No PDF renderer on the server: the link offers the standalone HTML
+            downloadLink.lastChild.textContent = ' Download HTML';
+        }
         contentView.innerText = data.markdown_content;
         contentView.innerHTML = parseMarkdown(data.markdown_content);
     }
@@ -469,15 +473,31 @@ document.addEventListener('DOMContentLoaded', () => {
                     body: JSON.stringify({ rag_folder: ragFolder })
                 });
 
-                const data = await response.json();
+                let data = await response.json();
 
-                if (data.success) {
+                // Indexing runs in the background; poll until it finishes
+                while (data.success && ['pending', 'running'].includes(data.status.state)) {
+                    const s = data.status;
+                    if (indexStatus) {
+                        const eta = s.eta_seconds != null ? `, ETA ${Math.ceil(s.eta_seconds)}s` : '';
+                        indexStatus.textContent = `Indexing ${s.done}/${s.total ?? '?'}${eta}`;
+                    }
+                    await new Promise(resolve => setTimeout(resolve, 1000));
+                    data = await (await fetch('/api/index/status/')).json();
+                }
+
+                if (data.success && data.status.state === 'completed') {
+                    const s = data.status;
                     indexNowBtn.innerHTML = '✓ Done';
                     indexNowBtn.classList.add('bg-emerald-100', 'text-emerald-700');
                     if (indexStatus) {
-                        indexStatus.textContent = `Indexed: ${data.indexed}, Skipped: ${data.skipped}, Failed: ${data.failed}`;
+                        indexStatus.textContent = `Indexed: ${s.indexed}, Skipped: ${s.skipped}, Failed: ${s.failed}`;
                         indexStatus.classList.add('text-emerald-600');
                     }
+                } else if (data.success) {
+                    indexNowBtn.innerHTML = '✗ Error';
+                    indexNowBtn.classList.add('bg-red-100', 'text-red-700');
+                    if (indexStatus) indexStatus.textContent = data.status.errors?.[0]?.error || 'Indexing failed';
                 } else {
                     indexNowBtn.innerHTML = '✗ Error';
                     indexNowBtn.classList.add('bg-red-100', 'text-red-700');
@@ -0,0 +1,86 @@
+import os
+import re
+import sys
+
+import pytest
+
+# core/ is a namespace package imported from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _matches(metadata, where):
+    if not where:
+        return True
+    return all(metadata.get(key) == value for key, value in where.items())
+
+
+def _words(text):
+    return set(re.findall(r"\w+", text.lower()))
+
+
+class FakeCollection:
+    """In-memory stand-in for a Chroma collection; records every call."""
+
+    def __init__(self):
+        self.records = {}  # id -> (document, metadata)
+        self.calls = []
+
+    def add(self, documents, metadatas, ids):
+        self.calls.append(("add", len(ids)))
+        for doc_id, document, metadata in zip(ids, documents, metadatas):
+            self.records[doc_id] = (document, dict(metadata))
+
+    def get(self, ids=None, where=None, include=None):
+        self.calls.append(("get", ids, where))
+        found = [doc_id for doc_id in (ids if ids is not None else self.records)
+                 if doc_id in self.records and _matches(self.records[doc_id][1], where)]
+        return {"ids": found,
+                "metadatas": [self.records[doc_id][1] for doc_id in found],
+                "documents": [self.records[doc_id][0] for doc_id in found]}
+
+    def update(self, ids, metadatas):
+        self.calls.append(("update", len(ids)))
+        for doc_id, metadata in zip(ids, metadatas):
+            self.records[doc_id] = (self.records[doc_id][0], dict(metadata))
+
+    def delete(self, ids=None, where=None):
+        self.calls.append(("delete", ids, where))
+        for doc_id in list(self.records):
+            if (ids is None or doc_id in ids) and _matches(self.records[doc_id][1], where):
+                del self.records[doc_id]
+
+    def query(self, query_texts, n_results, include, where=None):
+        self.calls.append(("query", len(query_texts)))
+        rows = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for text in query_texts:
+            scored = sorted(
+                ((len(_words(text) & _words(document)), doc_id)
+                 for doc_id, (document, metadata) in self.records.items() if _matches(metadata, where)),
+                reverse=True)[:n_results]
+            rows["ids"].append([doc_id for _, doc_id in scored])
+            rows["documents"].append([self.records[doc_id][0] for _, doc_id in scored])
+            rows["metadatas"].append([self.records[doc_id][1] for _, doc_id in scored])
+            rows["distances"].append([1.0 / (1 + overlap) for overlap, _ in scored])
+        return rows
+
+    def count_calls(self, kind):
+        return sum(1 for call in self.calls if call[0] == kind)
+
+
+class FakeClient:
+    def __init__(self, max_batch_size=None):
+        self.max_batch_size = max_batch_size
+        self.collections = {}
+
+    def get_or_create_collection(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+
+@pytest.fixture
+def client():
+    """Fake Chroma client installed for the test's duration."""
+    from database import vector_store
+    client = FakeClient()
+    vector_store.set_client(client)
+    yield client
+    vector_store.set_client(None)
@@ -0,0 +1,118 @@
+import io
+import os
+import shutil
+import threading
+
+import pytest
+
+from core import assembly
+from core.assembly import Assembler, get_environment, render_markdown, split_sections
+from core.cache import DiskCache
+
+pypdf = pytest.importorskip("pypdf")
+pytest.importorskip("markdown")
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+
+
+def _document(*bodies):
+    return "".join(f"# Part {i}\n\n{body}\n" for i, body in enumerate(bodies))
+
+
+class _Layout:
+    """Stands in for a WeasyPrint document: one blank page per layout."""
+
+    def write_pdf(self):
+        writer = pypdf.PdfWriter()
+        writer.add_blank_page(width=200, height=200)
+        out = io.BytesIO()
+        writer.write(out)
+        return out.getvalue()
+
+
+@pytest.fixture
+def sections(tmp_path, monkeypatch):
+    templates = tmp_path / "templates"
+    shutil.copytree(TEMPLATE_DIR, templates)
+    layouts = []
+
+    def layout(self, html_content):
+        layouts.append(html_content)
+        return _Layout()
+
+    monkeypatch.setattr(assembly, "WEASY_AVAILABLE", True)
+    monkeypatch.setattr(assembly, "_section_cache", DiskCache(str(tmp_path / "sections"), max_bytes=10**7))
+    monkeypatch.setattr(Assembler, "_layout", layout)
+    return Assembler(str(templates)), templates, layouts
+
+
+def test_unchanged_sections_are_reused(sections, tmp_path):
+    assembler, _, layouts = sections
+    bodies = ["alpha " * 300, "beta " * 300, "gamma " * 300]
+    output = str(tmp_path / "out.pdf")
+
+    first = assembler.render_sections_pdf(_document(*bodies), "Doc", "pro", output)
+    assert first == {"path": output, "pages": 3, "sections": 3, "reused": 0}
+    assert len(pypdf.PdfReader(output).pages) == 3
+
+    layouts.clear()
+    bodies[1] = "edited " * 300
+    second = assembler.render_sections_pdf(_document(*bodies), "Doc", "pro", output)
+    assert second["reused"] == 2 and second["pages"] == 3
+    assert len(layouts) == 1 and "edited" in layouts[0]
+
+
+def test_template_change_invalidates_sections(sections, tmp_path):
+    assembler, templates, layouts = sections
+    content = _document("alpha " * 300, "beta " * 300)
+    output = str(tmp_path / "out.pdf")
+    assembler.render_sections_pdf(content, "Doc", "pro", output)
+
+    with open(templates / "styles.css", "a") as f:
+        f.write("\nbody { color: red; }\n")
+    result = assembler.render_sections_pdf(content, "Doc", "pro", output)
+
+    assert result["reused"] == 0 and len(layouts) == 4
+
+
+def test_title_only_affects_the_first_section(sections, tmp_path):
+    assembler, _, _ = sections
+    content = _document("alpha " * 300, "beta " * 300, "gamma " * 300)
+    assembler.render_sections_pdf(content, "Doc", "pro", str(tmp_path / "a.pdf"))
+
+    result = assembler.render_sections_pdf(content, "Renamed", "pro", str(tmp_path / "b.pdf"))
+
+    assert result["reused"] == 2
+
+
+def test_split_sections_keeps_fences_and_short_sections_together():
+    content = ("# Intro\n\nshort\n"
+               "# Big\n\n" + "x" * 50 + "\n```\n# not a heading\n```\n"
+               "## Tiny\n\nbit\n"
+               "# Next\n\n" + "y" * 50 + "\n")
+
+    parts = split_sections(content, min_chars=40)
+
+    assert len(parts) == 2
+    assert parts[0].startswith("# Intro") and "# not a heading" in parts[0] and "## Tiny" in parts[0]
+    assert parts[1].startswith("# Next")
+
+
+def test_render_layer_is_shared(tmp_path):
+    assert Assembler(TEMPLATE_DIR).env is Assembler(TEMPLATE_DIR).env is get_environment(TEMPLATE_DIR)
+
+    converters = []
+
+    def convert():
+        render_markdown("# a")
+        converters.append(assembly._markdown_local.converter)
+        # The converter is reset between documents
+        assert "<h1>" not in render_markdown("plain")
+        converters.append(assembly._markdown_local.converter)
+
+    convert()
+    thread = threading.Thread(target=convert)
+    thread.start()
+    thread.join()
+    assert converters[0] is converters[1] and converters[2] is converters[3]
+    assert converters[0] is not converters[2]
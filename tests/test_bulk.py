@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from core.bulk import BulkIngestor
+
+ROBOTS = b"User-agent: *\nDisallow: /private/\n"
+
+
+class _Site(BaseHTTPRequestHandler):
+    robots_requests = 0
+
+    def do_GET(self):
+        if self.path == "/robots.txt":
+            type(self).robots_requests += 1
+            time.sleep(0.1)  # Slow enough for every URL to be waiting on it
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(ROBOTS)))
+            self.end_headers()
+            self.wfile.write(ROBOTS)
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class _Service:
+    """Stands in for IngestionService; tracks concurrency per call."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = self.peak = 0
+
+    def parse_url(self, url):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.02)
+        with self.lock:
+            self.active -= 1
+        return f"# {url}"
+
+
+@pytest.fixture
+def site():
+    _Site.robots_requests = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Site)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_robots_fetched_once_per_origin(site):
+    service = _Service()
+    urls = [f"{site}/page/{i}" for i in range(12)] + [f"{site}/private/secret"]
+    ingestor = BulkIngestor(concurrency=8, per_host=3, delay=0, service=service)
+
+    report = asyncio.run(ingestor.run(urls))
+
+    assert _Site.robots_requests == 1
+    statuses = {entry["url"]: entry["status"] for entry in report}
+    assert statuses.pop(f"{site}/private/secret") == "blocked"
+    assert set(statuses.values()) == {"ok"}
+    assert service.peak <= 3
+
+
+def test_crawl_delay_does_not_hold_global_slots():
+    service = _Service()
+    slow = [f"http://slow.invalid/page/{i}" for i in range(4)]
+    fast = [f"http://fast{i}.invalid/" for i in range(4)]
+    ingestor = BulkIngestor(concurrency=2, per_host=4, delay=0.3, respect_robots=False, service=service)
+    finished = {}
+
+    async def run():
+        started = time.monotonic()
+        async for result in ingestor.ingest(slow + fast):
+            finished[result["url"]] = time.monotonic() - started
+
+    asyncio.run(run())
+
+    # The other hosts finish while the slow host is still spacing its requests
+    assert max(finished[url] for url in fast) < 0.3
+    assert max(finished[url] for url in slow) >= 0.9
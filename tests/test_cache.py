@@ -0,0 +1,53 @@
+import os
+import threading
+
+from core.cache import DiskCache
+
+
+def _total_on_disk(directory):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, files in os.walk(directory)
+               for name in files if not name.endswith(".json") and not name.startswith("."))
+
+
+def test_quota_covers_entries_written_by_other_processes(tmp_path):
+    # Two instances on one directory stand in for two worker processes
+    first = DiskCache(str(tmp_path), max_bytes=250, rescan_interval=0)
+    second = DiskCache(str(tmp_path), max_bytes=250, rescan_interval=0)
+    for i in range(3):
+        first.put(f"first{i}", {"data": b"a" * 50})
+        second.put(f"second{i}", {"data": b"b" * 50})
+
+    assert _total_on_disk(tmp_path) <= 250
+    assert "second2" in first and "second2" in second
+    assert second.stats()["bytes"] == _total_on_disk(tmp_path)
+
+
+def test_restart_rebuilds_accounting_from_disk(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.put("key", {"md": b"x" * 10, "html": b"y" * 20})
+    cache.add_blob("key", "pdf", b"z" * 30)
+    assert DiskCache(str(tmp_path)).stats()["bytes"] == 60
+
+
+def test_add_blob_to_evicted_entry_leaves_no_file(tmp_path):
+    writer = DiskCache(str(tmp_path))
+    other = DiskCache(str(tmp_path))
+    writer.put("key", {"md": b"text"})
+    other.delete("key")
+    assert writer.add_blob("key", "pdf", b"pdf bytes") is None
+    assert not os.path.exists(writer.path("key", "pdf"))
+
+
+def test_concurrent_add_blob_keeps_every_blob(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.put("key", {"md": b"text"})
+    threads = [threading.Thread(target=cache.add_blob, args=("key", f"fmt{i}", b"x" * i))
+               for i in range(1, 9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    meta = DiskCache(str(tmp_path)).get_meta("key")
+    assert set(meta["_blobs"]) == {"md"} | {f"fmt{i}" for i in range(1, 9)}
+    assert meta["_size"] == 4 + sum(range(1, 9))
@@ -0,0 +1,207 @@
+import json
+import queue
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from core import comfy, vision
+from core.comfy import ComfyUIClient, build_workflow, merge_workflows
+
+
+class _FakeComfy(ThreadingHTTPServer):
+    """Stand-in ComfyUI: runs prompts in the background, fails any whose text contains FAIL."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.prompts = queue.Queue()
+        self.history = {}
+        self.submitted = []
+        self.history_polls = 0
+        self.views = []
+        # Websocket messages, pushed before the history entry is stored
+        self.ws_messages = queue.Queue()
+        self.history_delay = 0.0
+        threading.Thread(target=self._execute, daemon=True).start()
+
+    def _execute(self):
+        while True:
+            prompt_id, graph = self.prompts.get()
+            time.sleep(0.05)
+            self.ws_messages.put(json.dumps({"type": "execution_success", "data": {"prompt_id": prompt_id}}))
+            time.sleep(self.history_delay)
+            texts = [node["inputs"]["text"] for node in graph.values() if node["class_type"] == "CLIPTextEncode"]
+            if any("FAIL" in text for text in texts):
+                self.history[prompt_id] = {"outputs": {}, "status": {
+                    "status_str": "error", "completed": False,
+                    "messages": [["execution_error", {"node_type": "KSampler", "exception_message": "OOM"}]]}}
+                continue
+            saves = [node_id for node_id, node in graph.items() if node["class_type"] == "SaveImage"]
+            self.history[prompt_id] = {
+                "outputs": {node_id: {"images": [{"filename": f"{prompt_id}_{node_id}.png", "subfolder": "",
+                                                  "type": "output"}]} for node_id in saves},
+                "status": {"status_str": "success", "completed": True, "messages": []},
+            }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _json(self, payload, code=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        path = urlsplit(self.path).path
+        if path == "/prompt":
+            graph = body["prompt"]
+            if any("BAD" in node["inputs"].get("text", "") for node in graph.values()):
+                return self._json({"error": "invalid prompt", "node_errors": {"6": "bad"}}, 400)
+            prompt_id = uuid.uuid4().hex
+            self.server.submitted.append(graph)
+            self.server.prompts.put((prompt_id, graph))
+            return self._json({"prompt_id": prompt_id, "number": len(self.server.submitted), "node_errors": {}})
+        self._json({})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.startswith("/history/"):
+            self.server.history_polls += 1
+            prompt_id = url.path.rsplit("/", 1)[-1]
+            entry = self.server.history.get(prompt_id)
+            return self._json({prompt_id: entry} if entry else {})
+        if url.path == "/view":
+            filename = parse_qs(url.query)["filename"][0]
+            self.server.views.append(filename)
+            body = f"PNG:{filename}".encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if url.path == "/queue":
+            return self._json({"queue_running": [], "queue_pending": []})
+        self._json({}, 404)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(comfy, "WEBSOCKET_AVAILABLE", False)  # Exercise /history polling
+    server = _FakeComfy()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def client(server):
+    return ComfyUIClient(f"http://127.0.0.1:{server.server_port}", timeout=10, poll_interval=0.05)
+
+
+def test_run_queues_polls_and_downloads(server, client):
+    results = client.run([build_workflow("a red fox"), build_workflow("a blue bird")])
+
+    assert len(server.submitted) == 2
+    assert server.history_polls >= 2
+    for result in results:
+        assert result["error"] is None
+        assert result["images"] == [f"PNG:{result['prompt_id']}_{comfy.SAVE_NODE}.png".encode("utf-8")]
+    assert len(server.views) == 2
+
+
+def test_run_reports_rejected_and_failed_workflows(server, client):
+    results = client.run([build_workflow("BAD prompt"), build_workflow("FAIL prompt"), build_workflow("ok")])
+
+    assert results[0]["prompt_id"] is None and "rejected" in results[0]["error"]
+    assert "OOM" in results[1]["error"] and results[1]["images"] == []
+    assert results[2]["error"] is None and len(results[2]["images"]) == 1
+
+
+def test_merge_workflows_shares_common_nodes():
+    workflows = [build_workflow(prompt) for prompt in ("one", "two", "three")]
+    graph, save_nodes = merge_workflows(workflows)
+
+    classes = [node["class_type"] for node in graph.values()]
+    assert classes.count("CheckpointLoaderSimple") == 1
+    assert classes.count("EmptyLatentImage") == 1
+    assert classes.count("CLIPTextEncode") == 4  # Three prompts plus the shared negative
+    assert classes.count("KSampler") == 3
+    assert len(set(save_nodes)) == 3
+    assert all(graph[node_id]["class_type"] == "SaveImage" for node_id in save_nodes)
+
+
+@pytest.fixture
+def vision_client(client, monkeypatch):
+    monkeypatch.setattr(vision, "get_comfy_client", lambda: client)
+    monkeypatch.setattr(vision, "_get_image_cache", lambda: None)
+    monkeypatch.setenv("VISION_PROVIDER", "local")
+    monkeypatch.setenv("COMFYUI_BATCH_SIZE", "4")
+    return vision.VisionClient()
+
+
+def test_compatible_workflows_are_batched(server, vision_client):
+    workflows = [build_workflow(f"image {i}") for i in range(5)]
+    results = vision_client._generate_comfy(workflows)
+
+    assert len(server.submitted) == 2  # 4 + 1
+    assert all(result["error"] is None and len(result["images"]) == 1 for result in results)
+    assert len({result["images"][0] for result in results}) == 5
+
+
+def test_incompatible_workflows_are_submitted_separately(server, vision_client):
+    workflows = [build_workflow("square 0"), build_workflow("wide 0", width=1216, height=832),
+                 build_workflow("square 1"), build_workflow("other model", checkpoint="other.safetensors")]
+    results = vision_client._generate_comfy(workflows)
+
+    # Same checkpoint and size share a submission; order follows the input
+    assert len(server.submitted) == 3
+    assert all(result["error"] is None and len(result["images"]) == 1 for result in results)
+    assert results[0]["prompt_id"] == results[2]["prompt_id"] != results[1]["prompt_id"]
+    assert results[3]["prompt_id"] not in (results[0]["prompt_id"], results[1]["prompt_id"])
+
+def test_failed_batch_is_retried_one_image_at_a_time(server, vision_client):
+    prompts = ["first", "FAIL second", "third"]
+    results = vision_client._generate_comfy([build_workflow(prompt) for prompt in prompts])
+
+    # One merged submission, then each image on its own
+    assert len(server.submitted) == 1 + len(prompts)
+    assert results[0]["error"] is None and len(results[0]["images"]) == 1
+    assert "OOM" in results[1]["error"] and results[1]["images"] == []
+    assert results[2]["error"] is None and len(results[2]["images"]) == 1
+
+
+class _FakeWebSocket:
+    def __init__(self, server):
+        self.server = server
+
+    def settimeout(self, timeout):
+        pass
+
+    def recv(self):
+        return self.server.ws_messages.get()
+
+    def close(self):
+        pass
+
+
+def test_pushed_completion_before_history_does_not_spin(server, monkeypatch):
+    fake_websocket = type("websocket", (), {"create_connection": staticmethod(lambda url, timeout: _FakeWebSocket(server))})
+    monkeypatch.setattr(comfy, "WEBSOCKET_AVAILABLE", True)
+    monkeypatch.setattr(comfy, "websocket", fake_websocket, raising=False)
+    server.history_delay = 0.5
+    client = ComfyUIClient(f"http://127.0.0.1:{server.server_port}", timeout=10, poll_interval=0.05)
+
+    results = client.run([build_workflow("a red fox")])
+
+    assert results[0]["error"] is None and len(results[0]["images"]) == 1
+    # Backed-off polls while /history catches up, not a tight loop
+    assert server.history_polls < 20
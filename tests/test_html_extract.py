@@ -0,0 +1,40 @@
+from core.html_extract import extract_main_content
+
+DOCS_PAGE = """<html><head><title>Docs</title></head><body>
+<nav><a href="/">Home</a> <a href="/docs">Docs</a></nav>
+<div class="document">
+  <h1>Install</h1>
+  <p>Install the package with pip before following the rest of this guide.</p>
+  <div class="highlight"><pre>pip install x</pre></div>
+  <div class="note"><p>Use a virtual environment for each project.</p></div>
+  <p>Then import the package and create a client to get started with it.</p>
+</div>
+<div class="sidebar"><ul><li><a href="/a">Page A</a></li><li><a href="/b">Page B</a></li></ul></div>
+<footer>Copyright</footer>
+</body></html>"""
+
+
+def test_keeps_nested_code_and_notes_in_order():
+    content = extract_main_content([DOCS_PAGE])
+    assert content.startswith("# Install")
+    assert "```\npip install x\n```" in content
+    assert "Use a virtual environment" in content
+    assert content.index("pip install x") < content.index("virtual environment") < content.index("Then import")
+    assert "Page A" not in content
+    assert "Copyright" not in content
+
+
+def test_keeps_article_header_and_split_paragraphs():
+    page = ("<article><header><h1>Title here</h1></header>"
+            "<div><p>" + "First paragraph text. " * 20 + "</p></div>"
+            "<div><p>" + "Second paragraph text. " * 20 + "</p></div></article>"
+            "<div class='comments'><p>Nice post</p></div>")
+    content = extract_main_content([page])
+    assert content.startswith("# Title here")
+    assert "First paragraph" in content and "Second paragraph" in content
+    assert "Nice post" not in content
+
+
+def test_streamed_chunks_match_whole_document():
+    chunks = [DOCS_PAGE[i:i + 17] for i in range(0, len(DOCS_PAGE), 17)]
+    assert extract_main_content(chunks) == extract_main_content([DOCS_PAGE])
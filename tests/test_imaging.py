@@ -0,0 +1,15 @@
+from core.imaging import ImageProcessor
+
+
+def test_find_output_accepts_png_fallback(tmp_path, monkeypatch):
+    monkeypatch.setenv("IMAGE_FORMAT", "jpeg")
+    processor = ImageProcessor()
+    name = processor.output_name(b"image bytes", "pro")
+    assert processor.find_output(str(tmp_path), name) is None
+
+    stem = name.rsplit(".", 1)[0]
+    (tmp_path / f"{stem}.png").write_bytes(b"png")
+    assert processor.find_output(str(tmp_path), name) == f"{stem}.png"
+
+    (tmp_path / name).write_bytes(b"configured format")
+    assert processor.find_output(str(tmp_path), name) == name
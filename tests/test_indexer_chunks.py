@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from core.indexer import DocumentIndexer
+
+
+def _words(count, topic="word"):
+    return [f"{topic}{i}" for i in range(count)]
+
+
+def test_words_spanning_file_blocks_are_kept_whole(tmp_path):
+    text = "alpha  beta\tgamma\n\ndelta epsilon-zeta " * 20 + "omega"
+    path = tmp_path / "doc.txt"
+    path.write_text(text, encoding="utf-8")
+
+    for block_size in (1, 3, 7, 64, 1 << 16):
+        assert list(DocumentIndexer._iter_words_from_file(str(path), block_size=block_size)) == text.split()
+
+
+def test_chunks_overlap_and_cover_every_word():
+    words = _words(11)
+
+    chunks = list(DocumentIndexer._iter_chunks(iter(words), chunk_size=5, overlap=2))
+
+    assert chunks == [" ".join(words[0:5]), " ".join(words[3:8]), " ".join(words[6:11])]
+    # No trailing chunk made only of overlap
+    assert list(DocumentIndexer._iter_chunks(iter(words[:8]), chunk_size=5, overlap=2)) == chunks[:2]
+
+
+def test_chunking_holds_one_window_of_words():
+    consumed = []
+
+    def words():
+        for word in _words(100):
+            consumed.append(word)
+            yield word
+
+    chunks = DocumentIndexer._iter_chunks(words(), chunk_size=10, overlap=2)
+    next(chunks)
+    assert len(consumed) == 10
+    next(chunks)
+    assert len(consumed) == 18
+
+
+@pytest.fixture
+def indexer(client, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("RAG_INDEX_BATCH_SIZE", "2")
+    os.makedirs("rag")
+    return DocumentIndexer(rag_folder="./rag")
+
+
+def test_chunks_are_stored_in_batches(indexer, client):
+    path = os.path.join("rag", "big.md")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(" ".join(_words(4000)))
+
+    assert indexer.index_file(path)[0] == "indexed"
+
+    collection = indexer.db.collection
+    assert len(collection.records) == 5  # 1000-word chunks, 100 words of overlap
+    assert collection.count_calls("add") == 3
+
+
+def test_failure_mid_stream_leaves_no_partial_document(indexer, monkeypatch):
+    path = os.path.join("rag", "broken.md")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(" ".join(_words(4000)))
+
+    def failing_chunks(filepath):
+        yield from list(DocumentIndexer._iter_chunks(iter(_words(4000))))[:3]
+        raise OSError("read error")
+
+    monkeypatch.setattr(indexer, "_iter_file_chunks", failing_chunks)
+
+    assert indexer.index_file(path) == ("failed", "read error")
+    assert indexer.db.collection.records == {}
+    assert indexer.get_indexed_count() == 0
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from core import indexer as indexer_module
+from core.indexer import get_indexer, get_indexing_status, start_background_indexing
+
+
+def _write(path, topic):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(" ".join(f"{topic}{i}" for i in range(300)))
+
+
+@pytest.fixture
+def folders(client, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("RAG_FOLDER", "./main")
+    monkeypatch.setattr(indexer_module, "_indexers", {})
+    monkeypatch.setattr(indexer_module, "_current_job", None)
+    _write("main/a.md", "alpha")
+    _write("other/b.md", "beta")
+    return tmp_path
+
+
+def test_one_indexer_per_folder(folders):
+    default = get_indexer()
+    other = get_indexer("./other")
+    assert other is not default
+    assert get_indexer() is default  # Not replaced by the other folder
+    assert get_indexer(str(folders / "main")) is default
+    assert get_indexer(str(folders / "other")) is other
+
+
+def test_background_job_merges_same_folder_and_rejects_others(folders, monkeypatch):
+    release = indexer_module.threading.Event()
+    original = indexer_module.DocumentIndexer.index_folder
+
+    def slow_index_folder(self, *args, **kwargs):
+        release.wait(5)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(indexer_module.DocumentIndexer, "index_folder", slow_index_folder)
+
+    started, status = start_background_indexing()
+    assert started and status["state"] == "running"
+
+    # Same folder, named differently: merged into the running job
+    started, status = start_background_indexing(rag_folder=str(folders / "main"))
+    assert not started and not status.get("conflict")
+
+    started, status = start_background_indexing(rag_folder="./other")
+    assert not started and status["conflict"]
+
+    release.set()
+    indexer_module._current_job.wait(5)
+    assert get_indexing_status()["state"] == "completed"
+    assert get_indexing_status()["indexed"] == 1
+
+    # Once finished, the other folder can be indexed; the default folder
+    # is not merged into that job
+    release.clear()
+    started, status = start_background_indexing(rag_folder="./other")
+    assert started
+    started, status = start_background_indexing()
+    assert not started and status["conflict"]
+    release.set()
+    indexer_module._current_job.wait(5)
+    assert get_indexer("./other").get_indexed_count() == 1
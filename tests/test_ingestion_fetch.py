@@ -0,0 +1,139 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from core import ingestion
+from core.cache import DiskCache
+
+PAGE = "<html><body><article><h1>{title}</h1><p>" + "Body text for the page. " * 10 + "</p></article></body></html>"
+
+
+class _Origin(BaseHTTPRequestHandler):
+    """The page's origin, also standing in for Firecrawl's /v0/scrape."""
+    version = "v1"
+    firecrawl_metadata = {}
+    requests = []
+
+    def do_GET(self):
+        type(self).requests.append(("GET", self.path))
+        etag = f'"{self.version}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = PAGE.format(title=self.version).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        type(self).requests.append(("HEAD", self.path))
+        self.send_response(200)
+        self.end_headers()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        type(self).requests.append(("POST", self.path))
+        body = json.dumps({"data": {"markdown": f"# firecrawl {self.version}",
+                                    "metadata": self.firecrawl_metadata}}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def origin():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Origin)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/page"
+    server.shutdown()
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion, "_fetch_cache", DiskCache(str(tmp_path / "fetch")))
+    monkeypatch.setattr(ingestion, "_parse_cache", None)
+    monkeypatch.setenv("PARSE_CACHE_MAX_MB", "0")
+    monkeypatch.delenv("LLAMA_CLOUD_API_KEY", raising=False)
+    service = ingestion.IngestionService()
+    service.fetch_cache_ttl = 0  # Always revalidate
+    return service
+
+
+def test_revalidation_parses_changed_body_without_firecrawl(origin, service, monkeypatch):
+    service.firecrawl_api_url = ""
+    _Origin.version = "v1"
+    assert service.parse_url(origin).startswith("# v1")
+
+    firecrawl_calls = []
+
+    def firecrawl(url, **kwargs):
+        firecrawl_calls.append(url)
+        raise ConnectionError("Firecrawl unavailable")
+
+    service.firecrawl_api_url = "http://firecrawl.invalid"
+    monkeypatch.setattr(service, "_parse_with_firecrawl", firecrawl)
+    assert service.parse_url(origin).startswith("# v1")  # 304
+
+    _Origin.version = "v2"
+    assert service.parse_url(origin).startswith("# v2")  # 200 with the new body
+    assert firecrawl_calls == []
+    key = DiskCache.make_key("url", origin)
+    assert service.fetch_cache.get_meta(key)["etag"] == '"v2"'
+
+
+def test_changed_firecrawl_entry_is_parsed_by_firecrawl_again(origin, service, monkeypatch):
+    key = DiskCache.make_key("url", origin)
+    service.fetch_cache.put(key, {"md": b"# firecrawl v1"},
+                            {"url": origin, "fetched_at": 0, "parser": "firecrawl", "etag": '"v1"'})
+    firecrawl_calls = []
+
+    def firecrawl(url, **kwargs):
+        firecrawl_calls.append(url)
+        return f"# firecrawl {_Origin.version}"
+
+    monkeypatch.setattr(service, "_parse_with_firecrawl", firecrawl)
+    _Origin.version = "v1"
+    assert service.parse_url(origin) == "# firecrawl v1"  # 304
+    assert firecrawl_calls == []
+
+    _Origin.version = "v2"
+    assert service.parse_url(origin) == "# firecrawl v2"
+    assert firecrawl_calls == [origin]
+    assert service.fetch_cache.get_meta(key)["parser"] == "firecrawl"
+
+
+def test_firecrawl_fetch_sends_nothing_to_the_origin(origin, service):
+    service.firecrawl_api_url = origin.rsplit("/", 1)[0]
+    _Origin.version, _Origin.requests, _Origin.firecrawl_metadata = "v1", [], {}
+    assert service.parse_url(origin) == "# firecrawl v1"
+    assert _Origin.requests == [("POST", "/v0/scrape")]
+
+    # No validators: refetched through Firecrawl after the TTL, no conditional GET
+    _Origin.version, _Origin.requests = "v2", []
+    assert service.parse_url(origin) == "# firecrawl v2"
+    assert _Origin.requests == [("POST", "/v0/scrape")]
+
+
+def test_firecrawl_metadata_validators_are_stored(origin, service):
+    service.firecrawl_api_url = origin.rsplit("/", 1)[0]
+    _Origin.version, _Origin.requests = "v1", []
+    _Origin.firecrawl_metadata = {"title": "v1", "etag": '"v1"'}
+    service.parse_url(origin)
+    meta = service.fetch_cache.get_meta(DiskCache.make_key("url", origin))
+    assert meta["etag"] == '"v1"' and meta["parser"] == "firecrawl"
+
+    # Unchanged upstream: a conditional GET is enough
+    _Origin.requests = []
+    assert service.parse_url(origin) == "# firecrawl v1"
+    assert _Origin.requests == [("GET", "/page")]
@@ -0,0 +1,80 @@
+import glob
+import os
+
+import pytest
+
+from core import ingestion
+from core.cache import DiskCache
+
+PAGES = [f"Page {i} text." for i in range(5)]
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path / "parsed"))
+    monkeypatch.setattr(ingestion, "_parse_cache", cache)
+    monkeypatch.setattr(ingestion, "_fetch_cache", None)
+    monkeypatch.setenv("FETCH_CACHE_MAX_MB", "0")
+    monkeypatch.delenv("LLAMA_CLOUD_API_KEY", raising=False)
+    monkeypatch.setattr(ingestion.pdf, "select_backends", lambda filepath: ["fake"])
+    monkeypatch.setattr(ingestion.pdf, "available_backends", lambda: ["fake"])
+    pdf_path = tmp_path / "doc.pdf"
+    pdf_path.write_bytes(b"%PDF-1.4 fake")
+    return ingestion.IngestionService(), str(pdf_path), cache
+
+
+def _spooled(cache):
+    return glob.glob(os.path.join(cache.directory, "*", ".tmp-*"))
+
+
+def test_pages_are_spooled_to_disk_and_cached(service, monkeypatch):
+    service, pdf_path, cache = service
+    spools = []
+
+    def iter_pages(filepath, backend):
+        for page in PAGES:
+            yield page
+            # Pages go to a temp file as they are handed out, not into a list
+            spools.append(len(_spooled(cache)))
+
+    monkeypatch.setattr(ingestion.pdf, "iter_pdf_pages", iter_pages)
+    assert list(service.iter_file_pages(pdf_path)) == PAGES
+    assert spools == [1] * len(PAGES)
+    assert _spooled(cache) == []
+
+    def no_extraction(filepath, backend):
+        raise AssertionError("served from the parse cache")
+
+    monkeypatch.setattr(ingestion.pdf, "iter_pdf_pages", no_extraction)
+    assert list(service.iter_file_pages(pdf_path)) == ["\n\n".join(PAGES)]
+    key = service._parse_key(pdf_path, None)
+    assert cache.get_meta(key)["chars"] == len("\n\n".join(PAGES))
+
+
+def test_abandoned_or_failed_extraction_leaves_nothing_behind(service, monkeypatch):
+    service, pdf_path, cache = service
+    monkeypatch.setattr(ingestion.pdf, "iter_pdf_pages", lambda filepath, backend: iter(PAGES))
+    pages = service.iter_file_pages(pdf_path)
+    next(pages)
+    pages.close()
+    assert _spooled(cache) == [] and cache.entries() == {}
+
+    def failing(filepath, backend):
+        yield PAGES[0]
+        raise RuntimeError("broken page")
+
+    monkeypatch.setattr(ingestion.pdf, "iter_pdf_pages", failing)
+    with pytest.raises(RuntimeError):
+        list(service.iter_file_pages(pdf_path))
+    assert _spooled(cache) == [] and cache.entries() == {}
+
+
+def test_llama_parse_path_looks_the_cache_up_once(service, monkeypatch):
+    service, pdf_path, cache = service
+    service.llama_cloud_api_key = "key"
+    monkeypatch.setattr(service, "_extract_local", lambda filepath: ("# Parsed", "llama_parse"))
+
+    assert list(service.iter_file_pages(pdf_path)) == ["# Parsed"]
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert list(service.iter_file_pages(pdf_path)) == ["# Parsed"]
+    assert (cache.hits, cache.misses) == (1, 1)
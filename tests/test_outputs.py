@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+import uuid
+
+import pytest
+
+from core import outputs, render
+from core.outputs import OutputStore
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+PDF = b"%PDF-1.4 fake render\n"
+
+
+class FakeRenderService:
+    """Renders in a background thread, with PdfRenderService's job interface."""
+
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.jobs = {}
+        self.submitted = 0
+
+    def submit_document(self, content, title, style, output_path, block=0, on_done=None):
+        job_id = uuid.uuid4().hex
+        job = self.jobs[job_id] = {"id": job_id, "status": "queued", "pages": None, "error": None,
+                                   "done": threading.Event()}
+        self.submitted += 1
+
+        def run():
+            time.sleep(self.delay)
+            with open(output_path, "wb") as f:
+                f.write(PDF)
+            job.update(status="done", pages=1)
+            if on_done is not None:
+                on_done(self.status(job_id))
+            job["done"].set()
+
+        threading.Thread(target=run, daemon=True).start()
+        return job_id
+
+    def status(self, job_id):
+        job = self.jobs.get(job_id)
+        return None if job is None else {key: value for key, value in job.items() if key != "done"}
+
+    def wait(self, job_id, timeout=None):
+        self.jobs[job_id]["done"].wait(timeout)
+        return self.status(job_id)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    service = FakeRenderService()
+    monkeypatch.setattr(render, "get_render_service", lambda: service)
+    monkeypatch.setattr(outputs, "WEASY_AVAILABLE", True)
+    return service
+
+
+@pytest.fixture
+def store(tmp_path):
+    return OutputStore(directory=str(tmp_path / "outputs"), template_dir=TEMPLATE_DIR)
+
+
+def test_pdf_rendered_without_a_waiter_is_registered(store, service):
+    doc_id = store.save("# Title\n\nSome text.", title="Doc", style="pro")
+    before = store.cache.stats()["bytes"]
+
+    job_id = store.ensure(doc_id, "pdf", wait=False)["job_id"]
+    service.wait(job_id)
+
+    meta = store.cache.entries()[doc_id]
+    assert "pdf" in meta["_blobs"] and meta["_sizes"]["pdf"] == len(PDF)
+    assert store.cache.stats()["bytes"] == before + len(PDF)
+    assert store.stats()["rendering"] == 0
+    # Served from the entry from now on
+    output = store.ensure(doc_id, "pdf", wait=False)
+    assert output["size"] == len(PDF) and service.submitted == 1
+
+
+def test_concurrent_requests_share_one_render(store, service):
+    doc_id = store.save("# Title\n\nShared.", title="Doc", style="pro")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.ensure(doc_id, "pdf"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert service.submitted == 1
+    assert len(results) == 4 and all(result["path"] == store.cache.path(doc_id, "pdf") for result in results)
+
+
+def test_pdf_of_evicted_document_is_removed(store, service):
+    doc_id = store.save("# Title\n\nGone soon.", title="Doc", style="pro")
+    job_id = store.ensure(doc_id, "pdf", wait=False)["job_id"]
+    store.cache.delete(doc_id)
+    service.wait(job_id)
+
+    assert not os.path.exists(store.cache.path(doc_id, "pdf"))
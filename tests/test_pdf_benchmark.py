@@ -0,0 +1,43 @@
+from collections import Counter
+
+import pytest
+
+from benchmarks.pdf_backends import build_profile, token_f1
+
+
+def _result(producer, **backends):
+    return {"file": f"{producer}.pdf", "features": {"producer": producer}, "backends": backends}
+
+
+def _run(quality, pages=10, seconds=1.0, empty=False):
+    return {"seconds": seconds, "peak_kb": 100, "pages": pages, "empty_pages": 0,
+            "chars": 0 if empty else 100, "quality": quality, "empty": empty}
+
+
+def test_token_f1():
+    reference = Counter({"a": 2, "b": 1, "c": 1})
+    assert token_f1(reference, reference) == 1.0
+    assert token_f1(Counter(), reference) == 0.0
+    assert token_f1(Counter({"x": 1}), reference) == 0.0
+    # Half the reference recovered, nothing extra
+    assert token_f1(Counter({"a": 2}), reference) == pytest.approx(2 / 3)
+
+
+def test_profile_aggregates_per_backend_and_producer():
+    results = [
+        _result("weasyprint", pymupdf=_run(1.0, seconds=0.5), pypdf=_run(0.8)),
+        _result("latex", pymupdf=_run(0.6, seconds=0.5), pypdf={"error": "boom", "quality": 0.0, "empty": True}),
+        # A scan: nobody found text, so it says nothing about quality
+        _result("scanner", pymupdf=_run(0.0, empty=True), pypdf=_run(0.0, empty=True)),
+    ]
+
+    profile = build_profile(results)
+
+    pymupdf, pypdf = profile["backends"]["pymupdf"], profile["backends"]["pypdf"]
+    assert profile["documents"] == 3
+    assert pymupdf["quality"] == 0.8 and pymupdf["empty_rate"] == 0.0
+    assert pymupdf["sec_per_page"] == round(2.0 / 30, 5)
+    # The failed extraction counts as empty, with no quality
+    assert pypdf["errors"] == 1 and pypdf["quality"] == 0.4 and pypdf["empty_rate"] == 0.5
+    assert profile["producers"]["latex"]["pymupdf"]["quality"] == 0.6
+    assert profile["producers"]["scanner"]["pypdf"]["quality"] == 0.0
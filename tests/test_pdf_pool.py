@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from core import pdf
+
+fitz = pytest.importorskip("fitz")
+
+PAGES = 40
+
+
+@pytest.fixture(scope="module")
+def sample_pdf(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("pdf") / "sample.pdf")
+    doc = fitz.open()
+    for i in range(PAGES):
+        doc.new_page().insert_text((72, 72), f"Page number {i}")
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def _crash_once(filepath, start, end):
+    """Kills its worker the first time it runs (marker file next to the PDF)."""
+    marker = filepath + ".crashed"
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return pdf._range_pymupdf(filepath, start, end)
+
+
+def _page_numbers(pages):
+    return [int(page.split()[-1]) for page in pages]
+
+
+def test_pages_come_out_in_order(sample_pdf):
+    pages = list(pdf.iter_pdf_pages(sample_pdf, backend="pymupdf", workers=2, pages_per_task=4))
+    assert _page_numbers(pages) == list(range(PAGES))
+
+
+def test_worker_count_is_honoured_per_call():
+    assert pdf._get_executor(2) is pdf._get_executor(2)
+    assert pdf._get_executor(3)._max_workers == 3
+    assert pdf._get_executor(2)._max_workers == 2
+
+
+def test_broken_pool_is_replaced_and_ranges_retried(sample_pdf, monkeypatch):
+    monkeypatch.setitem(pdf._EXTRACTORS, "crashy", _crash_once)
+    monkeypatch.setitem(pdf._COUNTERS, "crashy", pdf._count_pymupdf)
+    broken = pdf._get_executor(2)
+
+    pages = list(pdf.iter_pdf_pages(sample_pdf, backend="crashy", workers=2, pages_per_task=4))
+
+    assert _page_numbers(pages) == list(range(PAGES))
+    assert pdf._get_executor(2) is not broken
@@ -0,0 +1,90 @@
+import json
+import os
+import time
+
+import pytest
+
+from core import pdf
+
+PROFILE = {
+    "backends": {
+        # Same text quality, but plain extraction is faster
+        "pymupdf_layout": {"quality": 0.95, "empty_rate": 0.0, "sec_per_page": 0.05},
+        "pymupdf": {"quality": 0.96, "empty_rate": 0.0, "sec_per_page": 0.01},
+        "pypdf": {"quality": 0.80, "empty_rate": 0.0, "sec_per_page": 0.02},
+    },
+}
+FEATURES = {"pages": 10, "has_text": True, "producer": "unknown"}
+
+
+def test_layout_backend_leads_despite_speed(monkeypatch):
+    monkeypatch.setattr(pdf, "available_backends", lambda: ["pymupdf_layout", "pymupdf", "pypdf"])
+    assert pdf.select_backends("x.pdf", FEATURES, PROFILE) == ["pymupdf_layout", "pymupdf", "pypdf"]
+
+
+def test_layout_disabled_ranks_by_profile(monkeypatch):
+    monkeypatch.setenv("PDF_LAYOUT", "0")
+    monkeypatch.setattr(pdf.importlib, "import_module", lambda name: None)
+    assert pdf.select_backends("x.pdf", FEATURES, PROFILE) == ["pymupdf", "pypdf", "pdfplumber"]
+
+
+def test_no_text_layer_prefers_cheapest(monkeypatch):
+    monkeypatch.setattr(pdf, "available_backends", lambda: ["pymupdf_layout", "pymupdf", "pypdf"])
+    features = dict(FEATURES, has_text=False)
+    assert pdf.select_backends("x.pdf", features, PROFILE) == ["pymupdf", "pypdf", "pymupdf_layout"]
+
+
+def test_quality_band_then_speed(monkeypatch):
+    monkeypatch.setattr(pdf, "available_backends", lambda: ["pymupdf", "pypdf", "pdfplumber"])
+    profile = {"backends": {
+        "pymupdf": {"quality": 0.70, "empty_rate": 0.0, "sec_per_page": 0.01},
+        # Within one band of each other: the faster goes first
+        "pypdf": {"quality": 0.92, "empty_rate": 0.0, "sec_per_page": 0.04},
+        "pdfplumber": {"quality": 0.93, "empty_rate": 0.0, "sec_per_page": 0.02},
+    }}
+    assert pdf.select_backends("x.pdf", FEATURES, profile) == ["pdfplumber", "pypdf", "pymupdf"]
+
+    # Pages that come out empty count against quality
+    profile["backends"]["pdfplumber"]["empty_rate"] = 0.5
+    assert pdf.select_backends("x.pdf", FEATURES, profile) == ["pypdf", "pymupdf", "pdfplumber"]
+
+
+def test_producer_measurements_override_corpus_wide(monkeypatch):
+    monkeypatch.setattr(pdf, "available_backends", lambda: ["pymupdf", "pypdf"])
+    profile = dict(PROFILE, producers={
+        "latex": {"pymupdf": {"quality": 0.50, "empty_rate": 0.0, "sec_per_page": 0.01}},
+    })
+    assert pdf.select_backends("x.pdf", FEATURES, profile) == ["pymupdf", "pypdf"]
+    assert pdf.select_backends("x.pdf", dict(FEATURES, producer="latex"), profile) == ["pypdf", "pymupdf"]
+
+
+def test_profile_is_reloaded_when_it_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf, "_profile", None)
+    monkeypatch.setattr(pdf, "_profile_mtime", None)
+    path = tmp_path / "profile.json"
+    assert pdf.load_profile(str(path)) is None
+
+    path.write_text(json.dumps({"documents": 1}))
+    assert pdf.load_profile(str(path)) == {"documents": 1}
+
+    path.write_text(json.dumps({"documents": 2}))
+    os.utime(path, (time.time() + 10, time.time() + 10))
+    assert pdf.load_profile(str(path)) == {"documents": 2}
+
+
+def test_features_sample_the_first_pages(tmp_path):
+    fitz = pytest.importorskip("fitz")
+    path = str(tmp_path / "doc.pdf")
+    doc = fitz.open()
+    for i in range(5):
+        page = doc.new_page()
+        if i == 4:
+            page.insert_text((72, 72), "text after the sampled pages")
+    doc.set_metadata({"producer": "WeasyPrint 60.1"})
+    doc.save(path)
+    doc.close()
+
+    features = pdf.pdf_features(path)
+
+    assert features["pages"] == 5 and features["producer"] == "weasyprint"
+    assert features["has_text"] is False and not features["encrypted"]
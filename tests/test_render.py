@@ -0,0 +1,78 @@
+import os
+import time
+
+import pytest
+
+from core import render
+from core.render import PdfRenderService, RenderQueueFull
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+
+
+# Worker tasks (module level, so spawned workers can import them)
+
+def _sleep_task(seconds, output_path):
+    time.sleep(seconds)
+    return {"pages": 1, "seconds": seconds, "path": output_path}
+
+
+def _wait_for_file_task(marker, output_path):
+    deadline = time.monotonic() + 30
+    while not os.path.exists(marker) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return {"pages": 2, "seconds": 0.0, "path": output_path}
+
+
+def _wait_until(predicate, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out waiting"
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(render, "WATCHDOG_INTERVAL", 0.05)
+    service = PdfRenderService(workers=2, queue_size=2, timeout=2.0, template_dir=TEMPLATE_DIR)
+    yield service
+    if service._executor is not None:
+        service._restart_pool(service._executor)
+
+
+def test_timeout_stops_the_render_and_resubmits_the_others(service, tmp_path):
+    marker = str(tmp_path / "release")
+    finished = []
+    slow = service._submit(_sleep_task, (60, str(tmp_path / "slow.pdf")), str(tmp_path / "slow.pdf"), 0)
+    _wait_until(lambda: service.status(slow)["status"] == "running")
+    time.sleep(0.5)
+    # Running in the same pool when the slow render's workers are stopped
+    other = service._submit(_wait_for_file_task, (marker, str(tmp_path / "other.pdf")),
+                            str(tmp_path / "other.pdf"), 0, on_done=finished.append)
+
+    assert service.wait(slow, timeout=30)["status"] == "timeout"
+    open(marker, "w").close()
+    status = service.wait(other, timeout=30)
+
+    assert status["status"] == "done" and status["pages"] == 2
+    assert finished == [status]
+    stats = service.stats()
+    assert stats["timeouts"] == 1 and stats["resubmitted"] == 1 and stats["pool_restarts"] >= 1
+    assert stats["completed"] == 1 and stats["in_flight"] == 0
+
+
+def test_full_queue_rejects_until_a_slot_frees(tmp_path, monkeypatch):
+    monkeypatch.setattr(render, "WATCHDOG_INTERVAL", 0.05)
+    service = PdfRenderService(workers=1, queue_size=0, timeout=30, template_dir=TEMPLATE_DIR)
+    try:
+        first = service._submit(_sleep_task, (0.2, str(tmp_path / "a.pdf")), str(tmp_path / "a.pdf"), 0)
+        with pytest.raises(RenderQueueFull):
+            service._submit(_sleep_task, (0, str(tmp_path / "b.pdf")), str(tmp_path / "b.pdf"), 0)
+        assert service.stats()["rejected"] == 1
+
+        # Waiting for a slot succeeds once the first render finishes
+        second = service._submit(_sleep_task, (0, str(tmp_path / "b.pdf")), str(tmp_path / "b.pdf"), 30)
+        assert service.wait(first, timeout=30)["status"] == "done"
+        assert service.wait(second, timeout=30)["status"] == "done"
+    finally:
+        if service._executor is not None:
+            service._restart_pool(service._executor)
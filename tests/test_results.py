@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+from core.results import ResultCache, normalize_inputs
+
+
+@pytest.fixture
+def results(tmp_path, monkeypatch):
+    monkeypatch.setenv("CONVERT_CACHE_DIR", str(tmp_path / "results"))
+    monkeypatch.setenv("CONVERT_CACHE_MAX_MB", "16")
+    return ResultCache()
+
+
+def _key(results, source="# Source\n\ntext"):
+    return results.make_key(source, normalize_inputs("pro", "ai_gen", "", ["glossary"]))
+
+
+def test_normalised_options_share_a_key(results):
+    a = results.make_key("src", normalize_inputs(" Pro ", "AI_GEN", "be  brief", ["b", "a", "a "]))
+    b = results.make_key("src", normalize_inputs("pro", "ai_gen", "be brief", ["a", "b"]))
+    assert a == b
+
+
+def test_second_request_is_a_hit(results):
+    key = _key(results)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"markdown": "# Done", "style": "pro", "degraded": []}
+
+    assert results.run(key, compute) == ({"markdown": "# Done", "style": "pro", "degraded": []}, "computed")
+    result, status = results.run(key, compute)
+    assert status == "hit" and result["markdown"] == "# Done"
+    assert len(calls) == 1
+    assert results.run(key, compute, refresh=True)[1] == "computed"
+
+
+def test_degraded_results_are_not_cached(results):
+    key = _key(results)
+    degraded = {"markdown": "# Done ![x](static/placeholder.jpg)", "style": "pro", "degraded": ["images"]}
+    assert results.run(key, lambda: degraded) == (degraded, "computed")
+    assert results.get(key) is None
+    assert results.run(key, lambda: {"markdown": "# Done", "degraded": []})[1] == "computed"
+    assert results.run(key, lambda: {"markdown": "# Other"})[0]["markdown"] == "# Done"
+
+
+def _run_concurrently(results, key, compute, callers=4):
+    outcomes = [None] * callers
+    started = threading.Event()
+
+    def call(i):
+        started.wait()
+        try:
+            outcomes[i] = results.run(key, compute)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    started.set()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+def test_identical_requests_in_flight_are_coalesced(results):
+    key = _key(results)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"markdown": "# Shared", "style": "pro"}
+
+    outcomes = _run_concurrently(results, key, compute)
+
+    assert len(calls) == 1
+    assert sorted(status for _, status in outcomes) == ["coalesced"] * 3 + ["computed"]
+    assert all(result["markdown"] == "# Shared" for result, _ in outcomes)
+    assert results.stats()["coalesced"] == 3
+
+
+def test_error_is_raised_in_every_waiter(results):
+    key = _key(results)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        raise RuntimeError("LLM unavailable")
+
+    outcomes = _run_concurrently(results, key, compute)
+
+    assert len(calls) == 1
+    assert all(isinstance(outcome, RuntimeError) and str(outcome) == "LLM unavailable" for outcome in outcomes)
+    assert results.stats()["in_flight"] == 0
+    # Nothing cached: the next request runs again
+    assert results.run(key, lambda: {"markdown": "# Ok"})[1] == "computed"
+
+
+def test_key_follows_the_models_the_engine_uses(results, monkeypatch):
+    monkeypatch.delenv("OLLAMA_MODEL", raising=False)
+    monkeypatch.delenv("REMOTE_MODEL", raising=False)
+    default = _key(results)
+    monkeypatch.setenv("OLLAMA_MODEL", "llama3.1:8b")
+    monkeypatch.setenv("REMOTE_MODEL", "gpt-4o")
+    assert _key(results) == default  # Same as the engine's defaults
+    monkeypatch.setenv("REMOTE_MODEL", "gpt-4o-mini")
+    assert _key(results) != default
@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+django = pytest.importorskip("django")
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(DEBUG=True, ALLOWED_HOSTS=["*"], USE_TZ=True,
+                       BASE_DIR=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    django.setup()
+
+views = pytest.importorskip("converter.views")
+from django.test import RequestFactory
+
+DATA = bytes(range(256)) * 4  # 1024 bytes
+
+
+@pytest.fixture
+def output(tmp_path, monkeypatch):
+    monkeypatch.delenv("OUTPUT_SENDFILE", raising=False)
+    path = tmp_path / "ab" / "abcdef.pdf"
+    path.parent.mkdir()
+    path.write_bytes(DATA)
+    return str(path), str(tmp_path)
+
+
+def _serve(output, **headers):
+    path, root = output
+    request = RequestFactory().get("/outputs/doc/pdf", **headers)
+    return views._serve_output(request, path, "abcdef", "tutorial_doc.pdf", "application/pdf", root)
+
+
+def _body(response):
+    return b"".join(response.streaming_content) if response.streaming else response.content
+
+
+def test_full_response_has_validators(output):
+    response = _serve(output)
+
+    assert response.status_code == 200
+    assert _body(response) == DATA
+    assert response["ETag"] == '"abcdef"'
+    assert response["Accept-Ranges"] == "bytes"
+    assert "immutable" in response["Cache-Control"]
+    assert 'filename="tutorial_doc.pdf"' in response["Content-Disposition"]
+
+
+def test_matching_etag_is_not_modified(output):
+    response = _serve(output, HTTP_IF_NONE_MATCH='"other", "abcdef"')
+
+    assert response.status_code == 304
+    assert response["ETag"] == '"abcdef"'
+    assert _serve(output, HTTP_IF_NONE_MATCH='"other"').status_code == 200
+
+
+@pytest.mark.parametrize("header, start, end", [
+    ("bytes=0-99", 0, 99),
+    ("bytes=1000-", 1000, 1023),
+    ("bytes=-24", 1000, 1023),
+    ("bytes=1000-5000", 1000, 1023),
+])
+def test_byte_ranges(output, header, start, end):
+    response = _serve(output, HTTP_RANGE=header)
+
+    assert response.status_code == 206
+    assert response["Content-Range"] == f"bytes {start}-{end}/{len(DATA)}"
+    assert response["Content-Length"] == str(end - start + 1)
+    assert _body(response) == DATA[start:end + 1]
+
+
+def test_unsatisfiable_range(output):
+    response = _serve(output, HTTP_RANGE="bytes=2000-")
+
+    assert response.status_code == 416
+    assert response["Content-Range"] == f"bytes */{len(DATA)}"
+
+
+def test_stale_if_range_sends_the_whole_file(output):
+    response = _serve(output, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"older"')
+    assert response.status_code == 200 and _body(response) == DATA
+
+    response = _serve(output, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"abcdef"')
+    assert response.status_code == 206 and _body(response) == DATA[:10]
+
+
+def test_accel_redirect_hands_the_file_to_the_web_server(output, monkeypatch):
+    monkeypatch.setenv("OUTPUT_SENDFILE", "x-accel-redirect")
+    monkeypatch.setenv("OUTPUT_ACCEL_PREFIX", "/protected/")
+
+    response = _serve(output, HTTP_RANGE="bytes=0-9")
+
+    assert response.status_code == 200 and response.content == b""
+    assert response["X-Accel-Redirect"] == "/protected/ab/abcdef.pdf"
+    assert response["ETag"] == '"abcdef"'
@@ -0,0 +1,71 @@
+import gc
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from core.transport import HttpTransport
+
+BODY = b"x" * 1024
+
+
+class _Server(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Server)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    monkeypatch.setenv("HTTP_MAX_PER_HOST", "1")
+    return HttpTransport()
+
+
+def _slot_free(transport, url):
+    limit = transport._limit_for(transport._host_of(url))
+    if limit.acquire(blocking=False):
+        limit.release()
+        return True
+    return False
+
+
+def test_streamed_response_holds_host_slot_until_closed(transport, url):
+    response = transport.get(url, stream=True)
+    assert not _slot_free(transport, url)
+    assert response.content == BODY
+    response.close()
+    assert _slot_free(transport, url)
+    response.close()  # Closing twice releases once
+    assert transport._limit_for(transport._host_of(url))._value == 1
+
+
+def test_context_manager_and_garbage_collection_release_the_slot(transport, url):
+    with transport.get(url, stream=True) as response:
+        assert not _slot_free(transport, url)
+    assert _slot_free(transport, url)
+
+    response = transport.get(url, stream=True)
+    del response
+    gc.collect()
+    assert _slot_free(transport, url)
+
+
+def test_buffered_response_releases_slot_immediately(transport, url):
+    response = transport.get(url)
+    assert _slot_free(transport, url)
+    assert response.content == BODY
@@ -0,0 +1,122 @@
+import pytest
+
+from database import vector_store
+from database.vector_store import VectorDB
+
+from conftest import FakeClient
+
+
+def test_add_documents_is_written_in_batches(client, monkeypatch):
+    monkeypatch.setenv("CHROMA_WRITE_BATCH_SIZE", "3")
+    db = VectorDB("test")
+    db.add_documents([f"doc {i}" for i in range(7)], [{"i": i} for i in range(7)], [str(i) for i in range(7)])
+
+    collection = client.collections["test"]
+    assert [call for call in collection.calls if call[0] == "add"] == [("add", 3), ("add", 3), ("add", 1)]
+    assert len(collection.records) == 7
+
+
+def test_write_batches_respect_server_limit(monkeypatch):
+    monkeypatch.setenv("CHROMA_WRITE_BATCH_SIZE", "500")
+    vector_store.set_client(FakeClient(max_batch_size=4))
+    try:
+        assert VectorDB("test").write_batch_size == 4
+    finally:
+        vector_store.set_client(None)
+
+
+def test_query_batch_is_one_round_trip(client):
+    db = VectorDB("test")
+    db.add_documents(["python packaging guide", "baking bread at home", "python testing tips"],
+                     [{"type": "doc"}, {"type": "doc"}, {"type": "other"}], ["a", "b", "c"])
+
+    results = db.query_batch(["python packaging", "bread"], n_results=2, where={"type": "doc"})
+
+    assert client.collections["test"].count_calls("query") == 1
+    assert [hit["id"] for hit in results[0]] == ["a", "b"]
+    assert results[1][0]["content"] == "baking bread at home"
+    assert results[1][0]["distance"] == 0.5
+
+
+def test_delete_by_ids_and_filter(client):
+    db = VectorDB("test")
+    db.add_documents(["one", "two", "three"], [{"source": "x"}, {"source": "y"}, {"source": "x"}],
+                     ["1", "2", "3"])
+
+    db.delete_documents(where={"source": "x"})
+    assert [record["id"] for record in db.get_documents()] == ["2"]
+    db.delete_documents(ids=["2"])
+    assert db.get_documents() == []
+    # Neither ids nor a filter: nothing is sent
+    calls = len(client.collections["test"].calls)
+    db.delete_documents()
+    assert len(client.collections["test"].calls) == calls
+
+
+@pytest.fixture
+def indexer(client, tmp_path, monkeypatch):
+    from core.indexer import DocumentIndexer
+    monkeypatch.setenv("RAG_INDEX_BATCH_SIZE", "2")
+    return DocumentIndexer(rag_folder=str(tmp_path / "rag"))
+
+
+def _text(topic, words=250):
+    return " ".join(f"{topic}{i}" for i in range(words))
+
+
+def test_indexer_batches_queries_and_replaces_sources(client, indexer):
+    collection = client.collections["rag_knowledge_base"]
+    text = _text("alpha", 3000)
+    assert indexer.index_text(text, "alpha.md") == ("indexed", None)
+    assert collection.count_calls("add") == 2  # 4 chunks in batches of 2
+    assert len(collection.records) == 4
+    assert indexer.index_text(_text("beta"), "beta.md") == ("indexed", None)
+
+    results = indexer.query_knowledge_batch(["alpha1 alpha2", "beta3"], n_results=1)
+    assert collection.count_calls("query") == 1
+    assert results[0][0]["source"] == "alpha.md"
+    assert results[1][0]["source"] == "beta.md"
+
+    # Served from the query cache until the index changes
+    indexer.query_knowledge_batch(["alpha1 alpha2"], n_results=1)
+    assert collection.count_calls("query") == 1
+
+    assert indexer.index_text(_text("gamma"), "alpha.md") == ("indexed", None)
+    assert {metadata["source"] for _, metadata in collection.records.values()} == {"alpha.md", "beta.md"}
+    assert not any(document.startswith("alpha") for document, _ in collection.records.values())
+    assert indexer.query_knowledge("gamma1", n_results=1)[0]["source"] == "alpha.md"
+    assert collection.count_calls("query") == 2
+
+
+def test_failed_write_leaves_no_phantom_signatures(client, indexer, monkeypatch):
+    collection = client.collections["rag_knowledge_base"]
+    add = collection.add
+
+    def failing_add(**kwargs):
+        raise ConnectionError("Chroma unavailable")
+
+    monkeypatch.setattr(collection, "add", failing_add)
+    assert indexer.index_text(_text("delta", 3000), "delta.md") == ("failed", "Chroma unavailable")
+    assert len(indexer._signature_index()._signatures) == 0
+
+    # Retrying stores the chunks instead of collapsing them into ids that were never written
+    monkeypatch.setattr(collection, "add", add)
+    assert indexer.index_text(_text("delta", 3000), "delta.md") == ("indexed", None)
+    assert len(collection.records) == 4
+
+
+def test_index_changes_in_another_process_invalidate_cached_queries(client, tmp_path):
+    from core.indexer import DocumentIndexer
+    folder = str(tmp_path / "shared")
+    web = DocumentIndexer(rag_folder=folder)
+    watcher = DocumentIndexer(rag_folder=folder)  # Stands in for the watcher process
+    collection = client.collections["rag_knowledge_base"]
+
+    watcher.index_text(_text("old"), "notes.md")
+    assert web.query_knowledge("old1", n_results=1)[0]["content"].startswith("old0")
+    web.query_knowledge("old1", n_results=1)
+    assert collection.count_calls("query") == 1
+
+    watcher.index_text(_text("new"), "notes.md")
+    assert web.query_knowledge("old1", n_results=1)[0]["content"].startswith("new0")
+    assert collection.count_calls("query") == 2
@@ -0,0 +1,70 @@
+import pytest
+
+from core import vision
+from core.cache import DiskCache
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("VISION_PROVIDER", "local")
+    monkeypatch.delenv("STABILITY_API_KEY", raising=False)
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    cache = DiskCache(str(tmp_path / "images"), max_bytes=10**7)
+    monkeypatch.setattr(vision, "_get_image_cache", lambda: cache)
+    client = vision.VisionClient()
+    client.generated = []
+    client.failing = set()
+
+    def generate(workflows):
+        results = []
+        for workflow in workflows:
+            text = workflow["6"]["inputs"]["text"]
+            client.generated.append(text)
+            if text in client.failing:
+                results.append({"prompt_id": "x", "images": [], "error": "OOM"})
+            else:
+                results.append({"prompt_id": "x", "images": [f"png:{text}".encode()], "error": None})
+        return results
+
+    monkeypatch.setattr(client, "_generate_comfy", generate)
+    return client
+
+
+def test_repeated_prompts_are_served_from_the_cache(client):
+    first = client.generate_images(["a cat", "a dog"], style="kids")
+    client.generated.clear()
+
+    second = client.generate_images(["a dog", "a cat"], style="kids")
+
+    assert second == first[::-1]
+    assert client.generated == []
+
+
+def test_duplicate_prompts_in_one_call_are_generated_once(client):
+    images = client.generate_images(["a cat", "a cat", "a dog"])
+
+    assert images[0] == images[1] != images[2]
+    assert len(client.generated) == 2
+
+
+def test_key_covers_style_and_workflow(client, monkeypatch):
+    client.generate_image("a cat", style="kids")
+    client.generate_image("a cat", style="pro")
+    assert len(client.generated) == 2
+
+    # A different seed is a different image
+    build = vision.build_workflow
+    monkeypatch.setattr(vision, "build_workflow", lambda text: build(text, seed=7))
+    client.generate_image("a cat", style="pro")
+    assert len(client.generated) == 3
+
+
+def test_failed_generations_are_not_cached(client):
+    client.failing.add("a cat, kids style")
+
+    assert client.generate_image("a cat", style="kids") == vision.PLACEHOLDER_IMAGE
+    client.failing.clear()
+    image = client.generate_image("a cat", style="kids")
+
+    assert image == b"png:a cat, kids style"
+    assert len(client.generated) == 2
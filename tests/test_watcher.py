@@ -0,0 +1,97 @@
+import os
+import shutil
+from types import SimpleNamespace
+
+import pytest
+
+from core.indexer import DocumentIndexer
+from core.watcher import FolderWatcher, _EventHandler
+
+
+def _write(path, topic):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(" ".join(f"{topic}{i}" for i in range(300)))
+
+
+@pytest.fixture
+def rag(client, tmp_path, monkeypatch):
+    # Relative folder, as with the default RAG_FOLDER
+    monkeypatch.chdir(tmp_path)
+    _write("rag/top.md", "top")
+    _write("rag/guides/a.md", "alpha")
+    _write("rag/guides/b.txt", "beta")
+    indexer = DocumentIndexer(rag_folder="./rag")
+    indexer.index_folder()
+    watcher = FolderWatcher(indexer=indexer, debounce=0, use_polling=True)
+    return SimpleNamespace(indexer=indexer, watcher=watcher, handler=_EventHandler(watcher), root=str(tmp_path))
+
+
+def _apply(watcher):
+    watcher._apply(watcher._due_events())
+
+
+def test_watcher_and_scan_agree_on_file_hashes(rag):
+    rag.watcher.notify(os.path.join(rag.root, "rag", "top.md"), "upsert")
+    _apply(rag.watcher)
+    assert rag.watcher.stats["skipped"] == 1 and rag.watcher.stats["indexed"] == 0
+
+
+def test_moved_directory_is_reindexed_under_its_new_path(rag):
+    shutil.move("rag/guides", "rag/manuals")
+    rag.handler.on_moved(SimpleNamespace(is_directory=True, src_path=os.path.join(rag.root, "rag", "guides"),
+                                         dest_path=os.path.join(rag.root, "rag", "manuals")))
+    _apply(rag.watcher)
+
+    assert sorted(rag.indexer.indexed_sources()) == [os.path.join("manuals", "a.md"),
+                                                      os.path.join("manuals", "b.txt"), "top.md"]
+
+
+def test_deleted_directory_is_purged(rag):
+    shutil.rmtree("rag/guides")
+    rag.handler.on_deleted(SimpleNamespace(is_directory=True, src_path=os.path.join(rag.root, "rag", "guides")))
+    _apply(rag.watcher)
+
+    assert rag.indexer.indexed_sources() == ["top.md"]
+    assert rag.watcher.stats["removed"] == 2
+
+
+def test_concurrent_indexers_merge_their_hashes(rag):
+    # A second process (e.g. the web app) sharing the folder with the watcher
+    web = DocumentIndexer(rag_folder="./rag")
+    _write("rag/web.md", "web")
+    _write("rag/watched.md", "watched")
+    web.index_file(os.path.join("rag", "web.md"))
+    rag.watcher.notify(os.path.join(rag.root, "rag", "watched.md"), "upsert")
+    rag.watcher.notify(os.path.join(rag.root, "rag", "top.md"), "delete")
+    os.remove(os.path.join("rag", "top.md"))
+    _apply(rag.watcher)  # Saves the watcher's view
+    web.save()
+
+    sources = set(DocumentIndexer(rag_folder="./rag").indexed_sources())
+    assert sources == {"web.md", "watched.md", os.path.join("guides", "a.md"), os.path.join("guides", "b.txt")}
+    # Each side also picked up the other's updates
+    assert set(web.indexed_sources()) == sources
+
+
+def test_hashes_from_full_paths_are_migrated(client, tmp_path, monkeypatch):
+    import hashlib
+    monkeypatch.chdir(tmp_path)
+    _write("rag/scanned.md", "scanned")
+    _write("rag/guides/watched.md", "watched")
+
+    def legacy(path):
+        return hashlib.md5(f"{path}:{os.stat(path).st_mtime}".encode()).hexdigest()
+
+    # Bare hash of the path as scanned; sourced hash of the absolute path (watcher)
+    watched = os.path.join("rag", "guides", "watched.md")
+    with open("rag/.indexed_hashes", "w") as f:
+        f.write(f"{legacy(os.path.join('./rag', 'scanned.md'))}\n"
+                f"{legacy(os.path.abspath(watched))}\t{os.path.join('guides', 'watched.md')}")
+
+    indexer = DocumentIndexer(rag_folder="./rag")
+    stats = indexer.index_folder()
+    assert stats["indexed"] == 0 and stats["skipped"] == 2
+    assert set(indexer.indexed_sources()) == {"scanned.md", os.path.join("guides", "watched.md")}
+    with open("rag/.indexed_hashes") as f:
+        assert all("\t" in line for line in f.read().splitlines())